@@ -0,0 +1,85 @@
+import math
+from array import array
+
+from synthetic import lcg
+
+# Samples per FIFO drain, as in main.py
+BLOCK_SIZE = 32
+# Synthetic datasets of the benchmark and the golden outputs: rate (Hz),
+# heart rate (BPM), SpO2 ratio
+SYNTHETIC = (
+    (50, 72.0, 2.5),
+    (100, 60.0, 2.3),
+    (400, 95.0, 2.6),
+    (1000, 120.0, 2.4),
+)
+
+
+class Dataset(object):
+    ''' Raw red/IR sensor samples, interleaved in FIFO order, at a given rate '''
+    def __init__(self, name, fs, raw, hr_bpm=None, ratio=None):
+        # raw: array('l') of n frames (red, IR)
+        # hr_bpm, ratio: what the signal was made with (synthetic), or None
+        self.name = name
+        self.fs = fs
+        self.raw = raw
+        self.n = len(raw) // 2
+        self.hr_bpm = hr_bpm
+        self.ratio = ratio
+        # Derived arrays shared by the benchmark stages (e.g. filtered)
+        self.cache = {}
+
+    def blocks(self):
+        # (offset, n) of the FIFO-sized blocks, in frames
+        result = []
+        for start in range(0, self.n, BLOCK_SIZE):
+            result.append((start, min(BLOCK_SIZE, self.n - start)))
+        return result
+
+
+def synthetic(fs, seconds, hr_bpm=72.0, ratio=2.5, perfusion=0.02, noise=20, seed=1):
+    # Deterministic finger on a MAX30102 (integer noise, no random module):
+    # pulse with sinus arrhythmia (+/-4% at 0.25 Hz), breathing baseline,
+    # red pulse depth `ratio` times the IR one
+    n = int(fs * seconds)
+    raw = array('l', [0] * (2 * n))
+    dc_red = 40000.0
+    dc_ir = 52000.0
+    phase = 0.0
+    for i in range(n):
+        t = i / fs
+        rate = hr_bpm * (1.0 + 0.04 * math.sin(2 * math.pi * 0.25 * t))
+        phase = (phase + rate / 60.0 / fs) % 1.0
+        pulse = (math.exp(-((phase - 0.2) ** 2) / 0.01)
+                 + 0.4 * math.exp(-((phase - 0.55) ** 2) / 0.02))
+        base = 1.0 + 0.005 * math.sin(2 * math.pi * 0.2 * t)
+        seed = lcg(seed)
+        noise_red = (seed >> 16) % (2 * noise + 1) - noise
+        seed = lcg(seed)
+        noise_ir = (seed >> 16) % (2 * noise + 1) - noise
+        raw[2 * i] = int(dc_red * base * (1.0 - ratio * perfusion * pulse)) + noise_red
+        raw[2 * i + 1] = int(dc_ir * base * (1.0 - perfusion * pulse)) + noise_ir
+    return Dataset('synthetic_{}hz'.format(fs), fs, raw, hr_bpm, ratio)
+
+
+def standard(seconds=20, rates=None):
+    # The SYNTHETIC datasets (those at `rates` only, if given)
+    return [synthetic(fs, seconds, hr_bpm, ratio) for fs, hr_bpm, ratio in SYNTHETIC
+            if rates is None or fs in rates]
+
+
+def load_recording(path, fs, name=None):
+    # Recorded raw samples, one 'red,ir' line per frame (lines starting
+    # with '#' are skipped)
+    raw = array('l')
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            red, ir = line.split(',')[:2]
+            raw.append(int(red))
+            raw.append(int(ir))
+    if name is None:
+        name = 'recording_{}hz'.format(fs)
+    return Dataset(name, fs, raw)
@@ -0,0 +1,76 @@
+from hrcalculator import HR_MAX_BPM, HR_MIN_BPM, StreamingPeakDetector, compute_hr
+from running_median import RunningMedian
+from spo2calculator import SpO2Accumulator, compute_spo2
+
+from bench.stages import channel, filtered, window_bounds
+
+# Results are rounded to this many decimals in the golden file, and must
+# match within TOLERANCE
+DECIMALS = 4
+TOLERANCE = 1e-3
+
+
+def _rounded(value):
+    return None if value is None else round(value, DECIMALS)
+
+
+def outputs(dataset, window_seconds=8, hop_seconds=1):
+    # HR and SpO2 at every window end, both ways main.py has computed them:
+    # per window (compute_hr(), compute_spo2()) and streaming (detector and
+    # RR median, SpO2 running sums)
+    fs = dataset.fs
+    window = int(window_seconds * fs)
+    hop = int(hop_seconds * fs)
+    values = filtered(dataset)
+    # Windows are memoryview slices (not copied)
+    ir = memoryview(channel(values, 1, 'f'))
+    red = memoryview(channel(values, 0, 'f'))
+    raw_ir = memoryview(channel(dataset.raw, 1, 'l'))
+    raw_red = memoryview(channel(dataset.raw, 0, 'l'))
+
+    result = {"compute_hr": [], "compute_spo2": [], "stream_hr": [], "stream_spo2": []}
+    for start, end in window_bounds(dataset.n, window, hop):
+        hr = compute_hr(ir[start:end], fs)
+        result["compute_hr"].append(None if hr is None else _rounded(hr[0]))
+        result["compute_spo2"].append(_rounded(compute_spo2(
+            ir[start:end], red[start:end], raw_ir[start:end], raw_red[start:end])))
+
+    detector = StreamingPeakDetector(fs)
+    median = RunningMedian(16)
+    accumulator = SpO2Accumulator(min_samples=40)
+    raw = dataset.raw
+    next_end = hop
+    for start, n in dataset.blocks():
+        detector.process(values[2 * start:2 * (start + n)], n, 1, 2)
+        for i in range(start, start + n):
+            if i >= window:
+                k = 2 * (i - window)
+                accumulator.remove(raw[k], raw[k + 1], values[k], values[k + 1])
+            accumulator.add(raw[2 * i], raw[2 * i + 1], values[2 * i], values[2 * i + 1])
+        while detector.available():
+            rr = detector.pop_beat()[1]
+            if rr is not None and 60.0 / HR_MAX_BPM <= rr <= 60.0 / HR_MIN_BPM:
+                median.push(rr)
+        # Results are due after the block that crosses a hop boundary
+        while next_end <= start + n:
+            rr = median.median()
+            result["stream_hr"].append(None if rr is None else _rounded(60.0 / rr))
+            result["stream_spo2"].append(_rounded(accumulator.value()))
+            next_end += hop
+    return result
+
+
+def compare(expected, actual, tolerance=TOLERANCE):
+    # Differences between two outputs() results, as messages
+    errors = []
+    for key in sorted(expected):
+        a = expected[key]
+        b = actual.get(key, [])
+        if len(a) != len(b):
+            errors.append("{}: {} values instead of {}".format(key, len(b), len(a)))
+            continue
+        for i in range(len(a)):
+            if (a[i] is None) != (b[i] is None) or (
+                    a[i] is not None and abs(a[i] - b[i]) > tolerance):
+                errors.append("{}[{}]: {} instead of {}".format(key, i, b[i], a[i]))
+    return errors
@@ -0,0 +1,199 @@
+"""
+Per-stage benchmark of the main.py pipeline on a PC, with golden HR/SpO2
+outputs and a script for the board:
+
+    python -m bench.run                        # bench/results/<commit>.json
+    python -m bench.run --compare bench/results/<other commit>.json
+    python -m bench.run --golden               # HR/SpO2 unchanged?
+    python -m bench.run --emit-device bench_device.py
+
+The board script needs the lib/ modules on the board, like main.py; its
+results are JSON lines in the same format.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'bench')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+GOLDEN_PATH = os.path.join(BENCH_DIR, 'golden.json')
+
+for _path in (os.path.join(ROOT, 'lib'), ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# The driver imports machine, micropython, utime: host stand-ins (the
+# benchmark keeps its own clock)
+import host
+host.install()
+
+from bench import datasets, golden, stages
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                      stderr=subprocess.DEVNULL)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def select_stages(names):
+    if not names:
+        return stages.STAGES
+    by_name = dict((stage.name, stage) for stage in stages.STAGES)
+    for name in names:
+        if name not in by_name:
+            raise SystemExit('Unknown stage: {} (one of {})'.format(name, ', '.join(sorted(by_name))))
+    return tuple(by_name[name] for name in names)
+
+
+def load_datasets(args):
+    result = datasets.standard(args.seconds, args.rates)
+    for spec in args.recording:
+        path, fs = spec.rsplit(':', 1)
+        result.append(datasets.load_recording(path, float(fs) if '.' in fs else int(fs)))
+    return result
+
+
+def print_result(result):
+    print('{:<20} {:<20} {:>12.0f} {:>8.3%} {:>10.0f} {:>10}'.format(
+        result['stage'], result['dataset'], result['samples_per_s'],
+        result['cpu_load'], result['worst_us'], result['alloc_bytes']))
+
+
+def compare(old, new, threshold):
+    # Prints the changes against an older results file; returns the number
+    # of regressions (throughput down by more than threshold, or more
+    # bytes allocated)
+    previous = dict(((r['stage'], r['dataset']), r) for r in old['results'])
+    regressions = 0
+    print('Against {} ({}):'.format(old.get('commit'), old.get('python')))
+    for result in new['results']:
+        before = previous.get((result['stage'], result['dataset']))
+        if before is None:
+            continue
+        speed = result['samples_per_s'] / before['samples_per_s'] - 1.0
+        flag = ''
+        if speed < -threshold or result['alloc_bytes'] > before['alloc_bytes']:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('{:<20} {:<20} {:>+8.1%} samples/s, worst {:>8.0f} -> {:<8.0f} us, '
+              'alloc {:>7} -> {:<7}{}'.format(
+                  result['stage'], result['dataset'], speed, before['worst_us'],
+                  result['worst_us'], before['alloc_bytes'], result['alloc_bytes'], flag))
+    return regressions
+
+
+def golden_outputs(args):
+    return dict((dataset.name, golden.outputs(dataset, args.window, args.hop))
+                for dataset in datasets.standard(args.seconds))
+
+
+def emit_device_script(path, args):
+    # datasets.py and stages.py in one file (the bench package is not on
+    # the board), then the run
+    parts = ['# Generated by bench/run.py --emit-device: copy it with lib/ to the board and run it.\n'
+             '# One JSON line per stage and dataset.\n']
+    for name in ('datasets.py', 'stages.py'):
+        with open(os.path.join(BENCH_DIR, name)) as f:
+            parts.append(''.join(line for line in f if not line.startswith('from bench')))
+    names = tuple(stage.name for stage in select_stages(args.stages))
+    parts.append(
+        '\n_by_name = dict((stage.name, stage) for stage in STAGES)\n'
+        'run_all(standard({}, {!r}), tuple(_by_name[name] for name in {!r}),\n'
+        '        window_seconds={}, hop_seconds={}, emit=print_json)\n'.format(
+            args.device_seconds, tuple(args.device_rates), names,
+            args.device_window, args.hop))
+    with open(path, 'w') as f:
+        f.write('\n'.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main.py pipeline stage by stage')
+    parser.add_argument('--rates', type=int, nargs='*', default=None,
+                        help='synthetic dataset rates (default: all of 50 100 400 1000)')
+    parser.add_argument('--seconds', type=float, default=20, help='dataset length')
+    parser.add_argument('--window', type=float, default=8, help='analysis window (s)')
+    parser.add_argument('--hop', type=float, default=1, help='time between results (s)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (fastest counts)')
+    parser.add_argument('--stages', nargs='*', default=None, help='stage names (default: all)')
+    parser.add_argument('--recording', action='append', default=[], metavar='PATH:FS',
+                        help="recorded 'red,ir' samples at FS Hz")
+    parser.add_argument('--out', default=None, help='results file (default: bench/results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='older results file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='throughput loss reported as a regression (compare runs on a quiet machine)')
+    parser.add_argument('--golden', action='store_true', help='check the HR/SpO2 golden outputs')
+    parser.add_argument('--update-golden', action='store_true', help='rewrite the golden outputs')
+    parser.add_argument('--emit-device', default=None, metavar='PATH', help='write the board script')
+    parser.add_argument('--device-rates', type=int, nargs='*', default=[50, 100, 400, 1000])
+    parser.add_argument('--device-seconds', type=float, default=3,
+                        help='dataset length on the board (RAM)')
+    parser.add_argument('--device-window', type=float, default=2)
+    args = parser.parse_args()
+
+    if args.emit_device:
+        emit_device_script(args.emit_device, args)
+        print('Board script written to', args.emit_device)
+        return
+
+    if args.golden or args.update_golden:
+        args.seconds = 20
+        outputs = golden_outputs(args)
+        if args.update_golden:
+            with open(GOLDEN_PATH, 'w') as f:
+                json.dump({'window_seconds': args.window, 'hop_seconds': args.hop,
+                           'datasets': outputs}, f, indent=1, sort_keys=True)
+            print('Golden outputs written to', GOLDEN_PATH)
+            return
+        with open(GOLDEN_PATH) as f:
+            expected = json.load(f)['datasets']
+        errors = []
+        for name in sorted(expected):
+            errors.extend('{}: {}'.format(name, e)
+                          for e in golden.compare(expected[name], outputs.get(name, {})))
+        for error in errors:
+            print(error)
+        print('Golden outputs:', 'CHANGED' if errors else 'OK')
+        sys.exit(1 if errors else 0)
+
+    report = {
+        'commit': git_commit(),
+        'python': '{} {}'.format(platform.python_implementation(), platform.python_version()),
+        'machine': platform.machine(),
+        'seconds': args.seconds,
+        'window_seconds': args.window,
+        'hop_seconds': args.hop,
+        'repeat': args.repeat,
+        'results': [],
+    }
+    print('{:<20} {:<20} {:>12} {:>8} {:>10} {:>10}'.format(
+        'stage', 'dataset', 'samples/s', 'load', 'worst us', 'alloc B'))
+    report['results'] = stages.run_all(load_datasets(args), select_stages(args.stages),
+                                       args.window, args.hop, emit=print_result,
+                                       repeat=args.repeat)
+
+    out = args.out
+    if out is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        out = os.path.join(RESULTS_DIR, report['commit'] + '.json')
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('Results written to', out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+import gc
+import json
+import sys
+from array import array
+
+from filter import BandpassFilter, FilterBank
+from hrcalculator import HR_MAX_BPM, HR_MIN_BPM, StreamingPeakDetector, compute_hr
+from max30102 import MAX30102
+from max30102.circular_buffer import CircularBuffer
+from running_median import RunningMedian
+from spo2calculator import SpO2Accumulator, compute_spo2
+from stream import SampleBatch
+
+from bench.datasets import BLOCK_SIZE
+
+# Same module on the board (bench/device.py) and on a PC (bench/run.py):
+# time with ticks_us(), allocations with gc.mem_alloc() on the board, with
+# tracemalloc on a PC
+MICROPYTHON = sys.implementation.name == 'micropython'
+if MICROPYTHON:
+    from utime import ticks_diff, ticks_us
+else:
+    from machine import I2C
+    import time
+    import tracemalloc
+
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+# Filter settings of main.py
+FC_HP = 0.5
+FC_LP = 8.0
+FILTER_ORDER = 2
+# main.py's pulse width (215us): decode shift of the driver
+PULSE_WIDTH_SHIFT = 2
+
+
+def filtered(dataset):
+    # Raw blocks through main.py's filter bank (warm start, inverted),
+    # interleaved like the raw samples; cached on the dataset
+    result = dataset.cache.get('filtered')
+    if result is None:
+        result = array('f', [0.0] * len(dataset.raw))
+        bank = FilterBank(2, dataset.fs, FC_HP, FC_LP, FILTER_ORDER)
+        src = memoryview(dataset.raw)
+        dst = memoryview(result)
+        for start, n in dataset.blocks():
+            view = src[2 * start:2 * (start + n)]
+            if start == 0:
+                bank.warm_start(view, n, gain=-1)
+            bank.process(view, dst[2 * start:2 * (start + n)], n, gain=-1)
+        dataset.cache['filtered'] = result
+    return result
+
+
+def channel(values, ch, typecode):
+    # One channel of interleaved (red, IR) values as its own array
+    n = len(values) // 2
+    out = array(typecode, [0] * n)
+    for i in range(n):
+        out[i] = values[2 * i + ch]
+    return out
+
+
+def window_bounds(n, window, hop):
+    # (start, end) of the windows main.py analyses: one every hop frames,
+    # the first ones shorter until window frames have come in
+    result = []
+    for end in range(hop, n + 1, hop):
+        result.append((max(0, end - window), end))
+    return result
+
+
+class Stage(object):
+    ''' One pipeline stage: setup() prepares its inputs (not timed), call(i) runs unit of work i (timed) '''
+    name = None
+    # True: one call per window end (latency of a result), False: one
+    # call per FIFO block
+    per_window = False
+
+    def setup(self, dataset, window, hop):
+        self.dataset = dataset
+        if self.per_window:
+            self.units = window_bounds(dataset.n, window, hop)
+            self.samples = len(self.units) * hop
+        else:
+            self.units = dataset.blocks()
+            self.samples = dataset.n
+        self.calls = len(self.units)
+
+    def call(self, i):
+        raise NotImplementedError
+
+
+class CheckDecodeStage(Stage):
+    ''' MAX30102.check() without the I2C transfer: burst bytes to sample arrays '''
+    name = 'check_decode'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        # No bus needed, but on a PC the driver's __del__ shuts the sensor
+        # down: there, give it the simulated one
+        sensor = MAX30102(i2c=None if MICROPYTHON else I2C(1))
+        sensor._active_leds = 2
+        sensor._multi_led_read_mode = 6
+        sensor._pulse_width = PULSE_WIDTH_SHIFT
+        self.sensor = sensor
+        # FIFO bursts of the dataset, one buffer per block
+        raw = dataset.raw
+        self.bursts = []
+        for start, n in self.units:
+            burst = bytearray(6 * n)
+            for k in range(2 * n):
+                code = raw[2 * start + k] << PULSE_WIDTH_SHIFT
+                burst[3 * k] = (code >> 16) & 0xFF
+                burst[3 * k + 1] = (code >> 8) & 0xFF
+                burst[3 * k + 2] = code & 0xFF
+            self.bursts.append(burst)
+
+    def call(self, i):
+        self.sensor._fifo_buf = self.bursts[i]
+        self.sensor.decode_fifo(self.units[i][1])
+
+
+class CircularBufferStage(Stage):
+    ''' Storage rings: a block pushed per channel, then popped interleaved '''
+    name = 'circular_buffer'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.red = CircularBuffer(64)
+        self.ir = CircularBuffer(64)
+        red = memoryview(channel(dataset.raw, 0, 'l'))
+        ir = memoryview(channel(dataset.raw, 1, 'l'))
+        self.views = [(red[start:start + n], ir[start:start + n]) for start, n in self.units]
+        self.dest = array('l', [0] * (2 * BLOCK_SIZE))
+
+    def call(self, i):
+        red, ir = self.views[i]
+        n = self.units[i][1]
+        self.red.extend_from(red, n)
+        self.ir.extend_from(ir, n)
+        self.red.pop_into(self.dest, n, 0, 2)
+        self.ir.pop_into(self.dest, n, 1, 2)
+
+
+class BandpassStepStage(Stage):
+    ''' First-order BandpassFilter.step(), one call per sample and channel '''
+    name = 'bandpass_step'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.red = BandpassFilter(dataset.fs, FC_HP, FC_LP)
+        self.ir = BandpassFilter(dataset.fs, FC_HP, FC_LP)
+        self.dest = array('f', [0.0] * (2 * BLOCK_SIZE))
+
+    def call(self, i):
+        raw = self.dataset.raw
+        dest = self.dest
+        red = self.red
+        ir = self.ir
+        start, n = self.units[i]
+        j = 0
+        for k in range(2 * start, 2 * (start + n), 2):
+            dest[j] = red.step(raw[k] * -1)
+            dest[j + 1] = ir.step(raw[k + 1] * -1)
+            j += 2
+
+
+class BandpassProcessStage(Stage):
+    ''' First-order BandpassFilter.process(), one call per block and channel (against bandpass_step) '''
+    name = 'bandpass_process'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.red = BandpassFilter(dataset.fs, FC_HP, FC_LP)
+        self.ir = BandpassFilter(dataset.fs, FC_HP, FC_LP)
+        red = memoryview(channel(dataset.raw, 0, 'l'))
+        ir = memoryview(channel(dataset.raw, 1, 'l'))
+        self.views = [(red[start:start + n], ir[start:start + n]) for start, n in self.units]
+        self.red_dest = array('f', [0.0] * BLOCK_SIZE)
+        self.ir_dest = array('f', [0.0] * BLOCK_SIZE)
+
+    def call(self, i):
+        red, ir = self.views[i]
+        n = self.units[i][1]
+        self.red.process(red, self.red_dest, n, gain=-1)
+        self.ir.process(ir, self.ir_dest, n, gain=-1)
+
+
+class FilterBankStage(Stage):
+    ''' Butterworth FilterBank.process() over interleaved blocks (main.py) '''
+    name = 'filterbank_process'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.bank = FilterBank(2, dataset.fs, FC_HP, FC_LP, FILTER_ORDER)
+        raw = memoryview(dataset.raw)
+        self.views = [raw[2 * start:2 * (start + n)] for start, n in self.units]
+        self.bank.warm_start(self.views[0], self.units[0][1], gain=-1)
+        self.dest = array('f', [0.0] * (2 * BLOCK_SIZE))
+
+    def call(self, i):
+        self.bank.process(self.views[i], self.dest, self.units[i][1], gain=-1)
+
+
+class StreamingHRStage(Stage):
+    ''' StreamingPeakDetector on the filtered IR blocks, RR intervals into a RunningMedian (main.py) '''
+    name = 'streaming_hr'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.detector = StreamingPeakDetector(dataset.fs)
+        self.median = RunningMedian(16)
+        values = memoryview(filtered(dataset))
+        self.views = [values[2 * start:2 * (start + n)] for start, n in self.units]
+
+    def call(self, i):
+        detector = self.detector
+        detector.process(self.views[i], self.units[i][1], 1, 2)
+        while detector.available():
+            rr = detector.pop_beat()[1]
+            if rr is not None and 60.0 / HR_MAX_BPM <= rr <= 60.0 / HR_MIN_BPM:
+                self.median.push(rr)
+
+
+class ComputeHRStage(Stage):
+    ''' compute_hr() on the filtered IR window, at every window end '''
+    name = 'compute_hr'
+    per_window = True
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        ir = memoryview(channel(filtered(dataset), 1, 'f'))
+        self.views = [ir[start:end] for start, end in self.units]
+
+    def call(self, i):
+        compute_hr(self.views[i], self.dataset.fs)
+
+
+class ComputeSpO2Stage(Stage):
+    ''' compute_spo2() on the filtered and raw windows, at every window end '''
+    name = 'compute_spo2'
+    per_window = True
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        values = filtered(dataset)
+        buffers = (memoryview(channel(values, 1, 'f')), memoryview(channel(values, 0, 'f')),
+                   memoryview(channel(dataset.raw, 1, 'l')), memoryview(channel(dataset.raw, 0, 'l')))
+        self.views = [[b[start:end] for b in buffers] for start, end in self.units]
+
+    def call(self, i):
+        ir, red, raw_ir, raw_red = self.views[i]
+        compute_spo2(ir, red, raw_ir, raw_red)
+
+
+class SpO2AccumulatorStage(Stage):
+    ''' SpO2Accumulator: blocks in, frames leaving the window out, value() per block (main.py) '''
+    name = 'spo2_accumulator'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.accumulator = SpO2Accumulator(min_samples=40)
+        raw = memoryview(dataset.raw)
+        values = memoryview(filtered(dataset))
+        self.work = []
+        for start, n in self.units:
+            # Frames pushed out of the window by this block
+            ev_start = max(0, start - window)
+            ev_n = max(0, start + n - window) - ev_start
+            self.work.append((raw[2 * start:2 * (start + n)], values[2 * start:2 * (start + n)],
+                              raw[2 * ev_start:2 * (ev_start + ev_n)],
+                              values[2 * ev_start:2 * (ev_start + ev_n)], ev_n))
+
+    def call(self, i):
+        raw, values, ev_raw, ev_values, ev_n = self.work[i]
+        accumulator = self.accumulator
+        if ev_n:
+            accumulator.remove_block(ev_raw, ev_values, ev_n, 2)
+        accumulator.add_block(raw, values, self.units[i][1], 2)
+        accumulator.value()
+
+
+class LineFormatStage(Stage):
+    ''' main.py's stream lines of each block, written into the sample batch, cleared (sent) every 15 lines '''
+    name = 'line_format'
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        self.values = memoryview(filtered(dataset))
+        self.batch = SampleBatch(15 + BLOCK_SIZE)
+
+    def call(self, i):
+        start, n = self.units[i]
+        batch = self.batch
+        batch.add_block(self.values[2 * start:2 * (start + n)], n, start + 1)
+        if len(batch) >= 15:
+            batch.view()
+            batch.clear()
+
+
+class JsonPacketStage(Stage):
+    ''' main.py's result packet: dict, json.dumps() and encoding, at every window end '''
+    name = 'json_packet'
+    per_window = True
+
+    def setup(self, dataset, window, hop):
+        Stage.setup(self, dataset, window, hop)
+        # Typical contents: 8 beats in the window, both HRV horizons
+        self.peaks = [int(dataset.fs * (0.4 + 0.83 * k)) for k in range(8)]
+        self.hrv = {"n": 40, "mean_hr": 72.31, "sdnn_ms": 41.7, "rmssd_ms": 35.2, "pnn50": 12.5}
+
+    def call(self, i):
+        start, end = self.units[i]
+        packet = {
+            "type": "result",
+            "window_id": i + 1,
+            "window_end_sample_id": end,
+            "window_start_sample_id": start + 1,
+            "acq_freq": self.dataset.fs,
+            "lost_samples": 0,
+            "lost_samples_total": 0,
+            "hr": {"value": 72.0, "peaks_index": self.peaks},
+            "hrv": {"60s": self.hrv, "300s": self.hrv},
+            "spo2": 97.5,
+            "body_temp": 36.6,
+            "body_temp_age_ms": 1250,
+            "die_temp": 31.25,
+        }
+        (json.dumps(packet) + "\n").encode("utf-8")
+
+
+STAGES = (CheckDecodeStage, CircularBufferStage, BandpassStepStage, BandpassProcessStage, FilterBankStage,
+          StreamingHRStage, ComputeHRStage, ComputeSpO2Stage, SpO2AccumulatorStage,
+          LineFormatStage, JsonPacketStage)
+
+
+def _alloc_start():
+    gc.collect()
+    if MICROPYTHON:
+        # No collection during the run: the heap only grows
+        gc.disable()
+        return gc.mem_alloc()
+    tracemalloc.start()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _alloc_stop(start):
+    if MICROPYTHON:
+        allocated = gc.mem_alloc() - start
+        gc.enable()
+        return allocated
+    # Peak above the start: short-lived objects freed at once (e.g. boxed
+    # floats) are not seen on a PC
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - start
+
+
+def run_stage(stage_class, dataset, window_seconds=8, hop_seconds=1, repeat=3):
+    # `repeat` timed runs from a fresh setup, the fastest one counts (the
+    # others were disturbed), then one with the allocation meter (tracemalloc
+    # would distort the timing). Returns a result dict.
+    window = int(window_seconds * dataset.fs)
+    hop = int(hop_seconds * dataset.fs)
+    total = None
+    worst = None
+    for _ in range(repeat):
+        stage = stage_class()
+        stage.setup(dataset, window, hop)
+        run_total = 0
+        run_worst = 0
+        for i in range(stage.calls):
+            t0 = ticks_us()
+            stage.call(i)
+            dt = ticks_diff(ticks_us(), t0)
+            run_total += dt
+            if dt > run_worst:
+                run_worst = dt
+        if total is None or run_total < total:
+            total = run_total
+        if worst is None or run_worst < worst:
+            worst = run_worst
+
+    stage = stage_class()
+    stage.setup(dataset, window, hop)
+    start = _alloc_start()
+    for i in range(stage.calls):
+        stage.call(i)
+    allocated = _alloc_stop(start)
+    dataset.cache.clear()
+
+    samples_per_s = stage.samples * 1000000.0 / total if total else None
+    return {
+        "stage": stage_class.name,
+        "dataset": dataset.name,
+        "fs": dataset.fs,
+        "samples": stage.samples,
+        "calls": stage.calls,
+        "samples_per_s": samples_per_s,
+        # Fraction of real time spent in the stage at this rate
+        "cpu_load": dataset.fs / samples_per_s if samples_per_s else None,
+        "mean_us": total / stage.calls if stage.calls else None,
+        "worst_us": worst,
+        "alloc_bytes": allocated,
+        "alloc_method": "mem_alloc" if MICROPYTHON else "tracemalloc_peak",
+    }
+
+
+def run_all(datasets, stages=STAGES, window_seconds=8, hop_seconds=1, emit=None, repeat=3):
+    # Runs every stage on every dataset; emit(result) is called as results
+    # come in (e.g. to print them on the board)
+    results = []
+    for dataset in datasets:
+        for stage_class in stages:
+            result = run_stage(stage_class, dataset, window_seconds, hop_seconds, repeat)
+            results.append(result)
+            if emit is not None:
+                emit(result)
+    return results
+
+
+def print_json(result):
+    print(json.dumps(result))
@@ -0,0 +1,43 @@
+import json
+
+import host
+host.install()
+
+from bench import datasets, golden
+from bench.run import GOLDEN_PATH
+from bench.stages import STAGES, run_stage
+
+# The HR/SpO2 outputs of the pipeline must match bench/golden.json (rewrite
+# it with python -m bench.run --update-golden when a change is intended),
+# and every benchmark stage must run.
+# Runs on a PC: PYTHONPATH=.:lib python bench/test/golden_test.py
+
+with open(GOLDEN_PATH) as f:
+    golden_file = json.load(f)
+
+print("Golden outputs...")
+for dataset in datasets.standard(20, (50, 100)):
+    expected = golden_file["datasets"][dataset.name]
+    actual = golden.outputs(dataset, golden_file["window_seconds"], golden_file["hop_seconds"])
+    errors = golden.compare(expected, actual)
+    assert not errors, errors[:5]
+
+    # Both ways of computing agree with the synthetic finger, once the
+    # window is full (the streaming window ends with its FIFO block, up to 31
+    # samples later)
+    settled = int(golden_file["window_seconds"])
+    for key in ("compute_hr", "stream_hr"):
+        for value in actual[key][settled:]:
+            assert abs(value - dataset.hr_bpm) < 3.0, (dataset.name, key, value)
+    for a, b in zip(actual["compute_spo2"][settled:], actual["stream_spo2"][settled:]):
+        assert abs(a - b) < 0.5, (dataset.name, a, b)
+
+print("Stages...")
+dataset = datasets.synthetic(50, 4)
+for stage_class in STAGES:
+    result = run_stage(stage_class, dataset, window_seconds=2, hop_seconds=1, repeat=1)
+    assert result["calls"] > 0 and result["samples"] > 0, result
+    assert result["samples_per_s"] > 0
+    assert result["alloc_bytes"] >= 0
+
+print("Golden test OK.")
@@ -0,0 +1,63 @@
+"""
+Host (CPython) stand-ins for the MicroPython modules the firmware imports,
+and a simulated board: a virtual clock, an I2C bus that counts its
+transactions and bytes, and register-level models of the MAX30102 and
+MAX30205. The driver and main.py run on it unmodified.
+
+    import host
+    board = host.install()          # machine, utime, ... -> host shims
+    from max30102 import MAX30102   # lib/ on sys.path
+
+See host/run_main.py to run main.py for a given simulated time.
+"""
+import os
+import sys
+
+# The library modules import their siblings directly (/lib is on the device
+# path), and the host models share lib/synthetic.py with the tests
+LIB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lib')
+if LIB_PATH not in sys.path:
+    sys.path.append(LIB_PATH)
+
+from host.board import Board, SimulationEnd, current_board, set_board
+
+# MicroPython module name -> shim module
+MICROPYTHON_MODULES = (
+    ('machine', 'host.machine'),
+    ('utime', 'host.utime'),
+    ('micropython', 'host.micropython'),
+    ('ucollections', 'host.ucollections'),
+    ('ustruct', 'host.ustruct'),
+    ('network', 'host.network'),
+    ('socket', 'host.socket'),
+)
+
+_saved_modules = {}
+
+
+def install(board=None):
+    """
+    Register the shims under the MicroPython names in sys.modules (socket
+    included: the stdlib one is shadowed until uninstall()) and make board
+    (a new Board with the default devices if None) the current one.
+    Returns the board.
+    """
+    if board is None:
+        board = Board.with_default_devices()
+    set_board(board)
+    for name, shim in MICROPYTHON_MODULES:
+        if name not in _saved_modules:
+            _saved_modules[name] = sys.modules.get(name)
+        __import__(shim)
+        sys.modules[name] = sys.modules[shim]
+    return board
+
+
+def uninstall():
+    """Restore the modules replaced by install()"""
+    for name, module in _saved_modules.items():
+        if module is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = module
+    _saved_modules.clear()
@@ -0,0 +1,157 @@
+import time
+
+from host.i2c import I2CBus
+
+
+class SimulationEnd(BaseException):
+    ''' Raised by the clock at the deadline set with Board.run_for(), through any `except Exception` of the firmware '''
+    pass
+
+
+class PinLine(object):
+    ''' Level of one GPIO, driven by a simulated device, and the IRQ handler attached to it '''
+    def __init__(self, pin_id):
+        self.pin_id = pin_id
+        # Pull-up: idle high
+        self.level = 1
+        self.handler = None
+        self.trigger = 0
+        # machine.Pin object handed to the handler
+        self.pin = None
+        self.irq_count = 0
+
+
+class Board(object):
+    ''' Virtual clock, I2C bus, GPIO lines and scheduler queue shared by the host shims '''
+    # micropython.schedule() queue depth (MICROPY_SCHEDULER_DEPTH)
+    SCHEDULE_DEPTH = 8
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, cpu_scale=0.0, start_us=0):
+        # cpu_scale: host CPU time spent by the firmware between two shim
+        #            calls is charged to the virtual clock times this factor
+        #            (0: only the bus and sleeps take time, deterministic)
+        # start_us: initial clock, e.g. close to the ticks wrap-around
+        self.now_us = float(start_us)
+        self.deadline_us = None
+        self.cpu_scale = cpu_scale
+        self._cpu_mark = time.perf_counter()
+        self.bus = I2CBus(self)
+        self.devices = []
+        self.lines = {}
+        # TCP connections accepted by the socket shim
+        self.connections = []
+        # Wi-Fi state seen by the network shim
+        self.wifi_connected = True
+        self._scheduled = []
+        self._in_scheduled = False
+        # Convenience handles of with_default_devices()
+        self.sensor = None
+        self.thermometer = None
+
+    @classmethod
+    def with_default_devices(cls, ppg=None, temperature_c=36.6, int_pin=None, **kwargs):
+        # MAX30102 (0x57) and MAX30205 (0x48) on the bus; int_pin: GPIO the
+        # MAX30102 INT line is wired to (None: not wired)
+        from host.max30102_model import MAX30102Model
+        from host.max30205_model import MAX30205Model
+        board = cls(**kwargs)
+        board.sensor = MAX30102Model(board, ppg=ppg, int_pin=int_pin)
+        board.thermometer = MAX30205Model(board, temperature_c=temperature_c)
+        board.attach(MAX30102Model.ADDRESS, board.sensor)
+        board.attach(MAX30205Model.ADDRESS, board.thermometer)
+        return board
+
+    def attach(self, address, device):
+        self.bus.attach(address, device)
+        self.devices.append(device)
+
+    # Clock
+    def run_for(self, seconds):
+        # The clock raises SimulationEnd once `seconds` more have elapsed
+        self.deadline_us = self.now_us + seconds * 1000000.0
+
+    def advance(self, us):
+        # Time passes: the devices catch up (samples, conversions, INT line)
+        self.now_us += us
+        for device in self.devices:
+            device.sync(self.now_us)
+        self._cpu_mark = time.perf_counter()
+        if self.deadline_us is not None and self.now_us >= self.deadline_us:
+            raise SimulationEnd()
+
+    def sleep(self, us):
+        # Sleeps step by step, from one device event to the next: scheduled
+        # callbacks run as soon as an interrupt queues them, as they do
+        # during a MicroPython sleep
+        end = self.now_us + us
+        while self.now_us < end:
+            step = end
+            for device in self.devices:
+                event = device.next_event_us()
+                if event is not None and event < step:
+                    step = event
+            self.advance(max(step - self.now_us, 0.0))
+            self.run_scheduled()
+
+    def checkpoint(self):
+        # Called by the shims on entry. Charges the firmware CPU time since
+        # the previous call (cpu_scale), then runs the scheduled callbacks,
+        # as MicroPython does between two bytecodes
+        if self.cpu_scale:
+            mark = time.perf_counter()
+            self.advance((mark - self._cpu_mark) * 1000000.0 * self.cpu_scale)
+        self.run_scheduled()
+
+    # micropython.schedule()
+    def schedule(self, func, arg):
+        if len(self._scheduled) >= self.SCHEDULE_DEPTH:
+            raise RuntimeError('schedule queue full')
+        self._scheduled.append((func, arg))
+
+    def run_scheduled(self):
+        # A callback never runs inside another one
+        if self._in_scheduled:
+            return
+        self._in_scheduled = True
+        try:
+            while self._scheduled:
+                func, arg = self._scheduled.pop(0)
+                func(arg)
+        finally:
+            self._in_scheduled = False
+
+    # GPIO
+    def line(self, pin_id):
+        line = self.lines.get(pin_id)
+        if line is None:
+            line = self.lines[pin_id] = PinLine(pin_id)
+        return line
+
+    def drive(self, pin_id, level):
+        # A device sets the level of a line: edges call the IRQ handler at
+        # once (hard IRQ; the driver only schedules work from it)
+        line = self.line(pin_id)
+        if level == line.level:
+            return
+        line.level = level
+        edge = self.IRQ_RISING if level else self.IRQ_FALLING
+        if line.handler is not None and line.trigger & edge:
+            line.irq_count += 1
+            line.handler(line.pin)
+
+
+_board = None
+
+
+def set_board(board):
+    global _board
+    _board = board
+
+
+def current_board():
+    # The board the shims act on (host.install() sets it)
+    if _board is None:
+        raise RuntimeError('No simulated board: call host.install() first')
+    return _board
@@ -0,0 +1,110 @@
+ENODEV = 19
+
+
+class I2CBus(object):
+    ''' Simulated I2C bus: routes transactions to the device models, counts them and charges their time '''
+    def __init__(self, board, freq=400000, overhead_us=50.0):
+        # freq: SCL frequency (machine.I2C(freq=...) sets it)
+        # overhead_us: software cost of one transaction on the device
+        #              (driver call, interpreter), on top of the wire time
+        self.board = board
+        self.freq = freq
+        self.overhead_us = overhead_us
+        self.devices = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        # Totals, and per address: [transactions, bytes written, bytes read]
+        # Written bytes include the address bytes sent by the master
+        self.transactions = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.busy_us = 0.0
+        self.per_address = {}
+
+    def attach(self, address, device):
+        self.devices[address] = device
+
+    def scan(self):
+        self.board.checkpoint()
+        return sorted(self.devices)
+
+    def transfer(self, address, write=None, read=None):
+        # One transaction: START, write bytes (register pointer first), then
+        # a repeated START and len(read) bytes into read, STOP
+        self.board.checkpoint()
+        device = self.devices.get(address)
+        n_written = 0
+        n_read = 0
+        n_starts = 0
+        if write is not None:
+            n_written += 1 + len(write)
+            n_starts += 1
+        if read is not None:
+            n_written += 1
+            n_read = len(read)
+            n_starts += 1
+        if device is None:
+            # Address not acknowledged
+            self._charge(address, 1, 0, 1)
+            raise OSError(ENODEV)
+        if write is not None:
+            device.write(write)
+        if read is not None:
+            device.read_into(read)
+        self._charge(address, n_written, n_read, n_starts)
+
+    def _charge(self, address, n_written, n_read, n_starts):
+        # 9 clocks per byte (ACK), about 2 per START/STOP condition
+        bits = 9 * (n_written + n_read) + 2 * n_starts + 2
+        cost = self.overhead_us + bits * 1000000.0 / self.freq
+        self.transactions += 1
+        self.bytes_written += n_written
+        self.bytes_read += n_read
+        self.busy_us += cost
+        stats = self.per_address.get(address)
+        if stats is None:
+            stats = self.per_address[address] = [0, 0, 0]
+        stats[0] += 1
+        stats[1] += n_written
+        stats[2] += n_read
+        self.board.advance(cost)
+
+
+class RegisterDevice(object):
+    ''' I2C slave with a register pointer: the first byte written selects the register, the pointer auto-increments '''
+    def __init__(self):
+        self.pointer = 0
+
+    def sync(self, now_us):
+        # The clock moved to now_us
+        pass
+
+    def next_event_us(self):
+        # Time of the next change of state on its own (None: none due)
+        return None
+
+    def write(self, data):
+        if not len(data):
+            return
+        reg = data[0]
+        for i in range(1, len(data)):
+            self.write_register(reg, data[i])
+            reg = self.next_register(reg)
+        self.pointer = reg
+
+    def read_into(self, buf):
+        reg = self.pointer
+        for i in range(len(buf)):
+            buf[i] = self.read_register(reg)
+            reg = self.next_register(reg)
+        self.pointer = reg
+
+    def next_register(self, reg):
+        return (reg + 1) & 0xFF
+
+    def read_register(self, reg):
+        raise NotImplementedError
+
+    def write_register(self, reg, value):
+        raise NotImplementedError
@@ -0,0 +1,93 @@
+"""machine for the host: GPIO lines and I2C buses of the simulated board"""
+from host.board import current_board
+
+
+class Pin(object):
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self.pin_id = pin_id
+        self._line = current_board().line(pin_id)
+        if value is not None:
+            self._line.level = 1 if value else 0
+
+    def value(self, level=None):
+        if level is None:
+            return self._line.level
+        self._line.level = 1 if level else 0
+
+    def __call__(self, level=None):
+        return self.value(level)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        line = self._line
+        line.handler = handler
+        line.trigger = trigger if handler is not None else 0
+        line.pin = self
+
+    def __repr__(self):
+        return 'Pin({0})'.format(self.pin_id)
+
+
+class I2C(object):
+    ''' machine.I2C on the bus of the simulated board '''
+    def __init__(self, bus_id=-1, scl=None, sda=None, freq=400000, timeout=50000):
+        self._bus = current_board().bus
+        self._bus.freq = freq
+
+    def scan(self):
+        return self._bus.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        self._bus.transfer(addr, write=buf)
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        buf = bytearray(nbytes)
+        self._bus.transfer(addr, read=buf)
+        return bytes(buf)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self._bus.transfer(addr, read=buf)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self._bus.transfer(addr, write=bytes([memaddr]) + bytes(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        buf = bytearray(nbytes)
+        self._bus.transfer(addr, write=bytes([memaddr]), read=buf)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        self._bus.transfer(addr, write=bytes([memaddr]), read=buf)
+
+
+class SoftI2C(I2C):
+    pass
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def unique_id():
+    return b'\x00\x00\x00\x00\x00\x00'
+
+
+def idle():
+    # Waits for the next interrupt on the device; at most a tick here
+    board = current_board()
+    board.checkpoint()
+    board.sleep(1000)
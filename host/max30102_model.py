@@ -0,0 +1,306 @@
+from array import array
+import math
+
+from host.i2c import RegisterDevice
+from host.ppg import PPGSource
+
+# Registers (datasheet pag. 10)
+INT_STAT_1 = 0x00
+INT_STAT_2 = 0x01
+INT_ENABLE_1 = 0x02
+INT_ENABLE_2 = 0x03
+FIFO_WRITE_PTR = 0x04
+FIFO_OVERFLOW = 0x05
+FIFO_READ_PTR = 0x06
+FIFO_DATA = 0x07
+FIFO_CONFIG = 0x08
+MODE_CONFIG = 0x09
+PARTICLE_CONFIG = 0x0A
+LED1_PULSE_AMP = 0x0C
+MULTI_LED_CONFIG_1 = 0x11
+MULTI_LED_CONFIG_2 = 0x12
+DIE_TEMP_INT = 0x1F
+DIE_TEMP_FRAC = 0x20
+DIE_TEMP_CONFIG = 0x21
+REVISION_ID = 0xFE
+PART_ID = 0xFF
+
+# Interrupt flags
+INT_A_FULL = 0x80
+INT_PPG_RDY = 0x40
+INT_PWR_RDY = 0x01
+INT_DIE_TEMP_RDY = 0x02
+
+FIFO_DEPTH = 32
+SAMPLE_RATES = (50, 100, 200, 400, 800, 1000, 1600, 3200)
+# ADC full scale (nA) and resolution (bits) per pulse width setting
+ADC_RANGES_NA = (2048, 4096, 8192, 16384)
+ADC_BITS = (15, 16, 17, 18)
+# Die temperature conversion time (datasheet pg. 23)
+TEMP_CONVERSION_US = 29000
+
+# Registers changing what (or whether) the sensor samples
+_SAMPLING_REGISTERS = (FIFO_CONFIG, MODE_CONFIG, PARTICLE_CONFIG,
+                       MULTI_LED_CONFIG_1, MULTI_LED_CONFIG_2)
+
+
+class MAX30102Model(RegisterDevice):
+    ''' Register-level MAX30102/MAX30105: 32-sample FIFO, overflow counter, interrupts, die temperature '''
+    ADDRESS = 0x57
+    PART_ID_VALUE = 0x15
+    REVISION_ID_VALUE = 0x03
+
+    def __init__(self, board, ppg=None, int_pin=None, clock_ppm=0.0, die_temp_c=31.25):
+        # ppg: PPGSource feeding the photodiode (default: 72 BPM)
+        # int_pin: GPIO of the INT line on the board (None: not wired)
+        # clock_ppm: error of the sensor oscillator, the sample rate the
+        #            driver measures moves with it
+        RegisterDevice.__init__(self)
+        self.board = board
+        self.ppg = ppg if ppg is not None else PPGSource()
+        self.int_pin = int_pin
+        self.clock_ppm = clock_ppm
+        self.die_temp_c = die_temp_c
+        self.regs = bytearray(256)
+        # 18-bit codes, up to 3 slots per sample
+        self.fifo = array('l', [0] * (FIFO_DEPTH * 3))
+        # Statistics: samples written to the FIFO, read out of it, and
+        # dropped (overwritten with rollover, discarded without)
+        self.samples_produced = 0
+        self.samples_read = 0
+        self.samples_lost = 0
+        self.empty_reads = 0
+        # Drain cost: read transactions starting at FIFO_DATA (bursts), and
+        # those of them right after a read of the FIFO pointers
+        self.fifo_bursts = 0
+        self.fifo_bursts_after_pointers = 0
+        self._last_read = None
+        self._int_level = 1
+        self.power_on_reset()
+        # Power-up: PWR_RDY pulls INT low until INT_STAT_1 is read
+        self.regs[INT_STAT_1] = INT_PWR_RDY
+        self._update_int()
+
+    def power_on_reset(self):
+        # Registers to their power-on state, FIFO empty, sampling stopped
+        for i in range(256):
+            self.regs[i] = 0
+        self.regs[PART_ID] = self.PART_ID_VALUE
+        self.regs[REVISION_ID] = self.REVISION_ID_VALUE
+        self.write_ptr = 0
+        self.read_ptr = 0
+        self.overflow = 0
+        self.count = 0
+        self._byte_i = 0
+        self._slots = ()
+        self._next_us = None
+        self._period_us = None
+        self._temp_done_us = None
+        self._update_int()
+
+    # Configuration decoded from the registers
+    def sample_rate(self):
+        return SAMPLE_RATES[(self.regs[PARTICLE_CONFIG] >> 2) & 0x07]
+
+    def sample_avg(self):
+        return 1 << min((self.regs[FIFO_CONFIG] >> 5) & 0x07, 5)
+
+    def acquisition_frequency(self):
+        # FIFO samples per second, oscillator error included
+        return self.sample_rate() / self.sample_avg() * (1.0 + self.clock_ppm * 1e-6)
+
+    def active_slots(self):
+        # LEDs (1: red, 2: IR, 3: green) of each sample, in FIFO order
+        mode = self.regs[MODE_CONFIG] & 0x07
+        if self.regs[MODE_CONFIG] & 0x80:
+            return ()
+        if mode == 0x02:
+            return (1,)
+        if mode == 0x03:
+            return (1, 2)
+        if mode == 0x07:
+            slots = []
+            for reg, shift in ((MULTI_LED_CONFIG_1, 0), (MULTI_LED_CONFIG_1, 4),
+                               (MULTI_LED_CONFIG_2, 0), (MULTI_LED_CONFIG_2, 4)):
+                device = (self.regs[reg] >> shift) & 0x07
+                if device == 0:
+                    break
+                # Pilot (proximity) slots 4-7 pulse the same LEDs
+                slots.append(device & 0x03 or 1)
+            return tuple(slots)
+        return ()
+
+    def led_current_ma(self, led):
+        # 0.2 mA per step (datasheet pag. 21)
+        return self.regs[LED1_PULSE_AMP + led - 1] * 0.2
+
+    # Time
+    def sync(self, now_us):
+        if self._next_us is not None:
+            while self._next_us <= now_us:
+                self._produce_sample()
+                self._next_us += 1000000.0 / self.acquisition_frequency()
+        if self._temp_done_us is not None and now_us >= self._temp_done_us:
+            self._temp_done_us = None
+            temp = math.floor(self.die_temp_c * 16) / 16.0
+            self.regs[DIE_TEMP_INT] = int(math.floor(temp)) & 0xFF
+            self.regs[DIE_TEMP_FRAC] = int((temp - math.floor(temp)) * 16)
+            self.regs[DIE_TEMP_CONFIG] = 0
+            self.regs[INT_STAT_2] |= INT_DIE_TEMP_RDY
+            self._update_int()
+
+    def next_event_us(self):
+        if self._temp_done_us is not None and (self._next_us is None
+                                               or self._temp_done_us < self._next_us):
+            return self._temp_done_us
+        return self._next_us
+
+    def _reschedule(self):
+        # Sampling starts over one period after it is enabled or its rate
+        # changes, and stops when the sensor is shut down or no LED is active
+        self._slots = self.active_slots()
+        period_us = 1000000.0 / self.acquisition_frequency()
+        if not self._slots:
+            self._next_us = None
+        elif self._next_us is None or period_us != self._period_us:
+            self._next_us = self.board.now_us + period_us
+        self._period_us = period_us
+
+    def _produce_sample(self):
+        # sample_avg conversions at sample_rate, averaged into one FIFO sample
+        ppg = self.ppg
+        slots = self._slots
+        rate = self.sample_rate() * (1.0 + self.clock_ppm * 1e-6)
+        avg = self.sample_avg()
+        adc_range = ADC_RANGES_NA[(self.regs[PARTICLE_CONFIG] >> 5) & 0x03]
+        bits = ADC_BITS[self.regs[PARTICLE_CONFIG] & 0x03]
+        full_scale = (1 << bits) - 1
+        totals = [0.0] * len(slots)
+        for k in range(avg):
+            ppg.step(1.0 / rate)
+            for j in range(len(slots)):
+                totals[j] += ppg.current_na(slots[j], self.led_current_ma(slots[j]))
+        self.samples_produced += 1
+
+        if self.count == FIFO_DEPTH:
+            self.samples_lost += 1
+            self.overflow = min(self.overflow + 1, 0x1F)
+            if not self.regs[FIFO_CONFIG] & 0x10:
+                # No rollover: the FIFO keeps its samples, the new one is lost
+                self.regs[INT_STAT_1] |= INT_PPG_RDY
+                self._update_int()
+                return
+            # Rollover: the oldest sample is overwritten
+            self.read_ptr = (self.read_ptr + 1) % FIFO_DEPTH
+            self.count -= 1
+            self._byte_i = 0
+
+        base = self.write_ptr * 3
+        for j in range(len(slots)):
+            code = int(totals[j] / avg / adc_range * (1 << bits))
+            if code < 0:
+                code = 0
+            elif code > full_scale:
+                code = full_scale
+            # Left-justified in 18 bits whatever the resolution
+            self.fifo[base + j] = code << (18 - bits)
+        self.write_ptr = (self.write_ptr + 1) % FIFO_DEPTH
+        self.count += 1
+        self.regs[INT_STAT_1] |= INT_PPG_RDY
+        if self.count >= FIFO_DEPTH - (self.regs[FIFO_CONFIG] & 0x0F):
+            self.regs[INT_STAT_1] |= INT_A_FULL
+        self._update_int()
+
+    def _update_int(self):
+        # Active-low INT: any enabled flag (PWR_RDY cannot be masked)
+        asserted = ((self.regs[INT_STAT_1] & (self.regs[INT_ENABLE_1] | INT_PWR_RDY))
+                    or (self.regs[INT_STAT_2] & self.regs[INT_ENABLE_2]))
+        level = 0 if asserted else 1
+        if level != self._int_level:
+            self._int_level = level
+            if self.int_pin is not None:
+                self.board.drive(self.int_pin, level)
+
+    # Registers
+    def next_register(self, reg):
+        # Burst reads of FIFO_DATA stay on FIFO_DATA
+        if reg == FIFO_DATA:
+            return reg
+        return (reg + 1) & 0xFF
+
+    def read_into(self, buf):
+        # One read transaction from the register pointer
+        if self.pointer == FIFO_DATA:
+            self.fifo_bursts += 1
+            if self._last_read == FIFO_WRITE_PTR:
+                self.fifo_bursts_after_pointers += 1
+        self._last_read = self.pointer
+        RegisterDevice.read_into(self, buf)
+
+    def read_register(self, reg):
+        if reg == FIFO_DATA:
+            return self._read_fifo_byte()
+        if reg == FIFO_WRITE_PTR:
+            return self.write_ptr
+        if reg == FIFO_OVERFLOW:
+            return self.overflow
+        if reg == FIFO_READ_PTR:
+            return self.read_ptr
+        value = self.regs[reg]
+        if reg == INT_STAT_1:
+            self.regs[INT_STAT_1] = 0
+            self._update_int()
+        elif reg == INT_STAT_2 or reg == DIE_TEMP_FRAC:
+            self.regs[INT_STAT_2] &= ~INT_DIE_TEMP_RDY & 0xFF
+            self._update_int()
+        return value
+
+    def _read_fifo_byte(self):
+        slots = len(self._slots) or 1
+        if self.count == 0:
+            self.empty_reads += 1
+            return 0
+        code = self.fifo[self.read_ptr * 3 + self._byte_i // 3]
+        shift = 16 - 8 * (self._byte_i % 3)
+        self._byte_i += 1
+        if self._byte_i == 3 * slots:
+            # Whole sample read: the read pointer moves on
+            self._byte_i = 0
+            self.read_ptr = (self.read_ptr + 1) % FIFO_DEPTH
+            self.count -= 1
+            self.overflow = 0
+            self.samples_read += 1
+            # Reading FIFO_DATA clears PPG_RDY only: A_FULL stays set until
+            # INT_STAT_1 is read (datasheet)
+            self.regs[INT_STAT_1] &= ~INT_PPG_RDY & 0xFF
+            self._update_int()
+        return (code >> shift) & 0xFF
+
+    def write_register(self, reg, value):
+        if reg in (INT_STAT_1, INT_STAT_2, REVISION_ID, PART_ID):
+            return
+        if reg == FIFO_WRITE_PTR or reg == FIFO_READ_PTR:
+            if reg == FIFO_WRITE_PTR:
+                self.write_ptr = value & 0x1F
+            else:
+                self.read_ptr = value & 0x1F
+            self.count = (self.write_ptr - self.read_ptr) % FIFO_DEPTH
+            self._byte_i = 0
+            return
+        if reg == FIFO_OVERFLOW:
+            self.overflow = value & 0x1F
+            return
+        if reg == MODE_CONFIG and value & 0x40:
+            # RESET: cleared once the reset sequence is over
+            self.power_on_reset()
+            return
+        if reg == DIE_TEMP_CONFIG:
+            if value & 0x01 and self._temp_done_us is None:
+                self.regs[DIE_TEMP_CONFIG] = 0x01
+                self._temp_done_us = self.board.now_us + TEMP_CONVERSION_US
+            return
+        self.regs[reg] = value
+        if reg in _SAMPLING_REGISTERS:
+            self._reschedule()
+        elif reg == INT_ENABLE_1 or reg == INT_ENABLE_2:
+            self._update_int()
@@ -0,0 +1,104 @@
+from host.i2c import RegisterDevice
+
+# Registers (datasheet pag. 9): temperature, THYST and TOS are 16 bits,
+# most significant byte first
+TEMPERATURE = 0x00
+CONFIGURATION = 0x01
+THYST = 0x02
+TOS = 0x03
+
+CONFIG_SHUTDOWN = 0x01
+CONFIG_DATA_FORMAT = 0x20
+CONFIG_ONE_SHOT = 0x80
+
+
+class MAX30205Model(RegisterDevice):
+    ''' Register-level MAX30205: continuous or one-shot conversions of a settable temperature '''
+    ADDRESS = 0x48
+    # Conversion time (datasheet: 44ms typical, 50ms max)
+    CONVERSION_US = 44000
+
+    def __init__(self, board, temperature_c=36.6):
+        RegisterDevice.__init__(self)
+        self.board = board
+        # Temperature seen by the sensor, may be changed while running
+        self.temperature_c = temperature_c
+        self.conversions = 0
+        self.config = 0
+        self.thyst = 0x4B00
+        self.tos = 0x5000
+        self.value = 0
+        # Byte of the 16-bit register the next access goes to
+        self._byte_i = 0
+        # Power-up: continuous conversions
+        self._next_us = board.now_us + self.CONVERSION_US
+        self._one_shot_us = None
+
+    def sync(self, now_us):
+        if self._next_us is not None:
+            while self._next_us <= now_us:
+                self._convert()
+                self._next_us += self.CONVERSION_US
+        if self._one_shot_us is not None and now_us >= self._one_shot_us:
+            self._one_shot_us = None
+            self._convert()
+            self.config &= ~CONFIG_ONE_SHOT & 0xFF
+
+    def next_event_us(self):
+        if self._one_shot_us is not None:
+            return self._one_shot_us
+        return self._next_us
+
+    def _convert(self):
+        temp = self.temperature_c
+        if self.config & CONFIG_DATA_FORMAT:
+            # Extended format: 64C offset
+            temp -= 64.0
+        self.value = int(round(temp * 256)) & 0xFFFF
+        self.conversions += 1
+
+    def write(self, data):
+        # Pointer byte, then the register (one byte for the configuration)
+        if not len(data):
+            return
+        self.pointer = data[0] & 0x03
+        self._byte_i = 0
+        for i in range(1, len(data)):
+            self.write_register(self.pointer, data[i])
+
+    def read_into(self, buf):
+        for i in range(len(buf)):
+            buf[i] = self.read_register(self.pointer)
+
+    def read_register(self, reg):
+        if reg == CONFIGURATION:
+            return self.config
+        value = (self.value, 0, self.thyst, self.tos)[reg]
+        byte = (value >> 8) if self._byte_i == 0 else value & 0xFF
+        self._byte_i ^= 1
+        return byte
+
+    def write_register(self, reg, value):
+        if reg == CONFIGURATION:
+            self.config = value
+            if value & CONFIG_SHUTDOWN:
+                self._next_us = None
+                if value & CONFIG_ONE_SHOT and self._one_shot_us is None:
+                    self._one_shot_us = self.board.now_us + self.CONVERSION_US
+            else:
+                self.config &= ~CONFIG_ONE_SHOT & 0xFF
+                if self._next_us is None:
+                    self._next_us = self.board.now_us + self.CONVERSION_US
+            return
+        if reg == TEMPERATURE:
+            return
+        if self._byte_i == 0:
+            value <<= 8
+            mask = 0x00FF
+        else:
+            mask = 0xFF00
+        if reg == THYST:
+            self.thyst = (self.thyst & mask) | value
+        else:
+            self.tos = (self.tos & mask) | value
+        self._byte_i ^= 1
@@ -0,0 +1,40 @@
+"""micropython for the host: identity decorators, const() and schedule() on the simulated board"""
+from host.board import current_board
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def schedule(func, arg):
+    # Runs at the next shim call (bus transaction, ticks, sleep), as
+    # MicroPython runs it between two bytecodes
+    current_board().schedule(func, arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
+
+
+def mem_info(verbose=None):
+    print('mem: not available on the host')
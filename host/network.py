@@ -0,0 +1,31 @@
+"""network for the host: a WLAN interface that is connected as long as the simulated board says so"""
+from host.board import current_board
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN(object):
+    def __init__(self, interface_id=STA_IF):
+        self.interface_id = interface_id
+        self._active = False
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+
+    def connect(self, ssid=None, key=None):
+        pass
+
+    def disconnect(self):
+        current_board().wifi_connected = False
+
+    def isconnected(self):
+        return self._active and current_board().wifi_connected
+
+    def ifconfig(self):
+        return ('192.168.4.2', '255.255.255.0', '192.168.4.1', '192.168.4.1')
+
+    def config(self, *args, **kwargs):
+        return None
@@ -0,0 +1,65 @@
+import math
+
+from synthetic import lcg
+
+
+class PPGSource(object):
+    ''' Synthetic finger on the sensor: photocurrent of each LED channel over time '''
+    # LED channels, in MAX30102 slot numbering (LED1 red, LED2 IR)
+    RED = 1
+    IR = 2
+    GREEN = 3
+
+    def __init__(self, hr_bpm=72.0, ratio=2.5, perfusion=0.02,
+                 red_gain=250.0, ir_gain=315.0, green_gain=80.0,
+                 noise_na=0.0, resp_hz=0.25, resp_depth=0.005, seed=1):
+        # hr_bpm: heart rate, may be changed while running
+        # ratio: SpO2 ratio of ratios (AC/DC red) / (AC/DC IR)
+        # perfusion: peak pulse depth of the IR channel (fraction of DC)
+        # *_gain: DC photocurrent (nA) per mA of LED current
+        # noise_na: peak uniform noise added to every conversion
+        # resp_hz, resp_depth: slow baseline modulation (breathing)
+        self.hr_bpm = hr_bpm
+        self.ratio = ratio
+        self.perfusion = perfusion
+        self.gains = {self.RED: red_gain, self.IR: ir_gain, self.GREEN: green_gain}
+        self.noise_na = noise_na
+        self.resp_hz = resp_hz
+        self.resp_depth = resp_depth
+        # False: finger removed, only ambient light reaches the photodiode
+        self.contact = True
+        self.ambient_na = 20.0
+        self.t = 0.0
+        self.phase = 0.0
+        self._seed = seed
+        self._pulse = 0.0
+
+    def step(self, dt):
+        # Advances the signal by dt seconds (one ADC conversion)
+        self.t += dt
+        self.phase = (self.phase + dt * self.hr_bpm / 60.0) % 1.0
+        phase = self.phase
+        # Systolic peak and dicrotic wave, normalised to about 1
+        self._pulse = (math.exp(-((phase - 0.2) ** 2) / 0.01)
+                       + 0.4 * math.exp(-((phase - 0.55) ** 2) / 0.02))
+
+    def current_na(self, channel, led_ma):
+        # Photocurrent of one channel at the current time: more blood
+        # during the pulse, more absorption, less light
+        if not self.contact:
+            value = self.ambient_na
+        else:
+            depth = self.perfusion * self._pulse
+            if channel == self.RED:
+                depth *= self.ratio
+            resp = 1.0 + self.resp_depth * math.sin(2 * math.pi * self.resp_hz * self.t)
+            value = self.gains[channel] * led_ma * resp * (1.0 - depth) + self.ambient_na
+        if self.noise_na:
+            self._seed = lcg(self._seed)
+            value += self.noise_na * ((self._seed >> 8) / 4194304.0 - 1.0)
+        return value
+
+    def expected_spo2(self):
+        # What spo2calculator's linear formula gives for this ratio
+        spo2 = (104 - 17 * self.ratio) * 1.44
+        return min(max(spo2, 0.0), 100.0)
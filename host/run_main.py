@@ -0,0 +1,130 @@
+"""
+Runs the unmodified main.py on the simulated board for a given simulated
+time and reports the I2C cost per sample:
+
+    python -m host.run_main --seconds 20 --hr 72 --ratio 2.5
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import re
+import sys
+
+import host
+from host.board import Board, SimulationEnd
+from host.ppg import PPGSource
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PATH = os.path.join(ROOT, 'main.py')
+
+
+def add_firmware_paths():
+    # main.py imports lib.xxx, the library modules import their siblings
+    # directly (/lib is on the device path)
+    for path in (os.path.join(ROOT, 'lib'), ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def run_main(board, seconds, main_path=MAIN_PATH, quiet=True, config=None):
+    # Runs main.py on board until `seconds` of simulated time have passed
+    # and returns its globals (sensor, windows, ... as left by the loop).
+    # config: configuration constants to override, e.g. {'PROFILE_ALLOC': 1}
+    # (their `NAME = ...` line is replaced)
+    add_firmware_paths()
+    host.install(board)
+    board.run_for(seconds)
+    with open(main_path) as f:
+        source = f.read()
+    for name, value in (config or {}).items():
+        source, n = re.subn(r'(?m)^{} = .*$'.format(name), '{} = {!r}'.format(name, value), source)
+        if n != 1:
+            raise ValueError('Wrong configuration constant:{0}!'.format(name))
+    code = compile(source, main_path, 'exec')
+    scope = {'__name__': '__main__', '__file__': main_path}
+    output = io.StringIO() if quiet else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            exec(code, scope)
+    except SimulationEnd:
+        pass
+    finally:
+        board.deadline_us = None
+        # main.py turns the automatic collections off
+        gc.enable()
+    return scope
+
+
+def sent_lines(board):
+    # Lines sent over all the TCP connections
+    lines = []
+    for connection in board.connections:
+        lines.extend(connection.sent.decode('utf-8').splitlines())
+    return lines
+
+
+def result_packets(board, packet_type='result'):
+    # JSON packets of this "type" sent by main.py (the last line may be cut
+    # by the deadline)
+    packets = []
+    for line in sent_lines(board):
+        if line.startswith('{'):
+            try:
+                packet = json.loads(line)
+            except ValueError:
+                continue
+            if packet.get('type') == packet_type:
+                packets.append(packet)
+    return packets
+
+
+def i2c_cost(board):
+    # Bus usage per sample produced by the sensor
+    n = max(board.sensor.samples_produced, 1)
+    bus = board.bus
+    return {
+        'samples': board.sensor.samples_produced,
+        'transactions_per_sample': bus.transactions / n,
+        'bytes_per_sample': (bus.bytes_written + bus.bytes_read) / n,
+        'bus_busy_fraction': bus.busy_us / board.now_us if board.now_us else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run main.py on the simulated board')
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--hr', type=float, default=72.0, help='heart rate (BPM)')
+    parser.add_argument('--ratio', type=float, default=2.5, help='SpO2 ratio of ratios')
+    parser.add_argument('--noise', type=float, default=0.0, help='peak noise (nA)')
+    parser.add_argument('--ppm', type=float, default=0.0, help='sensor clock error')
+    parser.add_argument('--cpu-scale', type=float, default=0.0,
+                        help='device/host speed ratio charged to the clock (0: off)')
+    parser.add_argument('--verbose', action='store_true', help='show the output of main.py')
+    args = parser.parse_args()
+
+    ppg = PPGSource(hr_bpm=args.hr, ratio=args.ratio, noise_na=args.noise)
+    board = Board.with_default_devices(ppg=ppg, cpu_scale=args.cpu_scale)
+    board.sensor.clock_ppm = args.ppm
+    run_main(board, args.seconds, quiet=not args.verbose)
+
+    sensor = board.sensor
+    print('Simulated time: {:.1f} s'.format(board.now_us / 1e6))
+    print('Samples: {} produced, {} read, {} lost'.format(
+        sensor.samples_produced, sensor.samples_read, sensor.samples_lost))
+    cost = i2c_cost(board)
+    print('I2C: {} transactions, {} bytes written, {} bytes read'.format(
+        board.bus.transactions, board.bus.bytes_written, board.bus.bytes_read))
+    print('I2C per sample: {:.2f} transactions, {:.1f} bytes, bus busy {:.1%}'.format(
+        cost['transactions_per_sample'], cost['bytes_per_sample'], cost['bus_busy_fraction']))
+    packets = result_packets(board)
+    if packets:
+        last = packets[-1]
+        print('Results: {} packets, last HR {}, SpO2 {} (expected {:.1f})'.format(
+            len(packets), last['hr']['value'], last['spo2'], ppg.expected_spo2()))
+
+
+if __name__ == '__main__':
+    main()
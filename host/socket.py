@@ -0,0 +1,72 @@
+"""socket for the host: a TCP server whose clients connect at once and record what the firmware sends"""
+from host.board import current_board
+
+AF_INET = 2
+SOCK_STREAM = 1
+SOL_SOCKET = 1
+SO_REUSEADDR = 4
+IPPROTO_TCP = 6
+TCP_NODELAY = 1
+ETIMEDOUT = 110
+EBADF = 9
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    return [(AF_INET, SOCK_STREAM, IPPROTO_TCP, '', (host, port))]
+
+
+class socket(object):
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=IPPROTO_TCP):
+        self.timeout = None
+        self.closed = False
+        # Bytes sent by the firmware (accepted connections)
+        self.sent = bytearray()
+        self.send_calls = 0
+        # Exceptions raised by the next send() calls, e.g. OSError(110)
+        # for a send timeout
+        self.send_errors = []
+
+    def setsockopt(self, level, optname, value):
+        pass
+
+    def bind(self, address):
+        self.address = address
+
+    def listen(self, backlog=0):
+        pass
+
+    def accept(self):
+        # A client is always waiting
+        board = current_board()
+        board.checkpoint()
+        client = socket()
+        board.connections.append(client)
+        return client, ('192.168.4.3', 50000 + len(board.connections))
+
+    def settimeout(self, value):
+        self.timeout = value
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0
+
+    def send(self, data):
+        current_board().checkpoint()
+        if self.closed:
+            raise OSError(EBADF)
+        self.send_calls += 1
+        if self.send_errors:
+            raise self.send_errors.pop(0)
+        self.sent += data
+        return len(data)
+
+    def sendall(self, data):
+        self.send(data)
+
+    def write(self, data):
+        return self.send(data)
+
+    def recv(self, bufsize):
+        return b''
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,66 @@
+import host
+from host.board import Board
+
+board = host.install(Board.with_default_devices(temperature_c=36.6))
+
+from machine import I2C, Pin
+from max30205 import MAX30205
+from utime import sleep_ms, ticks_add, ticks_diff, ticks_ms
+
+# The simulated bus counts transactions and bytes and charges their wire
+# time; the MAX30205 driver runs on the register model.
+# Runs on a PC: PYTHONPATH=.:lib python host/test/i2c_test.py
+
+i2c = I2C(1, sda=Pin(26), scl=Pin(27), freq=100000)
+bus = board.bus
+
+print("Bus accounting...")
+bus.reset_stats()
+start = board.now_us
+data = i2c.readfrom_mem(0x48, 0x01, 1)
+# START, address + register, repeated START, address + 1 byte, STOP
+assert bus.transactions == 1
+assert bus.bytes_written == 3 and bus.bytes_read == 1
+assert board.now_us - start == bus.overhead_us + (9 * 4 + 2 * 2 + 2) * 10
+i2c.writeto(0x57, bytearray([0xFF]))
+assert i2c.readfrom(0x57, 1) == b'\x15'
+assert bus.transactions == 3
+assert bus.per_address[0x57] == [2, 3, 1]
+try:
+    i2c.readfrom_mem(0x50, 0x00, 1)
+    assert False, "no device at 0x50"
+except OSError as e:
+    assert e.args[0] == 19
+
+print("Ticks wrap around...")
+t = ticks_ms()
+assert ticks_diff(ticks_add(t, 5), t) == 5
+assert ticks_diff(ticks_add(0x3FFFFFFF, 10), 0x3FFFFFFF) == 10
+
+print("MAX30205 continuous...")
+thermometer = MAX30205(i2c=i2c)
+sleep_ms(50)
+assert abs(thermometer.read_temperature_c() - 36.6) < 1 / 256.0
+
+print("MAX30205 one-shot, cached...")
+board.thermometer.temperature_c = 37.25
+thermometer = MAX30205(i2c=i2c, refresh_ms=1000, one_shot=True)
+conversions = board.thermometer.conversions
+assert thermometer.read_cached() is None
+sleep_ms(20)
+assert thermometer.read_cached() is None
+sleep_ms(30)
+assert thermometer.read_cached() == 37.25
+assert board.thermometer.conversions == conversions + 1
+# The sensor stays in shutdown between the one-shot conversions
+sleep_ms(500)
+assert board.thermometer.conversions == conversions + 1
+bus.reset_stats()
+for i in range(100):
+    thermometer.read_cached()
+    sleep_ms(10)
+# Two transactions per refresh: start the conversion, read it
+assert bus.transactions == 2, bus.transactions
+assert board.thermometer.conversions == conversions + 2
+
+print("I2C test OK.")
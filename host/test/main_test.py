@@ -0,0 +1,123 @@
+import tracemalloc
+
+from host.board import Board
+from host.ppg import PPGSource
+from host.run_main import i2c_cost, result_packets, run_main, sent_lines
+
+# main.py, unmodified, on the simulated board: the results must match the
+# synthetic finger and each FIFO drain must cost one pointer read and one
+# burst; with the INT line wired, the I2C cost per sample must stay within
+# budget.
+# Runs on a PC: PYTHONPATH=.:lib python host/test/main_test.py
+
+# Interrupt-driven main loop (INT wired): one drain per A_FULL interrupt,
+# INT_STATUS_1 + pointers + burst for a FIFO block, 6 bytes per sample
+IRQ_TRANSACTIONS_PER_SAMPLE_MAX = 0.5
+IRQ_BYTES_PER_SAMPLE_MAX = 8.0
+# SpO2 error with the 1st order integer filter (INTEGER_FILTER)
+INTEGER_FILTER_SPO2_ERROR_MAX = 4.0
+# Share of the time spent recording the instrumentation
+STATS_OVERHEAD_MAX = 0.01
+# Bytes per sample of the acquire -> filter -> buffer stages in the
+# allocation profile (tracemalloc peak: CPython int objects, the I2C model
+# in "check"; a string growing per sample would not fit)
+HOT_PATH_ALLOC_BUDGETS = {"check": 256, "pop": 64, "filter": 192, "detect": 128,
+                          "window": 192, "stream": 128}
+
+for hr_bpm, ratio in ((72.0, 2.5), (120.0, 2.2)):
+    print("{} BPM, R = {}...".format(hr_bpm, ratio))
+    ppg = PPGSource(hr_bpm=hr_bpm, ratio=ratio, noise_na=20.0)
+    board = Board.with_default_devices(ppg=ppg, temperature_c=36.9)
+    scope = run_main(board, 12)
+
+    sensor = board.sensor
+    assert sensor.samples_lost == 0
+    assert sensor.empty_reads == 0
+    # Every sample read went out on the stream (but the last batch)
+    samples = [line for line in sent_lines(board) if line.startswith("S,")]
+    assert 0 <= sensor.samples_read - len(samples) < 15
+
+    packets = result_packets(board)
+    assert len(packets) >= 10
+    last = packets[-1]
+    assert abs(last["hr"]["value"] - hr_bpm) < 2.0, last["hr"]
+    assert abs(last["spo2"] - ppg.expected_spo2()) < 2.0, (last["spo2"], ppg.expected_spo2())
+    # Body temperature with main.py's calibration offset
+    assert abs(last["body_temp"] - (36.9 + scope["temp_sensor"].offset)) < 0.01
+    assert last["lost_samples_total"] == 0
+    assert abs(last["acq_freq"] - 50.0) < 0.5
+
+    # Instrumentation: one stats packet every STATS_WINDOWS windows
+    stats_packets = result_packets(board, "stats")
+    assert len(stats_packets) == len(packets) // scope["STATS_WINDOWS"]
+    stats = stats_packets[-1]
+    for name in ("check", "pop", "filter", "stream", "hr", "spo2", "json", "send_result"):
+        stage = stats["stages"][name]
+        assert sum(stage["hist"]) == stage["n"] and stage["max_us"] >= stage["mean_us"]
+    # Polling: the FIFO is drained as soon as a sample comes in, in blocks
+    # of one or two
+    fifo_depth = stats["values"]["fifo_depth"]
+    assert fifo_depth["n"] > 0 and fifo_depth["max"] <= 2, fifo_depth
+    assert stats["values"]["block"]["max"] <= 2
+    # The bus is the check cost: one pointer read (4 bytes, 50 µs overhead)
+    assert stats["stages"]["check"]["max_us"] < 1000
+    assert stats["counters"]["send_stalls"] == 0 and stats["counters"]["reconnects"] == 0
+    # Idle time for every collection, the backstop never needed
+    assert stats["counters"]["gc_forced"] == 0
+    assert stats["overhead_load"] < STATS_OVERHEAD_MAX
+
+    # Drain cost: every burst of FIFO_DATA comes right after the pointer
+    # read that found the samples (2 transactions), moves at least one
+    # sample and reads no byte past the FIFO. The empty pointer reads in
+    # between are the busy polling (the only thing taking time on the host,
+    # cpu_scale=0), not a drain cost.
+    assert sensor.fifo_bursts == sensor.fifo_bursts_after_pointers
+    assert 0 < sensor.fifo_bursts <= sensor.samples_read
+    cost = i2c_cost(board)
+    print("I2C per sample: {:.1f} transactions, {:.0f} bytes; {:.2f} bursts".format(
+        cost["transactions_per_sample"], cost["bytes_per_sample"],
+        sensor.fifo_bursts / sensor.samples_read))
+
+print("Interrupt-driven...")
+ppg = PPGSource(hr_bpm=72.0, ratio=2.5, noise_na=20.0)
+board = Board.with_default_devices(ppg=ppg, temperature_c=36.9, int_pin=4)
+scope = run_main(board, 12, config={"my_INT_pin": 4})
+sensor = board.sensor
+assert sensor.samples_lost == 0 and sensor.empty_reads == 0
+# One burst per interrupt, right after its pointer read
+assert sensor.fifo_bursts == scope["sensor"].irq_count > 0
+assert sensor.fifo_bursts == sensor.fifo_bursts_after_pointers
+last = result_packets(board)[-1]
+assert abs(last["hr"]["value"] - 72.0) < 2.0, last["hr"]
+cost = i2c_cost(board)
+print("I2C per sample: {:.2f} transactions, {:.1f} bytes".format(
+    cost["transactions_per_sample"], cost["bytes_per_sample"]))
+assert cost["transactions_per_sample"] < IRQ_TRANSACTIONS_PER_SAMPLE_MAX
+assert cost["bytes_per_sample"] < IRQ_BYTES_PER_SAMPLE_MAX
+
+print("Integer filter...")
+ppg = PPGSource(hr_bpm=72.0, ratio=2.5, noise_na=20.0)
+board = Board.with_default_devices(ppg=ppg, temperature_c=36.9)
+scope = run_main(board, 12, config={"INTEGER_FILTER": True})
+assert type(scope["bp_filters"]).__name__ == "FixedFilterBank"
+last = result_packets(board)[-1]
+assert abs(last["hr"]["value"] - 72.0) < 2.0, last["hr"]
+# 1st order: the slower roll-off lets more of the baseline into the AC
+# amplitudes, SpO2 reads ~3 % high (as the float BandpassFilter does)
+assert abs(last["spo2"] - ppg.expected_spo2()) < INTEGER_FILTER_SPO2_ERROR_MAX, (
+    last["spo2"], ppg.expected_spo2())
+
+print("Allocation profile...")
+tracemalloc.start()
+board = Board.with_default_devices(ppg=PPGSource(), temperature_c=36.9)
+scope = run_main(board, 22, config={"PROFILE_ALLOC": 1})
+tracemalloc.stop()
+stats = result_packets(board, "stats")[-1]
+for name, budget in sorted(HOT_PATH_ALLOC_BUDGETS.items()):
+    per_sample = stats["stages"][name]["alloc_per_sample"]
+    assert per_sample <= budget, (name, per_sample)
+# Collections in idle time only, on the allocation budget
+assert scope["gc_collector"].collections > 0
+assert scope["gc_collector"].collections >= stats["stages"]["gc"]["n"]
+
+print("Main test OK.")
@@ -0,0 +1,165 @@
+import host
+from host.board import Board
+from host.max30102_model import (FIFO_CONFIG, LED1_PULSE_AMP, MODE_CONFIG, MULTI_LED_CONFIG_1,
+                                 PARTICLE_CONFIG)
+
+board = host.install(Board.with_default_devices(int_pin=4))
+
+from machine import I2C, Pin
+from max30102 import MAX30102, MAX30105_FIFO_DEPTH
+from utime import sleep_ms
+
+# The unmodified driver against the register model: FIFO pointers, burst
+# decoding, overflow counting, rates, interrupts, die temperature, the
+# I2C cost of a drain, and the writes saved by the shadow registers.
+# Runs on a PC: PYTHONPATH=.:lib python host/test/max30102_model_test.py
+
+model = board.sensor
+i2c = I2C(1, sda=Pin(26), scl=Pin(27), freq=400000)
+assert i2c.scan() == [0x48, 0x57]
+
+sensor = MAX30102(i2c=i2c)
+assert sensor.check_part_id()
+sensor.setup_sensor(sample_rate=400, sample_avg=8)
+assert model.acquisition_frequency() == 50.0
+assert model.active_slots() == (1, 2)
+
+print("Drain and decode...")
+sleep_ms(300)
+assert model.count == 15, model.count
+expected = [model.fifo[((model.read_ptr + i) % 32) * 3 + j] >> sensor._pulse_width
+            for i in range(15) for j in range(2)]
+bus = board.bus
+bus.reset_stats()
+assert sensor.check() == 15
+# Pointers, then the burst: two transactions
+assert bus.transactions == 2, bus.transactions
+assert bus.bytes_read == 3 + 15 * 6
+block = [0] * 30
+assert sensor.pop_interleaved_from_storage(block, 15) == 15
+assert block == expected
+assert model.count == 0 and model.samples_read == 15
+
+print("Empty FIFO...")
+bus.reset_stats()
+assert sensor.check() == 0
+assert bus.transactions == 1 and model.empty_reads == 0
+
+print("Overflow with rollover...")
+sleep_ms(1000)
+assert model.samples_lost == 50 - 32, model.samples_lost
+assert sensor.check() == MAX30105_FIFO_DEPTH
+assert sensor.get_lost_ir() == model.samples_lost
+while sensor.available():
+    sensor.pop_interleaved_from_storage(block, 15)
+
+print("Overflow without rollover...")
+sensor.disable_fifo_rollover()
+sensor.check()
+sleep_ms(700)
+assert model.count == 32
+assert model.overflow == 3
+oldest = model.fifo[model.read_ptr * 3]
+assert sensor.check() == 32
+# The FIFO kept its oldest samples
+assert sensor.sense.red.data[sensor.sense.red.head] == oldest >> sensor._pulse_width
+assert sensor.get_lost_ir() == model.samples_lost
+sensor.enable_fifo_rollover()
+while sensor.available():
+    sensor.pop_interleaved_from_storage(block, 15)
+
+print("Rates...")
+for rate, avg in ((100, 1), (1000, 4), (50, 2)):
+    sensor.apply_config({"sample_rate": rate, "sample_avg": avg})
+    sensor.check()
+    produced = model.samples_produced
+    sleep_ms(2000)
+    assert abs((model.samples_produced - produced) - 2 * rate / avg) <= 1
+    sensor.clear_fifo()
+    model.overflow = 0
+
+print("ADC resolution...")
+sensor.apply_config({"pulse_width": 69, "adc_range": 16384, "led_power": 0x7F})
+sensor.check()
+sleep_ms(100)
+# 15 bits, left-justified: the 3 low bits are zero
+assert model.count > 0
+codes = [model.fifo[((model.read_ptr + i) % 32) * 3] for i in range(model.count)]
+assert all(code & 0x07 == 0 for code in codes)
+assert all(0 < code < 1 << 18 for code in codes)
+sensor.check()
+
+print("Die temperature...")
+model.die_temp_c = 28.3
+sensor.start_temperature()
+assert sensor.poll_temperature() is None
+sleep_ms(30)
+assert sensor.poll_temperature() == 28.25
+assert sensor.poll_temperature() is None
+
+print("Interrupts...")
+sensor.apply_config({"sample_rate": 100, "sample_avg": 1})
+sensor.check()
+sensor.enable_interrupt(Pin(4, Pin.IN, Pin.PULL_UP), number_of_samples=24)
+drained = model.samples_read
+lost = model.samples_lost
+sleep_ms(2000)
+# Drained by the scheduled callback, one burst per 24 samples
+assert sensor.irq_count == 200 // 24, sensor.irq_count
+assert model.samples_read - drained == 24 * sensor.irq_count
+assert model.samples_lost == lost, (model.samples_lost, lost)
+# Many A_FULL cycles: the flag is cleared by the INT_STATUS_1 read of each
+# drain (not by the FIFO reads), INT goes high again and the next edge comes
+for k in range(10):
+    irq_count = sensor.irq_count
+    sleep_ms(2000)
+    assert sensor.irq_count - irq_count >= 200 // 24 - 1, (k, sensor.irq_count - irq_count)
+assert model.samples_read - drained == 24 * sensor.irq_count
+assert model.samples_lost == lost, (model.samples_lost, lost)
+sensor.disable_interrupt()
+
+print("Finger removed...")
+sensor.check()
+while sensor.available():
+    sensor.pop_interleaved_from_storage(block, 15)
+model.ppg.contact = False
+sleep_ms(100)
+sensor.check()
+n = sensor.pop_interleaved_from_storage(block, 15)
+assert n and len(set(block[:2 * n])) == 1 and block[0] < 1000, block[:2 * n]
+
+print("Shadow registers...")
+sensor.setup_sensor(sample_rate=400, sample_avg=8)
+writes = []
+model_write_register = model.write_register
+
+
+def counting_write_register(reg, value):
+    writes.append(reg)
+    model_write_register(reg, value)
+
+
+model.write_register = counting_write_register
+# As set up above, but at 100 Hz with a 215 us pulse: sample rate and
+# pulse width share PARTICLE_CONFIG, the other registers already match
+config = {"sample_avg": 8, "led_mode": 2, "adc_range": 16384, "sample_rate": 100,
+          "pulse_width": 215, "led_power": 0x7F}
+bus.reset_stats()
+assert sensor.apply_config(config) == 1
+assert writes == [PARTICLE_CONFIG], writes
+# Values from the shadow copy: one write, no read
+assert bus.transactions == 1, bus.transactions
+del writes[:]
+assert sensor.apply_config(config) == 0
+assert writes == []
+# A reset puts the registers back to their power-on values: the same
+# configuration is written again
+sensor.soft_reset()
+del writes[:]
+assert sensor.apply_config(config) == 6
+assert sorted(writes) == [FIFO_CONFIG, MODE_CONFIG, PARTICLE_CONFIG, LED1_PULSE_AMP,
+                          LED1_PULSE_AMP + 1, MULTI_LED_CONFIG_1], writes
+assert model.acquisition_frequency() == 100.0 / 8
+model.write_register = model_write_register
+
+print("MAX30102 model test OK.")
@@ -0,0 +1,15 @@
+"""ucollections for the host"""
+from collections import OrderedDict, namedtuple
+import collections
+
+
+class deque(collections.deque):
+    ''' MicroPython deque: fixed maxlen; when full, append() drops the oldest item or raises IndexError (flags & 1) '''
+    def __init__(self, iterable, maxlen, flags=0):
+        collections.deque.__init__(self, iterable, maxlen)
+        self._flags = flags
+
+    def append(self, item):
+        if self._flags & 1 and len(self) == self.maxlen:
+            raise IndexError('full')
+        collections.deque.append(self, item)
@@ -0,0 +1,2 @@
+"""ustruct for the host"""
+from struct import *
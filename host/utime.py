@@ -0,0 +1,51 @@
+"""utime for the host: ticks and sleeps on the virtual clock of the simulated board"""
+from host.board import current_board
+
+# MicroPython small-int ticks wrap around at 2**30
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def _now_us():
+    board = current_board()
+    board.checkpoint()
+    return board.now_us
+
+
+def ticks_us():
+    return int(_now_us()) & TICKS_MAX
+
+
+def ticks_ms():
+    return int(_now_us() // 1000) & TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def sleep_us(us):
+    board = current_board()
+    board.checkpoint()
+    board.sleep(us)
+
+
+def sleep_ms(ms):
+    sleep_us(ms * 1000)
+
+
+def sleep(seconds):
+    sleep_us(seconds * 1000000)
+
+
+def time():
+    return int(_now_us() // 1000000)
@@ -0,0 +1,89 @@
+class WindowAnalysis(object):
+    ''' Everything compute_hr() and compute_spo2() need from one window, see analyze_window() '''
+    def __init__(self):
+        self.n = 0
+        # Filtered IR (compute_hr)
+        self.ir_mean = 0.0
+        self.ir_min = 0.0
+        self.ir_max = 0.0
+        # Local maxima of the filtered IR (indices in the window), the
+        # peak candidates of compute_hr()
+        self.candidates = []
+        # DC (raw means) and AC (filtered RMS) of both channels (compute_spo2)
+        self.ir_rms = 0.0
+        self.red_rms = 0.0
+        self.raw_ir_mean = 0.0
+        self.raw_red_mean = 0.0
+
+    def max_abs(self):
+        # Largest |x - mean| of the filtered IR
+        return max(self.ir_max - self.ir_mean, self.ir_mean - self.ir_min)
+
+
+def analyze_window(ir, red=None, raw_ir=None, raw_red=None, n=None, start=None):
+    # One pass over the last n samples of each buffer (all of ir by
+    # default) instead of one pass per statistic and per consumer: sums,
+    # sums of squares, min/max and local maxima are all taken from the same
+    # loads. red, raw_ir and raw_red are optional (compute_hr only needs ir).
+    # start: the window is buffer[start:start + n] in every buffer instead
+    # (e.g. 0 for preallocated arrays holding n samples). Buffers may be
+    # arrays or memoryviews: nothing is copied. Returns a WindowAnalysis.
+    result = WindowAnalysis()
+    if n is None:
+        n = len(ir)
+    result.n = n
+    if n <= 0:
+        return result
+
+    have_spo2 = red is not None and raw_ir is not None and raw_red is not None
+    if start is not None:
+        o_ir = o_red = o_raw_ir = o_raw_red = start
+    else:
+        o_ir = len(ir) - n
+        if have_spo2:
+            o_red = len(red) - n
+            o_raw_ir = len(raw_ir) - n
+            o_raw_red = len(raw_red) - n
+
+    candidates = result.candidates
+    # Integer samples (raw) keep exact integer sums
+    sum_ir = 0
+    sum_sq_ir = 0.0
+    sum_sq_red = 0.0
+    sum_raw_ir = 0
+    sum_raw_red = 0
+    x = ir[o_ir]
+    nxt = x
+    prev = x
+    low = x
+    high = x
+    # x is sample i, nxt sample i + 1 (loaded once, one step ahead)
+    for i in range(n):
+        if i + 1 < n:
+            nxt = ir[o_ir + i + 1]
+            # Local maximum (x >= both neighbours), as in compute_hr()
+            if i and x >= prev and x >= nxt:
+                candidates.append(i)
+        sum_ir += x
+        sum_sq_ir += x * x
+        if x < low:
+            low = x
+        elif x > high:
+            high = x
+        if have_spo2:
+            v = red[o_red + i]
+            sum_sq_red += v * v
+            sum_raw_ir += raw_ir[o_raw_ir + i]
+            sum_raw_red += raw_red[o_raw_red + i]
+        prev = x
+        x = nxt
+
+    result.ir_mean = sum_ir / n
+    result.ir_min = low
+    result.ir_max = high
+    result.ir_rms = (sum_sq_ir / n) ** 0.5
+    if have_spo2:
+        result.red_rms = (sum_sq_red / n) ** 0.5
+        result.raw_ir_mean = sum_raw_ir / n
+        result.raw_red_mean = sum_raw_red / n
+    return result
@@ -0,0 +1,53 @@
+import sys
+
+# Shared by the modules with @micropython.native code: the decorator is
+# compile-time syntax on the board, a stand-in is needed on a PC
+try:
+    import micropython
+except ImportError:
+    # CPython (host tests): the code emitter decorators do nothing
+    class micropython:
+        @staticmethod
+        def native(f):
+            return f
+
+NATIVE_DECORATOR = '@micropython.native'
+
+
+class _SourceModule(object):
+    ''' Module compiled from its source by import_native() '''
+    pass
+
+
+def import_native(name, native=True):
+    # Imports module `name` (e.g. 'lib.filter'), whose hot functions use
+    # @micropython.native. A port built without the native emitter refuses
+    # the whole module when compiling it (SyntaxError: invalid micropython
+    # decorator): the module is then compiled again from its source without
+    # the decorator, as bytecode. native=False does that on any port (e.g.
+    # to compare both). Returns the module, also registered under `name`
+    # for the imports that follow.
+    if native:
+        try:
+            return __import__(name, None, None, ('*',))
+        except SyntaxError:
+            pass
+    path = name.replace('.', '/') + '.py'
+    source = None
+    for directory in sys.path:
+        try:
+            with open(directory + '/' + path if directory else path) as f:
+                source = f.read()
+            break
+        except OSError:
+            pass
+    if source is None:
+        raise ImportError('no module named ' + name)
+    lines = [line for line in source.split('\n') if line.strip() != NATIVE_DECORATOR]
+    namespace = {'__name__': name}
+    exec('\n'.join(lines), namespace)
+    module = _SourceModule()
+    for key in namespace:
+        setattr(module, key, namespace[key])
+    sys.modules[name] = module
+    return module
@@ -1,4 +1,7 @@
 import math
+from array import array
+
+from emitter import micropython
 
 class BandpassFilter:
     """
@@ -12,6 +15,21 @@ class BandpassFilter:
         fc_hp : High-pass cutoff frequency (to remove DC component, e.g., 0.5Hz)
         fc_lp : Low-pass cutoff frequency (to remove noise, e.g., 5.0Hz)
         """
+        self.fc_hp = fc_hp
+        self.fc_lp = fc_lp
+        self.retune(fs)
+
+        # --- STATE (MEMORY) VARIABLES ---
+        self.y_lp_prev = 0.0 # Previous Low-Pass output
+        self.y_hp_prev = 0.0 # Previous High-Pass output
+        self.x_prev    = 0.0 # Previous raw input (Required for High-Pass)
+
+    def retune(self, fs):
+        """
+        Sets the sampling frequency (e.g. when the measured rate drifts).
+        The state is kept: it is in signal units, so the output goes on
+        without a jump.
+        """
         self.fs = fs
         self.dt = 1.0 / fs
 
@@ -19,18 +37,30 @@ class BandpassFilter:
         
         # 1. Low Pass Alpha (Traditional RC circuit logic)
         # alpha_lp = dt / (RC + dt)
-        rc_lp = 1.0 / (2.0 * math.pi * fc_lp)
+        rc_lp = 1.0 / (2.0 * math.pi * self.fc_lp)
         self.alpha_lp = self.dt / (rc_lp + self.dt)
 
         # 2. High Pass Alpha (Traditional structure)
         # alpha_hp = RC / (RC + dt)
-        rc_hp = 1.0 / (2.0 * math.pi * fc_hp)
+        rc_hp = 1.0 / (2.0 * math.pi * self.fc_hp)
         self.alpha_hp = rc_hp / (rc_hp + self.dt)
 
-        # --- STATE (MEMORY) VARIABLES ---
-        self.y_lp_prev = 0.0 # Previous Low-Pass output
-        self.y_hp_prev = 0.0 # Previous High-Pass output
-        self.x_prev    = 0.0 # Previous raw input (Required for High-Pass)
+    def warm_start(self, src, n, gain=1):
+        """
+        Seeds the state from the first block src[0:n] (before filtering
+        it): steady state for a constant input at the block mean, i.e. the
+        DC offset has already been removed. From a zero state the high-pass
+        would need several seconds to settle on raw PPG, whose DC is tens
+        of thousands of counts.
+        """
+        if n <= 0:
+            return
+        total = 0
+        for i in range(n):
+            total += src[i]
+        self.x_prev    = total * gain / n
+        self.y_hp_prev = 0.0
+        self.y_lp_prev = 0.0
 
     def step(self, x):
         """
@@ -56,8 +86,477 @@ class BandpassFilter:
         # Return the filtered (Bandpass) data as the result
         return y_lp
 
+    @micropython.native
+    def process(self, src, dst, n, gain=1):
+        """
+        Filters src[0:n] into dst[0:n] (dst may be src, e.g. an array('f')
+        filtered in place). Each input is multiplied by gain first, so
+        gain=-1 inverts the raw PPG like step(x * -1) does.
+        Same arithmetic as calling step() n times, but the state stays in
+        local variables for the whole block.
+        """
+        alpha_hp = self.alpha_hp
+        alpha_lp = self.alpha_lp
+        x_prev = self.x_prev
+        y_hp_prev = self.y_hp_prev
+        y_lp_prev = self.y_lp_prev
+
+        for i in range(n):
+            x = src[i] * gain
+            y_hp = alpha_hp * (y_hp_prev + x - x_prev)
+            y_lp_prev = y_lp_prev + alpha_lp * (y_hp - y_lp_prev)
+            dst[i] = y_lp_prev
+            x_prev = x
+            y_hp_prev = y_hp
+
+        self.x_prev    = x_prev
+        self.y_hp_prev = y_hp_prev
+        self.y_lp_prev = y_lp_prev
+
     def reset(self):
         """Resets filter memory (used if necessary)"""
         self.y_lp_prev = 0.0
         self.y_hp_prev = 0.0
-        self.x_prev    = 0.0
\ No newline at end of file
+        self.x_prev    = 0.0
+
+class FixedBandpassFilter:
+    """
+    Integer version of BandpassFilter (same High-Pass + Low-Pass topology).
+    Every intermediate stays a small int, so no float object is created per
+    sample and nothing is allocated in steady state.
+    Inputs must be integers (raw sensor counts, 18 bits, any sign);
+    outputs are integers in the same units.
+    Error bound (synthetic PPG, 25-3200 Hz): within +/-1 count of
+    BandpassFilter once the high-pass has settled, about 5 / (2*pi*fc_hp)
+    seconds after a cold start, and +/-1.5 counts before.
+    """
+
+    STATE_BITS = 8  # Fractional bits of the state
+
+    def __init__(self, fs, fc_hp=0.5, fc_lp=5.0):
+        """Same parameters as BandpassFilter"""
+        self.fc_hp = fc_hp
+        self.fc_lp = fc_lp
+        self.retune(fs)
+
+        # --- STATE (MEMORY) VARIABLES, scaled by 2^STATE_BITS ---
+        self.y_lp_prev = 0
+        self.y_hp_prev = 0
+        self.x_prev    = 0
+
+    def retune(self, fs):
+        """Sets the sampling frequency, see BandpassFilter.retune()"""
+        self.fs = fs
+        self.dt = 1.0 / fs
+
+        # Same alphas as BandpassFilter. The high-pass uses 1 - alpha_hp,
+        # which is small: both are stored as mantissa (15 bits) and shift.
+        rc_lp = 1.0 / (2.0 * math.pi * self.fc_lp)
+        alpha_lp = self.dt / (rc_lp + self.dt)
+        self.c_lp, self.k_lp = self._quantize(alpha_lp)
+
+        rc_hp = 1.0 / (2.0 * math.pi * self.fc_hp)
+        alpha_hp = rc_hp / (rc_hp + self.dt)
+        self.c_hp, self.k_hp = self._quantize(1.0 - alpha_hp)
+
+    def warm_start(self, src, n, gain=1):
+        """Seeds the state from the first block, see BandpassFilter.warm_start()"""
+        if n <= 0:
+            return
+        total = 0
+        for i in range(n):
+            total += src[i]
+        self.x_prev    = ((total * gain) << self.STATE_BITS) // n
+        self.y_hp_prev = 0
+        self.y_lp_prev = 0
+
+    @staticmethod
+    def _quantize(coef):
+        """
+        coef (0 < coef < 1) ~= c / 2^(15 + k) with c < 2^15 as large as
+        possible (at most 8 extra bits)
+        """
+        k = 0
+        while k < 8 and coef * (1 << (16 + k)) < (1 << 15):
+            k += 1
+        c = int(coef * (1 << (15 + k)) + 0.5)
+        if c > 0x7FFF:
+            c = 0x7FFF
+        return c, k
+
+    def step(self, x):
+        """
+        Called for every new (integer) sample x.
+        A product c * v / 2^(15 + k) is computed as
+        (c * (v >> 15) + (c * (v & 0x7FFF)) >> 15) >> k
+        so that no partial product reaches 2^30.
+        """
+        x = x << 8
+
+        # High-Pass: y[i] = alpha * (y[i-1] + x[i] - x[i-1])
+        #                 = v - (1 - alpha) * v
+        v = self.y_hp_prev + x - self.x_prev
+        c = self.c_hp
+        k = self.k_hp
+        y_hp = v - ((c * (v >> 15) + ((c * (v & 0x7FFF) + 0x4000) >> 15) + ((1 << k) >> 1)) >> k)
+
+        # Low-Pass: y[i] = y[i-1] + alpha * (x[i] - y[i-1])
+        v = y_hp - self.y_lp_prev
+        c = self.c_lp
+        k = self.k_lp
+        y_lp = self.y_lp_prev + ((c * (v >> 15) + ((c * (v & 0x7FFF) + 0x4000) >> 15) + ((1 << k) >> 1)) >> k)
+
+        self.x_prev    = x
+        self.y_hp_prev = y_hp
+        self.y_lp_prev = y_lp
+
+        # Back to input units (rounded)
+        return (y_lp + 0x80) >> 8
+
+    @micropython.native
+    def process(self, src, dst, n, gain=1):
+        """Block version of step(), see BandpassFilter.process() (gain must be an integer)"""
+        c_hp = self.c_hp
+        k_hp = self.k_hp
+        r_hp = (1 << k_hp) >> 1
+        c_lp = self.c_lp
+        k_lp = self.k_lp
+        r_lp = (1 << k_lp) >> 1
+        x_prev = self.x_prev
+        y_hp = self.y_hp_prev
+        y_lp = self.y_lp_prev
+
+        for i in range(n):
+            x = (src[i] * gain) << 8
+            v = y_hp + x - x_prev
+            y_hp = v - ((c_hp * (v >> 15) + ((c_hp * (v & 0x7FFF) + 0x4000) >> 15) + r_hp) >> k_hp)
+            v = y_hp - y_lp
+            y_lp = y_lp + ((c_lp * (v >> 15) + ((c_lp * (v & 0x7FFF) + 0x4000) >> 15) + r_lp) >> k_lp)
+            dst[i] = (y_lp + 0x80) >> 8
+            x_prev = x
+
+        self.x_prev    = x_prev
+        self.y_hp_prev = y_hp
+        self.y_lp_prev = y_lp
+
+    def reset(self):
+        """Resets filter memory (used if necessary)"""
+        self.y_lp_prev = 0
+        self.y_hp_prev = 0
+        self.x_prev    = 0
+
+
+# Second-order sections already designed, keyed by (fs, fc_hp, fc_lp, order)
+_SOS_CACHE = {}
+_SOS_CACHE_SIZE = 16
+
+
+def butter_bandpass_sos(fs, fc_hp, fc_lp, order=2):
+    """
+    Butterworth band-pass designed on the device (bilinear transform with
+    pre-warped edges), as `order` second-order sections.
+    Returns a flat tuple (b0, b1, b2, a1, a2) * order, a0 being 1.
+    Designs are cached: asking again for the same parameters (e.g. when
+    retuning) is a dictionary lookup, no trigonometry.
+    """
+    key = (fs, fc_hp, fc_lp, order)
+    sos = _SOS_CACHE.get(key)
+    if sos is None:
+        sos = _design_butter_bandpass(fs, fc_hp, fc_lp, order)
+        if len(_SOS_CACHE) >= _SOS_CACHE_SIZE:
+            # Bounded memory: the rates in use are designed again on demand
+            _SOS_CACHE.clear()
+        _SOS_CACHE[key] = sos
+    return sos
+
+
+def _design_butter_bandpass(fs, fc_hp, fc_lp, order):
+    if order < 1:
+        raise ValueError('Wrong filter order:{0}!'.format(order))
+    if not 0 < fc_hp < fc_lp < fs / 2:
+        raise ValueError('Wrong cutoff frequencies:{0}, {1}!'.format(fc_hp, fc_lp))
+
+    # 1. Pre-warped analog band edges (rad/s)
+    k = 2.0 * fs
+    w_hp = k * math.tan(math.pi * fc_hp / fs)
+    w_lp = k * math.tan(math.pi * fc_lp / fs)
+    w0_sq = w_hp * w_lp
+    bw = w_lp - w_hp
+
+    # 2. Analog low-pass prototype poles -> band-pass poles -> z-plane
+    # Each prototype pole p gives the roots of s^2 - p*bw*s + w0^2 = 0.
+    poles = []
+    for i in range(order):
+        theta = math.pi * (2 * i + order + 1) / (2 * order)
+        p = complex(math.cos(theta), math.sin(theta))
+        half = p * bw / 2
+        root = (half * half - w0_sq) ** 0.5
+        for s in (half + root, half - root):
+            poles.append((k + s) / (k - s))
+
+    # 3. Group the poles into sections: conjugate pairs, then real pairs
+    denominators = []
+    real_poles = []
+    for z in poles:
+        if abs(z.imag) < 1e-9:
+            real_poles.append(z.real)
+        elif z.imag > 0:
+            denominators.append((-2.0 * z.real, z.real * z.real + z.imag * z.imag))
+    real_poles.sort()
+    for i in range(0, len(real_poles), 2):
+        z1 = real_poles[i]
+        z2 = real_poles[i + 1]
+        denominators.append((-(z1 + z2), z1 * z2))
+
+    # 4. Every section gets a zero at DC and one at Nyquist: 1 - z^-2.
+    # Gain: unity at the (digital) centre frequency, shared by the sections.
+    w_c = 2.0 * math.atan(math.sqrt(w0_sq) / k)
+    z1 = complex(math.cos(w_c), -math.sin(w_c))  # z^-1 at the centre
+    z2 = z1 * z1
+    response = 1.0
+    for a1, a2 in denominators:
+        response *= abs((1 - z2) / (1 + a1 * z1 + a2 * z2))
+    g = (1.0 / response) ** (1.0 / order)
+
+    sos = []
+    for a1, a2 in denominators:
+        sos.extend((g, 0.0, -g, a1, a2))
+    return tuple(sos)
+
+
+class FilterBank:
+    """
+    Butterworth band-pass (see SOSBandpassFilter) over n_channels
+    interleaved channels, e.g. red, IR, green in FIFO order. The channels
+    share the coefficients; their states are kept in one flat array, so a
+    whole block is filtered in one call and retune() affects all of them.
+    """
+
+    def __init__(self, n_channels, fs, fc_hp=0.5, fc_lp=5.0, order=2):
+        """
+        n_channels       : Number of interleaved channels
+        fs, fc_hp, fc_lp : Same as BandpassFilter
+        order            : Number of second-order sections
+        """
+        if n_channels < 1:
+            raise ValueError('Wrong number of channels:{0}!'.format(n_channels))
+        self.n_channels = n_channels
+        self.fs = fs
+        self.fc_hp = fc_hp
+        self.fc_lp = fc_lp
+        self.order = order
+        self.sos = butter_bandpass_sos(fs, fc_hp, fc_lp, order)
+
+        # --- STATE (MEMORY) ---
+        # Per channel: x[n-1], x[n-2] of the input, then y[n-1], y[n-2] of
+        # each section (the output history of a section is the input
+        # history of the next)
+        self.state_size = 2 * order + 2
+        self.state = array('f', [0.0] * (n_channels * self.state_size))
+
+    @micropython.native
+    def process(self, src, dst, n, gain=1):
+        """
+        Filters n interleaved frames: src[0:n * n_channels] into dst (may be
+        the same buffer), see BandpassFilter.process(). Runs one section at
+        a time over the whole block with its coefficients and history in
+        local variables.
+        """
+        if n <= 0:
+            return
+        sos = self.sos
+        state = self.state
+        n_channels = self.n_channels
+        end = n * n_channels
+        base = 0
+        for ch in range(n_channels):
+            j = base
+            for c in range(0, 5 * self.order, 5):
+                b0 = sos[c]
+                b1 = sos[c + 1]
+                b2 = sos[c + 2]
+                a1 = sos[c + 3]
+                a2 = sos[c + 4]
+                u1 = state[j]
+                u2 = state[j + 1]
+                y1 = state[j + 2]
+                y2 = state[j + 3]
+                for i in range(ch, end, n_channels):
+                    if c == 0:
+                        u = src[i] * gain
+                    else:
+                        u = dst[i]
+                    y = b0 * u + b1 * u1 + b2 * u2 - a1 * y1 - a2 * y2
+                    dst[i] = y
+                    u2 = u1
+                    u1 = u
+                    y2 = y1
+                    y1 = y
+                # Input history of this section; its output history is
+                # written by the next section (or below for the last one)
+                state[j] = u1
+                state[j + 1] = u2
+                j += 2
+            state[j] = y1
+            state[j + 1] = y2
+            base += self.state_size
+
+    def retune(self, fs):
+        """New sampling frequency: new coefficients (cached), same state"""
+        self.fs = fs
+        self.sos = butter_bandpass_sos(fs, self.fc_hp, self.fc_lp, self.order)
+
+    def warm_start(self, src, n, gain=1):
+        """
+        Seeds the state of every channel from the first interleaved block
+        (see BandpassFilter.warm_start()): input history at the channel
+        mean, section outputs at 0 (every section blocks DC).
+        """
+        if n <= 0:
+            return
+        n_channels = self.n_channels
+        state = self.state
+        base = 0
+        for ch in range(n_channels):
+            total = 0
+            for i in range(ch, n * n_channels, n_channels):
+                total += src[i]
+            state[base] = total * gain / n
+            state[base + 1] = state[base]
+            for j in range(base + 2, base + self.state_size):
+                state[j] = 0.0
+            base += self.state_size
+
+    def reset(self):
+        """Resets filter memory (used if necessary)"""
+        for i in range(len(self.state)):
+            self.state[i] = 0.0
+
+
+class FixedFilterBank:
+    """
+    FixedBandpassFilter (1st order, integer math) over n_channels
+    interleaved channels: the integer counterpart of FilterBank, same
+    process() / warm_start() / retune() / reset() interface, so main.py can
+    use either. The states are kept in one flat array('l') (x[n-1], y_hp,
+    y_lp per channel, scaled by 2^STATE_BITS); each channel gives exactly
+    what its own FixedBandpassFilter would.
+    """
+
+    STATE_BITS = FixedBandpassFilter.STATE_BITS
+
+    def __init__(self, n_channels, fs, fc_hp=0.5, fc_lp=5.0):
+        """
+        n_channels       : Number of interleaved channels
+        fs, fc_hp, fc_lp : Same as BandpassFilter
+        """
+        if n_channels < 1:
+            raise ValueError('Wrong number of channels:{0}!'.format(n_channels))
+        self.n_channels = n_channels
+        self.fc_hp = fc_hp
+        self.fc_lp = fc_lp
+        self.retune(fs)
+        self.state = array('l', [0] * (3 * n_channels))
+
+    def retune(self, fs):
+        """Sets the sampling frequency, see BandpassFilter.retune()"""
+        self.fs = fs
+        dt = 1.0 / fs
+        rc_lp = 1.0 / (2.0 * math.pi * self.fc_lp)
+        self.c_lp, self.k_lp = FixedBandpassFilter._quantize(dt / (rc_lp + dt))
+        rc_hp = 1.0 / (2.0 * math.pi * self.fc_hp)
+        self.c_hp, self.k_hp = FixedBandpassFilter._quantize(1.0 - rc_hp / (rc_hp + dt))
+
+    def warm_start(self, src, n, gain=1):
+        """Seeds every channel from the first interleaved block, see BandpassFilter.warm_start()"""
+        if n <= 0:
+            return
+        n_channels = self.n_channels
+        state = self.state
+        for ch in range(n_channels):
+            total = 0
+            for i in range(ch, n * n_channels, n_channels):
+                total += src[i]
+            state[3 * ch] = ((total * gain) << self.STATE_BITS) // n
+            state[3 * ch + 1] = 0
+            state[3 * ch + 2] = 0
+
+    @micropython.native
+    def process(self, src, dst, n, gain=1):
+        """
+        Filters n interleaved frames: src[0:n * n_channels] into dst (may be
+        the same buffer), see FixedBandpassFilter.process() (gain must be
+        an integer)
+        """
+        if n <= 0:
+            return
+        c_hp = self.c_hp
+        k_hp = self.k_hp
+        r_hp = (1 << k_hp) >> 1
+        c_lp = self.c_lp
+        k_lp = self.k_lp
+        r_lp = (1 << k_lp) >> 1
+        state = self.state
+        n_channels = self.n_channels
+        end = n * n_channels
+        j = 0
+        for ch in range(n_channels):
+            x_prev = state[j]
+            y_hp = state[j + 1]
+            y_lp = state[j + 2]
+            for i in range(ch, end, n_channels):
+                x = (src[i] * gain) << 8
+                v = y_hp + x - x_prev
+                y_hp = v - ((c_hp * (v >> 15) + ((c_hp * (v & 0x7FFF) + 0x4000) >> 15) + r_hp) >> k_hp)
+                v = y_hp - y_lp
+                y_lp = y_lp + ((c_lp * (v >> 15) + ((c_lp * (v & 0x7FFF) + 0x4000) >> 15) + r_lp) >> k_lp)
+                dst[i] = (y_lp + 0x80) >> 8
+                x_prev = x
+            state[j] = x_prev
+            state[j + 1] = y_hp
+            state[j + 2] = y_lp
+            j += 3
+
+    def reset(self):
+        """Resets filter memory (used if necessary)"""
+        for i in range(len(self.state)):
+            self.state[i] = 0
+
+
+class SOSBandpassFilter(FilterBank):
+    """
+    Butterworth band-pass filter: cascade of `order` second-order sections.
+    Roll-off is order * 20 dB/decade on each side of the band (the 1st
+    order BandpassFilter gives 20), so motion and baseline drift are
+    rejected much better.
+    Direct Form I with shared history: the state holds signal values only
+    (inputs and section outputs), so it stays valid when the coefficients
+    change (retune()). Single channel FilterBank, process() takes a plain
+    block.
+    """
+
+    def __init__(self, fs, fc_hp=0.5, fc_lp=5.0, order=2):
+        """
+        fs, fc_hp, fc_lp : Same as BandpassFilter
+        order            : Number of second-order sections
+        """
+        super().__init__(1, fs, fc_hp, fc_lp, order)
+
+    def step(self, x):
+        """Filters one sample"""
+        sos = self.sos
+        state = self.state
+        u = x
+        j = 0
+        for c in range(0, 5 * self.order, 5):
+            u1 = state[j]
+            u2 = state[j + 1]
+            y = (sos[c] * u + sos[c + 1] * u1 + sos[c + 2] * u2
+                 - sos[c + 3] * state[j + 2] - sos[c + 4] * state[j + 3])
+            state[j + 1] = u1
+            state[j] = u
+            u = y
+            j += 2
+        state[j + 1] = state[j]
+        state[j] = u
+        return u
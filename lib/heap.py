@@ -0,0 +1,108 @@
+import gc
+
+try:
+    from gc import mem_alloc
+
+    def alloc_mark():
+        # Start of an allocation measurement
+        return mem_alloc()
+
+    def alloc_since(mark):
+        # Bytes allocated since alloc_mark(): exact while no collection
+        # runs in between (IdleCollector collects in idle time, before any
+        # automatic collection is due)
+        return mem_alloc() - mark
+except ImportError:
+    # CPython (host tests): tracemalloc, when tracing. Memory is freed as
+    # soon as it is unused, so the measure is the peak above the mark, and
+    # float objects (free list) are not seen.
+    import tracemalloc
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0]
+
+    def alloc_mark():
+        if not tracemalloc.is_tracing():
+            return 0
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def alloc_since(mark):
+        if not tracemalloc.is_tracing():
+            return 0
+        return tracemalloc.get_traced_memory()[1] - mark
+
+
+class IdleCollector(object):
+    ''' Garbage collection on our schedule: one collection in idle time per `budget` bytes allocated, a backstop when idle time never comes '''
+    def __init__(self, budget, backstop=None):
+        # budget: bytes allocated between two idle collections
+        # backstop: bytes allocated after which a collection runs anyway,
+        #           idle or not (default: twice the budget). Keep it well
+        #           under the free heap.
+        # Where the port has gc.threshold(), automatic collections stay on
+        # at the backstop: the idle collections reset the count before it
+        # is reached, an overloaded loop (never idle) or a burst of
+        # allocations still gets collected, and so does a full heap.
+        # Elsewhere automatic collections are off and overdue() is the
+        # backstop, checked by the loop.
+        if budget < 1:
+            raise ValueError('Wrong budget:{0}!'.format(budget))
+        if backstop is None:
+            backstop = 2 * budget
+        if backstop < budget:
+            raise ValueError('Wrong backstop:{0}!'.format(backstop))
+        self.budget = budget
+        self.backstop = backstop
+        self.collections = 0
+        self.forced = 0
+        gc.collect()
+        try:
+            gc.threshold(backstop)
+            self._threshold = True
+        except AttributeError:
+            # CPython, or a port built without the allocation threshold
+            gc.disable()
+            self._threshold = False
+        self._mark = mem_alloc()
+
+    def _spent(self):
+        # Bytes allocated since the last collection
+        allocated = mem_alloc()
+        if allocated < self._mark:
+            # Collected without us (the automatic backstop)
+            self._mark = allocated
+        return allocated - self._mark
+
+    def due(self):
+        return self._spent() >= self.budget
+
+    def overdue(self):
+        # Call on every loop iteration, idle or not: collects if the
+        # backstop is spent (the idle time did not come). Returns True if
+        # it did.
+        if self._spent() >= self.backstop:
+            self.collect()
+            self.forced += 1
+            return True
+        return False
+
+    def collect(self):
+        gc.collect()
+        self.collections += 1
+        self._mark = mem_alloc()
+
+    def idle(self):
+        # Call when there is time to spare (e.g. the FIFO is empty): collects
+        # if the budget is spent. Returns True if it did.
+        if self._spent() >= self.budget:
+            self.collect()
+            return True
+        return False
+
+    def stop(self):
+        # Back to automatic collections, on the port's own schedule
+        if self._threshold:
+            gc.threshold(-1)
+        else:
+            gc.enable()
@@ -1,17 +1,27 @@
 import math
+from array import array
+from analysis import analyze_window
 
-def _refine_peak_index(data, idx):
+# Plausible heart rates (RR intervals outside are discarded)
+HR_MIN_BPM = 40.0
+HR_MAX_BPM = 150.0
+
+def _refine_peak_index(data, idx, offset=0.0, n=None):
     """
     Estimates the exact location (fractional index) of the peak 
     using parabolic interpolation.
+    offset is subtracted from the samples first (e.g. the mean).
+    n: samples of data in use (data[0:n]), all of them by default.
     """
+    if n is None:
+        n = len(data)
     # Boundary check
-    if idx <= 0 or idx >= len(data) - 1:
+    if idx <= 0 or idx >= n - 1:
         return float(idx)
         
-    alpha = data[idx - 1]
-    beta = data[idx]
-    gamma = data[idx + 1]
+    alpha = data[idx - 1] - offset
+    beta = data[idx] - offset
+    gamma = data[idx + 1] - offset
     
     # Avoid processing if denominator is zero (flat line)
     denominator = (alpha - 2 * beta + gamma)
@@ -21,25 +31,32 @@ def _refine_peak_index(data, idx):
     p = 0.5 * (alpha - gamma) / denominator
     return idx + p
 
-def compute_hr(ir_buffer, acq_freq):
+def compute_hr(ir_buffer, acq_freq, analysis=None, n=None):
     """
     Advanced HR calculation with Parabolic Interpolation.
+    analysis: analyze_window() result for ir_buffer if it is already
+    available (e.g. shared with compute_spo2), computed here otherwise.
+    n: the window is ir_buffer[0:n] (e.g. a preallocated array or a
+    memoryview, not copied), all of ir_buffer by default.
     """
 
     # 1. Safety Checks
     if acq_freq is None or acq_freq <= 0: return None
     if ir_buffer is None: return None
-    n = len(ir_buffer)
+    if n is None:
+        n = len(ir_buffer)
     if n < 10: return None
+    if analysis is None:
+        analysis = analyze_window(ir_buffer, n=n, start=0)
 
     # 2. DC Removal (Subtract Mean)
-    mean_val = sum(ir_buffer) / n
-    centered = [x - mean_val for x in ir_buffer]
+    # Samples are centered on the fly: only candidates are looked at
+    mean_val = analysis.ir_mean
 
     # 3. Amplitude Analysis
-    max_c = max(centered)
-    min_c = min(centered)
-    max_abs = max(abs(x) for x in centered)
+    max_c = analysis.ir_max - mean_val
+    min_c = analysis.ir_min - mean_val
+    max_abs = max(abs(max_c), abs(min_c))
 
     # Return if no finger detected or signal is too weak
     AMP_MIN = 1.0 
@@ -55,9 +72,6 @@ def compute_hr(ir_buffer, acq_freq):
     threshold = 0.3 * clamped_max
 
     # 4. Parameters
-    HR_MIN_BPM = 40.0
-    HR_MAX_BPM = 150.0
-    
     # Refractory period (Minimum distance between two peaks)
     # For 150 BPM, at least ~0.4s (400ms) must pass.
     min_rr_seconds = 0.35 
@@ -72,22 +86,19 @@ def compute_hr(ir_buffer, acq_freq):
     peaks_indices = []
     last_peak_idx = -min_samples_between_peaks
 
-    for i in range(1, n - 1):
-        sample = centered[i]
+    # Local maxima only (found by the analysis pass)
+    for i in analysis.candidates:
+        sample = ir_buffer[i] - mean_val
 
         if sample < threshold: continue
 
-        # Is it a local maximum?
-        if not (sample >= centered[i - 1] and sample >= centered[i + 1]):
-            continue
-
         # Is it the "Winner" within the window?
         left = max(0, i - win_samples)
         right = min(n - 1, i + win_samples)
         
         is_winner = True
         for k in range(left, right + 1):
-            if centered[k] > sample:
+            if ir_buffer[k] - mean_val > sample:
                 is_winner = False
                 break
         
@@ -97,7 +108,7 @@ def compute_hr(ir_buffer, acq_freq):
         if (i - last_peak_idx) < min_samples_between_peaks:
             # If the new peak is larger than the previous one, update the previous one.
             # This prevents confusing the T-wave with the P-wave (dicrotic notch issues).
-            if len(peaks_indices) > 0 and sample > centered[peaks_indices[-1]]:
+            if len(peaks_indices) > 0 and sample > ir_buffer[peaks_indices[-1]] - mean_val:
                 peaks_indices[-1] = i # Update
                 last_peak_idx = i
             continue
@@ -112,11 +123,11 @@ def compute_hr(ir_buffer, acq_freq):
     refined_rr_intervals = []
     
     # Refine the first peak
-    prev_refined_idx = _refine_peak_index(centered, peaks_indices[0])
+    prev_refined_idx = _refine_peak_index(ir_buffer, peaks_indices[0], mean_val, n)
 
     for k in range(1, len(peaks_indices)):
         curr_idx = peaks_indices[k]
-        curr_refined_idx = _refine_peak_index(centered, curr_idx)
+        curr_refined_idx = _refine_peak_index(ir_buffer, curr_idx, mean_val, n)
         
         # Calculate precise difference (float difference)
         sample_diff = curr_refined_idx - prev_refined_idx
@@ -125,12 +136,23 @@ def compute_hr(ir_buffer, acq_freq):
         refined_rr_intervals.append(dt_seconds)
         prev_refined_idx = curr_refined_idx
 
+    hr_bpm = hr_from_rr(refined_rr_intervals)
+    if hr_bpm is None:
+        return None
+
+    return hr_bpm, peaks_indices
+
+def hr_from_rr(rr_intervals):
+    """
+    HR (BPM) from the median of the plausible RR intervals (seconds),
+    None if there is none.
+    """
     # 6. Filtering and Median
     valid_rr = []
     rr_min_limit = 60.0 / HR_MAX_BPM
     rr_max_limit = 60.0 / HR_MIN_BPM
     
-    for rr in refined_rr_intervals:
+    for rr in rr_intervals:
         if rr_min_limit <= rr <= rr_max_limit:
             valid_rr.append(rr)
 
@@ -146,6 +168,220 @@ def compute_hr(ir_buffer, acq_freq):
 
     if median_rr <= 0: return None
 
-    hr_bpm = 60.0 / median_rr
+    return 60.0 / median_rr
+
+
+class StreamingPeakDetector:
+    """
+    Beat detector for a continuous stream of filtered samples. Same rules
+    as compute_hr() (threshold, +/-50ms winner window, refractory period
+    with replacement, parabolic refinement) at a constant cost per sample:
+    - Winner test: sliding maximum over the +/-50ms window (monotonic
+      deque of sample indices)
+    - DC removal: exponential mean instead of the window mean
+    - Threshold: 0.3 * decaying envelope of |x - mean| (same clamping)
+      instead of 0.3 * the window max_abs
+    A beat is confirmed once no later peak can replace it (refractory
+    period over), about 0.4 s after it instead of at the end of a window;
+    beats are not lost at window boundaries.
+    Indices are absolute: every sample given to update()/process() counts,
+    and so do the ones declared lost with skip().
+    """
+
+    MIN_RR_SECONDS = 0.35  # Refractory period
+    WIN_SECONDS = 0.05     # Peak search window (+/-)
+
+    def __init__(self, fs, max_beats=16, mean_seconds=1.0, envelope_seconds=2.0):
+        """
+        fs               : Sampling frequency (Hz)
+        max_beats        : Confirmed beats kept until pop_beat() (the
+                           oldest are dropped beyond)
+        mean_seconds     : Time constant of the exponential mean
+        envelope_seconds : Time constant of the envelope decay
+        """
+        self.mean_seconds = mean_seconds
+        self.envelope_seconds = envelope_seconds
+
+        # Confirmed beats: ring of (index, RR in seconds at the rate in
+        # effect when the beat was confirmed, -1 for none)
+        self.max_beats = max_beats
+        self._beat_index = array('l', [0] * max_beats)
+        self._beat_rr = array('f', [0.0] * max_beats)
+        self._beat_head = 0
+        self._beat_count = 0
+
+        self.index = 0  # Absolute index of the next sample
+        self._hist_size = 0
+        self.retune(fs)
+        self.reset()
+
+    def retune(self, fs):
+        """
+        New sampling frequency. The detection goes on with its history: the
+        beats already confirmed keep their RR at the previous rate, the
+        pending one and the next ones are measured at the new rate
+        """
+        self.fs = fs
+        self.min_distance = int(fs * self.MIN_RR_SECONDS)
+        if self.min_distance < 1: self.min_distance = 1
+        self.win = int(fs * self.WIN_SECONDS)
+        if self.win < 1: self.win = 1
+        self._alpha_mean = 1.0 / (self.mean_seconds * fs)
+        self._decay = math.exp(-1.0 / (self.envelope_seconds * fs))
+
+        # Centered samples of the last 2*win+2 indices (at least), and the
+        # deque of indices whose values decrease from front to back. Sized
+        # for the largest window seen: a rate jittering around a window
+        # boundary (e.g. int(fs * 0.05) = 4 or 5 at 100 Hz) does not
+        # reallocate; a larger window copies the history over.
+        if 2 * self.win + 2 > self._hist_size:
+            self._grow(2 * self.win + 2)
+
+    def _grow(self, size):
+        old_size = self._hist_size
+        hist = array('f', [0.0] * size)
+        dq = array('l', [0] * size)
+        if old_size:
+            t = self.index
+            for j in range(max(t - old_size, 0), t):
+                hist[j % size] = self._hist[j % old_size]
+            for k in range(self._dq_count):
+                dq[k] = self._deque[(self._dq_head + k) % old_size]
+            self._dq_head = 0
+        self._hist = hist
+        self._deque = dq
+        self._hist_size = size
+
+    def reset(self):
+        """Forgets the signal history (the absolute index goes on)"""
+        self._seen = 0
+        self._mean = 0.0
+        self._envelope = 0.0
+        self._dq_head = 0
+        self._dq_count = 0
+        # Peak waiting for the end of its refractory period
+        self._pending = False
+        self._last_peak = 0
+        self._last_value = 0.0
+        self._last_offset = 0.0
+        # Last confirmed beat (RR reference), -1: none
+        self._last_beat = -1
+        self._last_beat_offset = 0.0
+
+    def skip(self, n):
+        """
+        n samples were lost: their indices are skipped. The pending peak is
+        confirmed as it is and the next beat starts a new RR sequence.
+        """
+        if self._pending:
+            self._confirm()
+        self.index += n
+        self.reset()
+
+    def update(self, x):
+        """Adds one sample"""
+        t = self.index
+        self.index = t + 1
+        hist = self._hist
+        size = self._hist_size
+
+        # 1. DC removal and envelope
+        if self._seen == 0:
+            self._mean = x
+        self._mean += self._alpha_mean * (x - self._mean)
+        c = x - self._mean
+        envelope = self._envelope * self._decay
+        if c > envelope:
+            envelope = c
+        elif -c > envelope:
+            envelope = -c
+        self._envelope = envelope
+        hist[t % size] = c
+        self._seen += 1
+
+        # 2. Sliding maximum over the last 2*win+1 samples
+        dq = self._deque
+        head = self._dq_head
+        count = self._dq_count
+        while count and hist[dq[(head + count - 1) % size] % size] <= c:
+            count -= 1
+        dq[(head + count) % size] = t
+        count += 1
+        # (more than one index leaves the window after a retune to a
+        # shorter one)
+        while dq[head] <= t - 2 * self.win - 1:
+            head = (head + 1) % size
+            count -= 1
+        self._dq_head = head
+        self._dq_count = count
+
+        # 3. Sample t - win has its whole window: is it a beat?
+        if self._seen <= 2 * self.win:
+            return
+        i = t - self.win
+        if self._pending and i - self._last_peak >= self.min_distance:
+            self._confirm()
+        sample = hist[i % size]
+        threshold = 0.3 * min(envelope, 2000.0)
+        if envelope == 0.0 or sample < threshold:
+            return
+        if sample < hist[dq[head] % size]:
+            return
+        if self._pending and sample <= self._last_value:
+            # Refractory period (a pending peak is always within it): only
+            # a larger peak replaces the last one
+            return
+        # Parabolic refinement (neighbours are still in the history)
+        alpha = hist[(i - 1) % size]
+        gamma = hist[(i + 1) % size]
+        denominator = alpha - 2 * sample + gamma
+        if denominator == 0:
+            offset = 0.0
+        else:
+            offset = 0.5 * (alpha - gamma) / denominator
+        self._pending = True
+        self._last_peak = i
+        self._last_value = sample
+        self._last_offset = offset
+
+    def process(self, src, n, start=0, step=1):
+        """
+        Adds src[start], src[start + step], ... (n samples), e.g. one
+        channel of an interleaved block
+        """
+        for i in range(start, start + n * step, step):
+            self.update(src[i])
+
+    def _confirm(self):
+        self._pending = False
+        i = self._beat_head + self._beat_count
+        if self._beat_count == self.max_beats:
+            self._beat_head = (self._beat_head + 1) % self.max_beats
+        else:
+            self._beat_count += 1
+        i %= self.max_beats
+        self._beat_index[i] = self._last_peak
+        if self._last_beat < 0:
+            self._beat_rr[i] = -1.0
+        else:
+            self._beat_rr[i] = (self._last_peak - self._last_beat
+                                + self._last_offset - self._last_beat_offset) / self.fs
+        self._last_beat = self._last_peak
+        self._last_beat_offset = self._last_offset
+
+    def available(self):
+        """Number of confirmed beats waiting in pop_beat()"""
+        return self._beat_count
 
-    return hr_bpm, peaks_indices
\ No newline at end of file
+    def pop_beat(self):
+        """
+        Oldest confirmed beat as (absolute sample index, RR interval in
+        seconds since the previous beat or None), None if there is none
+        """
+        if self._beat_count == 0:
+            return None
+        i = self._beat_head
+        self._beat_head = (i + 1) % self.max_beats
+        self._beat_count -= 1
+        rr = self._beat_rr[i]
+        return self._beat_index[i], (rr if rr >= 0 else None)
@@ -0,0 +1,113 @@
+from array import array
+
+
+class HRVEngine(object):
+    ''' Rolling HRV metrics (mean HR, SDNN, RMSSD, pNN50) of an RR stream, in fixed-size time buckets '''
+    def __init__(self, horizons=(60, 300), bucket_seconds=10):
+        # horizons: time spans (s) metrics() can be asked for
+        # bucket_seconds: time resolution of the horizons; memory is
+        #                 max(horizons) / bucket_seconds buckets, however
+        #                 many intervals they hold
+        self.horizons = horizons
+        self.bucket_seconds = bucket_seconds
+        n = (max(horizons) + bucket_seconds - 1) // bucket_seconds
+        self.n_buckets = n
+        # Per bucket: RR count, sum and sum of squares; successive
+        # differences count, sum of squares and count above 50 ms
+        self._n = array('l', [0] * n)
+        self._sum = array('f', [0.0] * n)
+        self._sum_sq = array('f', [0.0] * n)
+        self._n_diff = array('l', [0] * n)
+        self._sum_sq_diff = array('f', [0.0] * n)
+        self._nn50 = array('l', [0] * n)
+        self.reset()
+
+    def reset(self):
+        for i in range(self.n_buckets):
+            self._clear_bucket(i)
+        self._bucket = 0
+        # End time of the current bucket (None: no time seen yet)
+        self._bucket_end = None
+        self._last_rr = None
+
+    def _clear_bucket(self, i):
+        self._n[i] = 0
+        self._sum[i] = 0.0
+        self._sum_sq[i] = 0.0
+        self._n_diff[i] = 0
+        self._sum_sq_diff[i] = 0.0
+        self._nn50[i] = 0
+
+    def advance(self, t):
+        # Moves the horizons forward to time t (s); the buckets that leave
+        # the longest horizon are cleared. O(1) per bucket passed.
+        if self._bucket_end is None:
+            self._bucket_end = t + self.bucket_seconds
+            return
+        passed = 0
+        while t >= self._bucket_end and passed < self.n_buckets:
+            self._bucket = (self._bucket + 1) % self.n_buckets
+            self._clear_bucket(self._bucket)
+            self._bucket_end += self.bucket_seconds
+            passed += 1
+        if t >= self._bucket_end:
+            # Longer silence than the longest horizon: start from t
+            self._bucket_end = t + self.bucket_seconds
+
+    def add(self, rr, t):
+        # rr: RR interval (s) of the beat at time t (s). None breaks the
+        # sequence of successive differences (lost samples, rejected beat)
+        self.advance(t)
+        if rr is None:
+            self._last_rr = None
+            return
+        b = self._bucket
+        self._n[b] += 1
+        self._sum[b] += rr
+        self._sum_sq[b] += rr * rr
+        if self._last_rr is not None:
+            diff = rr - self._last_rr
+            self._n_diff[b] += 1
+            self._sum_sq_diff[b] += diff * diff
+            if diff > 0.05 or diff < -0.05:
+                self._nn50[b] += 1
+        self._last_rr = rr
+
+    def metrics(self, horizon):
+        # Metrics over the last `horizon` seconds (rounded up to whole
+        # buckets, the current one included), None with fewer than 2 RR
+        k = (horizon + self.bucket_seconds - 1) // self.bucket_seconds
+        if k > self.n_buckets:
+            k = self.n_buckets
+        n = 0
+        total = 0.0
+        total_sq = 0.0
+        n_diff = 0
+        total_sq_diff = 0.0
+        nn50 = 0
+        b = self._bucket
+        for i in range(k):
+            n += self._n[b]
+            total += self._sum[b]
+            total_sq += self._sum_sq[b]
+            n_diff += self._n_diff[b]
+            total_sq_diff += self._sum_sq_diff[b]
+            nn50 += self._nn50[b]
+            b = b - 1 if b > 0 else self.n_buckets - 1
+        if n < 2:
+            return None
+        mean_rr = total / n
+        variance = (total_sq - total * mean_rr) / (n - 1)
+        if variance < 0.0:
+            variance = 0.0  # Rounding, constant RR
+        result = {
+            "n": n,
+            "mean_hr": 60.0 / mean_rr,
+            "sdnn_ms": 1000.0 * variance ** 0.5,
+            "rmssd_ms": None,
+            "pnn50": None,
+        }
+        if n_diff:
+            result["rmssd_ms"] = 1000.0 * (total_sq_diff / n_diff) ** 0.5
+            result["pnn50"] = 100.0 * nn50 / n_diff
+        return result
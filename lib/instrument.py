@@ -0,0 +1,186 @@
+from array import array
+from utime import ticks_diff, ticks_us
+
+from heap import alloc_mark, alloc_since
+
+
+class Instrumentation(object):
+    ''' Stage timers, value histograms and counters in preallocated arrays: recording allocates nothing '''
+    def __init__(self, stages, values=(), counters=(), n_buckets=16, first_us=32,
+                 n_value_buckets=9, value_width=4, alloc=False):
+        # stages: names of the timed stages (indices for lap() / record())
+        # values: names of the quantities seen by record_value()
+        # counters: names of the counters seen by count()
+        # Stage times go into n_buckets log2 buckets: [0, first_us),
+        # [first_us, 2 * first_us), ... the last one takes everything above.
+        # Values go into n_value_buckets buckets of value_width, the last one
+        # takes everything above.
+        # alloc: profiler mode, lap() also counts the bytes allocated by each
+        # stage (see heap.alloc_since(), costs an extra measure per lap)
+        if n_buckets < 2 or first_us < 1:
+            raise ValueError('Wrong buckets:{0}, {1}!'.format(n_buckets, first_us))
+        if n_value_buckets < 2 or value_width < 1:
+            raise ValueError('Wrong value buckets:{0}, {1}!'.format(n_value_buckets, value_width))
+        self.stages = tuple(stages)
+        self.values = tuple(values)
+        self.counters = tuple(counters)
+        self.n_buckets = n_buckets
+        self.first_us = first_us
+        self.n_value_buckets = n_value_buckets
+        self.value_width = value_width
+        n_stages = len(self.stages)
+        n_values = len(self.values)
+        self._hist = array('L', [0] * (n_stages * n_buckets))
+        self._n = array('L', [0] * n_stages)
+        self._total_us = array('L', [0] * n_stages)
+        self._max_us = array('L', [0] * n_stages)
+        self._value_hist = array('L', [0] * (n_values * n_value_buckets))
+        self._value_n = array('L', [0] * n_values)
+        self._value_total = array('L', [0] * n_values)
+        self._value_max = array('L', [0] * n_values)
+        self._counts = array('L', [0] * len(self.counters))
+        self.alloc = alloc
+        self._alloc = array('L', [0] * n_stages)
+        self._alloc_mark = 0
+        # Measured cost of one record, and bytes the allocation measure of a
+        # lap shows for an empty stage, taken off every lap (calibrate())
+        self.cost_us = 0.0
+        self.alloc_cost = 0
+        self._period_start = ticks_us()
+
+    def reset(self):
+        # Starts a new reporting period
+        for a in (self._hist, self._n, self._total_us, self._max_us, self._value_hist,
+                  self._value_n, self._value_total, self._value_max, self._counts,
+                  self._alloc):
+            for i in range(len(a)):
+                a[i] = 0
+        self._period_start = ticks_us()
+
+    def record(self, stage, dt):
+        # One run of a stage that took dt µs
+        if dt < 0:
+            dt = 0
+        b = 0
+        bound = self.first_us
+        last = self.n_buckets - 1
+        while b < last and dt >= bound:
+            bound <<= 1
+            b += 1
+        self._hist[stage * self.n_buckets + b] += 1
+        self._n[stage] += 1
+        self._total_us[stage] += dt
+        if dt > self._max_us[stage]:
+            self._max_us[stage] = dt
+
+    def start(self):
+        # Start of a chain of stages: returns the start time for lap()
+        if self.alloc:
+            self._alloc_mark = alloc_mark()
+        return ticks_us()
+
+    def lap(self, stage, t0):
+        # Records the stage that started at t0 (start() or the previous
+        # lap()) and returns the end time: the start of the next stage, one
+        # ticks_us() per boundary
+        t = ticks_us()
+        self.record(stage, ticks_diff(t, t0))
+        if self.alloc:
+            used = alloc_since(self._alloc_mark) - self.alloc_cost
+            # Negative if a collection ran in the stage
+            if used > 0:
+                self._alloc[stage] += used
+            self._alloc_mark = alloc_mark()
+        return t
+
+    def record_value(self, index, value):
+        # One observation of a non-negative integer quantity
+        b = value // self.value_width
+        if b >= self.n_value_buckets:
+            b = self.n_value_buckets - 1
+        self._value_hist[index * self.n_value_buckets + b] += 1
+        self._value_n[index] += 1
+        self._value_total[index] += value
+        if value > self._value_max[index]:
+            self._value_max[index] = value
+
+    def count(self, index, n=1):
+        self._counts[index] += n
+
+    def records(self):
+        # Timed and value records of the period (what cost_us applies to)
+        n = 0
+        for a in (self._n, self._value_n):
+            for i in range(len(a)):
+                n += a[i]
+        return n
+
+    def calibrate(self, n=200):
+        # Measures the cost of one lap() on this CPU (cost_us) and, in
+        # profiler mode, what the allocation measure shows for an empty stage
+        # (alloc_cost: CPython int and tuple objects, none on the board).
+        # Then starts a new period.
+        if self.alloc:
+            # Median of n empty laps (the host shows a few outliers)
+            self.alloc_cost = 0
+            shown = []
+            t = self.start()
+            for _ in range(n):
+                before = self._alloc[0]
+                t = self.lap(0, t)
+                shown.append(self._alloc[0] - before)
+            shown.sort()
+            self.alloc_cost = shown[n // 2]
+        t0 = self.start()
+        t = t0
+        for _ in range(n):
+            t = self.lap(0, t)
+        self.cost_us = ticks_diff(ticks_us(), t0) / n
+        self.reset()
+        return self.cost_us
+
+    def report(self, samples=None):
+        # Statistics of the period (allocates: once per report). samples:
+        # samples acquired in the period, for the bytes allocated per sample
+        period_us = ticks_diff(ticks_us(), self._period_start)
+        nb = self.n_buckets
+        stages = {}
+        for s in range(len(self.stages)):
+            n = self._n[s]
+            if n:
+                stages[self.stages[s]] = {
+                    "n": n,
+                    "mean_us": self._total_us[s] / n,
+                    "max_us": self._max_us[s],
+                    "hist": list(self._hist[s * nb:(s + 1) * nb]),
+                }
+                if self.alloc:
+                    stages[self.stages[s]]["alloc_bytes"] = self._alloc[s]
+                    if samples:
+                        stages[self.stages[s]]["alloc_per_sample"] = self._alloc[s] / samples
+        nv = self.n_value_buckets
+        values = {}
+        for v in range(len(self.values)):
+            n = self._value_n[v]
+            values[self.values[v]] = {
+                "n": n,
+                "mean": self._value_total[v] / n if n else None,
+                "max": self._value_max[v],
+                "hist": list(self._value_hist[v * nv:(v + 1) * nv]),
+            }
+        counters = {}
+        for c in range(len(self.counters)):
+            counters[self.counters[c]] = self._counts[c]
+        overhead_us = self.records() * self.cost_us
+        return {
+            "period_us": period_us,
+            "first_bucket_us": self.first_us,
+            "value_bucket": self.value_width,
+            "stages": stages,
+            "values": values,
+            "counters": counters,
+            # Time spent recording, and its share of the period
+            "cost_us": self.cost_us,
+            "overhead_us": overhead_us,
+            "overhead_load": overhead_us / period_us if period_us > 0 else None,
+        }
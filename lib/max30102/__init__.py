@@ -12,13 +12,17 @@
 #   A port of the library to MicroPython by kandizzy
 #
 # This driver aims at giving almost full access to Maxim MAX30102 functionalities.
+# The INT line can be used to drain the FIFO on interrupts, see enable_interrupt().
 #                                                                          n-elia
 
-from machine import I2C, SoftI2C
-from ustruct import unpack
-from utime import sleep_ms, ticks_diff, ticks_ms
+from array import array
+
+from machine import I2C, Pin, SoftI2C
+from micropython import schedule
+from utime import sleep_ms, ticks_diff, ticks_ms, ticks_us
 
 from max30102.circular_buffer import CircularBuffer
+from max30102.sample_clock import SampleClock
 
 # I2C address (7-bit address)
 MAX3010X_I2C_ADDRESS = 0x57  # Right-shift of 0xAE, 0xAF
@@ -152,9 +156,45 @@ SLOT_GREEN_PILOT = 0x07
 
 MAX_30105_EXPECTED_PART_ID = 0x15
 
+# Configuration registers mirrored by the driver's shadow cache
+MAX30105_SHADOWED_REGISTERS = (
+    MAX30105_INT_ENABLE_1,
+    MAX30105_INT_ENABLE_2,
+    MAX30105_FIFO_CONFIG,
+    MAX30105_MODE_CONFIG,
+    MAX30105_PARTICLE_CONFIG,
+    MAX30105_LED1_PULSE_AMP,
+    MAX30105_LED2_PULSE_AMP,
+    MAX30105_LED3_PULSE_AMP,
+    MAX30105_LED_PROX_AMP,
+    MAX30105_MULTI_LED_CONFIG_1,
+    MAX30105_MULTI_LED_CONFIG_2,
+    MAX30105_PROX_INT_THRESH,
+)
+
+# Settings accepted by apply_config() and the setter used for each of them,
+# in the order they are applied
+CONFIG_SETTERS = (
+    ('sample_avg', 'set_fifo_average'),
+    ('led_mode', 'set_led_mode'),
+    ('adc_range', 'set_adc_range'),
+    ('sample_rate', 'set_sample_rate'),
+    ('pulse_width', 'set_pulse_width'),
+    ('led_power', 'set_active_leds_amplitude'),
+    ('red_amplitude', 'set_pulse_amplitude_red'),
+    ('ir_amplitude', 'set_pulse_amplitude_it'),
+    ('green_amplitude', 'set_pulse_amplitude_green'),
+    ('proximity_amplitude', 'set_pulse_amplitude_proximity'),
+    ('proximity_threshold', 'set_proximity_threshold'),
+)
+
 # Size of the queued readings
 STORAGE_QUEUE_SIZE = 64
 
+# Depth of the sensor FIFO (samples) and largest sample size (3 LEDs x 3 bytes)
+MAX30105_FIFO_DEPTH = 32
+MAX30105_MAX_SAMPLE_BYTES = 9
+
 
 # Data structure to hold the last readings
 class SensorData:
@@ -162,6 +202,10 @@ class SensorData:
         self.red = CircularBuffer(STORAGE_QUEUE_SIZE)
         self.IR = CircularBuffer(STORAGE_QUEUE_SIZE)
         self.green = CircularBuffer(STORAGE_QUEUE_SIZE)
+        # Samples lost in the sensor FIFO (overflow counter), per channel
+        self.red_lost = 0
+        self.IR_lost = 0
+        self.green_lost = 0
 
 
 # Sensor class
@@ -180,8 +224,41 @@ class MAX30102(object):
         self._sample_avg = None
         self._acq_frequency = None
         self._acq_frequency_inv = None
+        # Real acquisition frequency, measured from the drained blocks
+        self.clock = SampleClock()
+        # Shadow copy of the configuration registers (register -> value) and
+        # the writes collected by apply_config()
+        self._shadow = {}
+        self._staged = None
         # Circular buffer of readings from the sensor
         self.sense = SensorData()
+        # Preallocated I2C buffers: FIFO pointers and a whole FIFO burst
+        self._ptr_buf = bytearray(3)
+        self._fifo_buf = bytearray(MAX30105_FIFO_DEPTH * MAX30105_MAX_SAMPLE_BYTES)
+        self._fifo_mv = memoryview(self._fifo_buf)
+        # Views of the first k samples of the burst buffer, k = 0..FIFO depth
+        # (slicing at every drain would allocate), for samples of
+        # _fifo_views_size bytes
+        self._fifo_views = None
+        self._fifo_views_size = 0
+        # Decoded samples of the last burst, one preallocated array per LED
+        self._red_block = array('l', [0] * MAX30105_FIFO_DEPTH)
+        self._ir_block = array('l', [0] * MAX30105_FIFO_DEPTH)
+        self._green_block = array('l', [0] * MAX30105_FIFO_DEPTH)
+        # Interrupt-driven acquisition state (see enable_interrupt())
+        self._int_pin = None
+        self._irq_pending = False
+        self._storage_busy = False
+        # Bound once here: creating it inside the IRQ handler would allocate
+        self._drain_cb = self._scheduled_drain
+        self.irq_count = 0
+        # Die temperature conversion state (see start_temperature())
+        self._temp_pending = False
+        self._temp_use_int = False
+        self._temp_ready = False
+        self._temp_buf = bytearray(2)
+        # INT_STAT_1 and INT_STAT_2, read by every interrupt drain
+        self._int_buf = bytearray(2)
 
     # Sensor setup method
     def setup_sensor(self, led_mode=2, adc_range=16384, sample_rate=400,
@@ -218,6 +295,42 @@ class MAX30102(object):
         # Clears the FIFO
         self.clear_fifo()
 
+    def apply_config(self, config):
+        # Apply several settings at once, e.g.
+        #   apply_config({'sample_rate': 100, 'pulse_width': 215})
+        # (keys are listed in CONFIG_SETTERS). Each register is written at
+        # most once, only if its value changes: sample rate, ADC range and
+        # pulse width share a register and cost a single write together.
+        # If a value is rejected, nothing is written. Returns the number of
+        # register writes.
+        known_keys = [name for name, _ in CONFIG_SETTERS]
+        for key in config:
+            if key not in known_keys:
+                raise ValueError('Wrong config key:{0}!'.format(key))
+
+        saved = (self._active_leds, self._multi_led_read_mode,
+                 self._pulse_width, self._sample_rate, self._sample_avg)
+        self._staged = {}
+        try:
+            for key, setter in CONFIG_SETTERS:
+                if key in config:
+                    getattr(self, setter)(config[key])
+            staged = self._staged
+        except ValueError:
+            (self._active_leds, self._multi_led_read_mode, self._pulse_width,
+             self._sample_rate, self._sample_avg) = saved
+            self.update_acquisition_frequency()
+            raise
+        finally:
+            self._staged = None
+
+        writes = 0
+        for REGISTER in MAX30105_SHADOWED_REGISTERS:
+            if REGISTER in staged:
+                if self.write_config_register(REGISTER, staged[REGISTER]):
+                    writes += 1
+        return writes
+
     def __del__(self):
         self.shutdown()
 
@@ -280,12 +393,17 @@ class MAX30102(object):
         # and data registers are reset to their power-on-state through
         # a power-on reset. The RESET bit is cleared automatically back to zero
         # after the reset sequence is completed. (datasheet pag. 19)
-        self.set_bitmask(MAX30105_MODE_CONFIG, MAX30105_RESET_MASK, MAX30105_RESET)
+        mode = ord(self.i2c_read_register(MAX30105_MODE_CONFIG))
+        self.i2c_set_register(MAX30105_MODE_CONFIG,
+                              (mode & MAX30105_RESET_MASK) | MAX30105_RESET)
         curr_status = -1
         while not ((curr_status & MAX30105_RESET) == 0):
             sleep_ms(10)
             curr_status = ord(self.i2c_read_register(MAX30105_MODE_CONFIG))
 
+        # The shadow copy no longer matches the registers
+        self.invalidate_shadow()
+
     # Power states methods
     def shutdown(self):
         # Put IC into low power mode (datasheet pg. 19)
@@ -405,22 +523,22 @@ class MAX30102(object):
             self.set_pulse_amplitude_green(amplitude)
 
     def set_pulse_amplitude_red(self, amplitude):
-        self.i2c_set_register(MAX30105_LED1_PULSE_AMP, amplitude)
+        self.write_config_register(MAX30105_LED1_PULSE_AMP, amplitude)
 
     def set_pulse_amplitude_it(self, amplitude):
-        self.i2c_set_register(MAX30105_LED2_PULSE_AMP, amplitude)
+        self.write_config_register(MAX30105_LED2_PULSE_AMP, amplitude)
 
     def set_pulse_amplitude_green(self, amplitude):
-        self.i2c_set_register(MAX30105_LED3_PULSE_AMP, amplitude)
+        self.write_config_register(MAX30105_LED3_PULSE_AMP, amplitude)
 
     def set_pulse_amplitude_proximity(self, amplitude):
-        self.i2c_set_register(MAX30105_LED_PROX_AMP, amplitude)
+        self.write_config_register(MAX30105_LED_PROX_AMP, amplitude)
 
     def set_proximity_threshold(self, thresh_msb):
         # Set the IR ADC count that will trigger the beginning of particle-
         # sensing mode.The threshMSB signifies only the 8 most significant-bits
         # of the ADC count. (datasheet page 24)
-        self.i2c_set_register(MAX30105_PROX_INT_THRESH, thresh_msb)
+        self.write_config_register(MAX30105_PROX_INT_THRESH, thresh_msb)
 
     # FIFO averaged samples number Configuration
     def set_fifo_average(self, number_of_samples):
@@ -458,9 +576,21 @@ class MAX30102(object):
             # (see note in setSampleRate() method)
             self._acq_frequency_inv = int(ceil(1000 / self._acq_frequency))
 
+            if self.clock.nominal_hz != self._acq_frequency:
+                self.clock.reset(self._acq_frequency)
+
     def get_acquisition_frequency(self):
         return self._acq_frequency
 
+    def get_active_leds(self):
+        # Number of channels per sample (1: red, 2: red + IR, 3: + green)
+        return self._active_leds
+
+    def get_estimated_frequency(self):
+        # Acquisition frequency locked on the sensor's own clock (falls back
+        # to the configured one until the first measurement is available)
+        return self.clock.rate
+
     def clear_fifo(self):
         # Resets all points to start in a known state
         # Datasheet page 15 recommends clearing FIFO before beginning a read
@@ -482,6 +612,64 @@ class MAX30102(object):
         # 32 samples, 0x0F is 17 samples
         self.set_bitmask(MAX30105_FIFO_CONFIG, MAX30105_A_FULL_MASK, number_of_samples)
 
+    # Interrupt-driven acquisition
+    def enable_interrupt(self, int_pin, number_of_samples=24):
+        # Drain the FIFO when the INT line signals 'almost full' instead of
+        # polling check(). int_pin is a machine.Pin (input, pull-up) wired to
+        # INT, or any object with a compatible irq() method. The active-low
+        # line falls when the FIFO holds number_of_samples samples (17-32).
+        # Samples are then read with pop_red_ir_from_storage(); do not call
+        # check() from the main loop in this mode.
+        if not 17 <= number_of_samples <= MAX30105_FIFO_DEPTH:
+            raise ValueError(
+                'Wrong number of samples:{0}!'.format(number_of_samples))
+        self.set_fifo_almost_full(MAX30105_FIFO_DEPTH - number_of_samples)
+        self.enable_a_full()
+        self._int_pin = int_pin
+        int_pin.irq(handler=self._irq_handler, trigger=Pin.IRQ_FALLING)
+        # Reading the status clears interrupts already asserted (e.g. PWR_RDY)
+        self.get_int_1()
+
+    def disable_interrupt(self):
+        # Go back to polling with check()
+        if self._int_pin is not None:
+            self._int_pin.irq(handler=None)
+            self._int_pin = None
+        self.disable_a_full()
+        self._irq_pending = False
+
+    def _irq_handler(self, pin):
+        # Interrupt context: no I2C and no allocation, just defer the drain
+        self.irq_count += 1
+        try:
+            schedule(self._drain_cb, 0)
+        except RuntimeError:
+            # Schedule queue full: service() will catch up
+            self._irq_pending = True
+
+    def _scheduled_drain(self, _):
+        # Scheduled callbacks run between bytecodes of the main loop, so a
+        # drain must not interleave with a pop from storage.
+        # Both status registers in one read: only reading INT_STAT_1 clears
+        # A_FULL (datasheet pag. 12), otherwise INT stays low and no new
+        # falling edge ever comes. INT_STAT_2 tells whether the interrupt
+        # signals the end of a temperature conversion (and clears it).
+        status = self._int_buf
+        self.i2c_read_register_into(MAX30105_INT_STAT_1, status)
+        if self._temp_pending and self._temp_use_int and status[1] & MAX30105_INT_DIE_TEMP_RDY_ENABLE:
+            self._temp_ready = True
+        if self._storage_busy:
+            self._irq_pending = True
+            return
+        self._irq_pending = False
+        self.check()
+
+    def service(self):
+        # Call from the main loop when idle: runs a drain whose interrupt
+        # could not be handled by its scheduled callback
+        if self._irq_pending:
+            self._scheduled_drain(0)
+
     def get_write_pointer(self):
         # Read the FIFO Write Pointer from the register
         wp = self.i2c_read_register(MAX30105_FIFO_WRITE_PTR)
@@ -492,30 +680,63 @@ class MAX30102(object):
         wp = self.i2c_read_register(MAX30105_FIFO_READ_PTR)
         return wp
 
-    # Die Temperature method: returns the temperature in C
-    def read_temperature(self):
-        # DIE_TEMP_RDY interrupt must be enabled
+    # Die Temperature methods: return the temperature in C
+    def start_temperature(self, use_interrupt=False):
+        # Start one die temperature conversion (about 29ms, datasheet pg. 23)
+        # and return at once; the result comes from poll_temperature().
+        # With use_interrupt the DIE_TEMP_RDY flag signals the end of the
+        # conversion: if the INT line is attached (enable_interrupt()) the
+        # interrupt handler picks it up, so polling costs no I2C at all
+        # until the value is ready.
+        if use_interrupt != self._temp_use_int:
+            if use_interrupt:
+                self.enable_die_temp_rdy()
+            else:
+                self.disable_die_temp_rdy()
+            self._temp_use_int = use_interrupt
+        self._temp_ready = False
+        self._temp_pending = True
         # Config die temperature register to take 1 temperature sample
         self.i2c_set_register(MAX30105_DIE_TEMP_CONFIG, 0x01)
 
-        # Poll for bit to clear, reading is then complete
-        reading = ord(self.i2c_read_register(MAX30105_INT_STAT_2))
-        sleep_ms(100)
-        while (reading & MAX30105_INT_DIE_TEMP_RDY_ENABLE) > 0:
-            reading = ord(self.i2c_read_register(MAX30105_INT_STAT_2))
-            sleep_ms(1)
-
-        # Read die temperature register (integer)
-        tempInt = ord(self.i2c_read_register(MAX30105_DIE_TEMP_INT))
-        # Causes the clearing of the DIE_TEMP_RDY interrupt
-        tempFrac = ord(self.i2c_read_register(MAX30105_DIE_TEMP_FRAC))
+    def poll_temperature(self):
+        # Returns the temperature of the conversion started by
+        # start_temperature(), or None while it is still running
+        if not self._temp_pending:
+            return None
+        if self._temp_use_int:
+            if self._int_pin is None:
+                self._temp_ready = bool(ord(self.get_int_2())
+                                        & MAX30105_INT_DIE_TEMP_RDY_ENABLE)
+            if not self._temp_ready:
+                return None
+        elif ord(self.i2c_read_register(MAX30105_DIE_TEMP_CONFIG)) & 0x01:
+            # TEMP_EN clears itself when the conversion is complete
+            return None
+        self._temp_pending = False
+        self._temp_ready = False
+
+        # Integer and fractional registers in one read (reading the fraction
+        # clears the DIE_TEMP_RDY interrupt)
+        temp = self._temp_buf
+        self.i2c_read_register_into(MAX30105_DIE_TEMP_INT, temp)
 
         # Calculate temperature (datasheet pg. 23)
-        return float(tempInt) + (float(tempFrac) * 0.0625)
+        return float(temp[0]) + (float(temp[1]) * 0.0625)
+
+    def read_temperature(self):
+        # Blocking version: waits for the conversion (keep it out of the
+        # acquisition loop, the FIFO keeps filling meanwhile)
+        self.start_temperature()
+        reading = self.poll_temperature()
+        while reading is None:
+            sleep_ms(1)
+            reading = self.poll_temperature()
+        return reading
 
     def set_prox_int_tresh(self, val):
         # Set the PROX_INT_THRESH (see proximity function on datasheet, pag 10)
-        self.i2c_set_register(MAX30105_PROX_INT_THRESH, val)
+        self.write_config_register(MAX30105_PROX_INT_THRESH, val)
 
     # DeviceID and Revision methods
     def read_part_id(self):
@@ -554,33 +775,96 @@ class MAX30102(object):
 
     def disable_slots(self):
         # Clear all the slots assignments
-        self.i2c_set_register(MAX30105_MULTI_LED_CONFIG_1, 0)
-        self.i2c_set_register(MAX30105_MULTI_LED_CONFIG_2, 0)
+        self.write_config_register(MAX30105_MULTI_LED_CONFIG_1, 0)
+        self.write_config_register(MAX30105_MULTI_LED_CONFIG_2, 0)
 
     # Low-level I2C Communication
     def i2c_read_register(self, REGISTER, n_bytes=1):
-        self._i2c.writeto(self.i2c_address, bytearray([REGISTER]))
-        return self._i2c.readfrom(self.i2c_address, n_bytes)
+        # One transaction (register pointer, repeated start, read): a drain
+        # scheduled by the interrupt cannot move the pointer in between
+        return self._i2c.readfrom_mem(self.i2c_address, REGISTER, n_bytes)
+
+    def i2c_read_register_into(self, REGISTER, buf):
+        # Fill a preallocated buffer starting at REGISTER in one transaction
+        self._i2c.readfrom_mem_into(self.i2c_address, REGISTER, buf)
 
     def i2c_set_register(self, REGISTER, VALUE):
         self._i2c.writeto(self.i2c_address, bytearray([REGISTER, VALUE]))
         return
 
+    # Configuration registers go through the shadow cache: a register is
+    # read over I2C at most once after a reset, and writes that would not
+    # change its value are skipped
+    def read_config_register(self, REGISTER):
+        if self._staged is not None and REGISTER in self._staged:
+            return self._staged[REGISTER]
+        value = self._shadow.get(REGISTER)
+        if value is None:
+            value = ord(self.i2c_read_register(REGISTER))
+            if REGISTER in MAX30105_SHADOWED_REGISTERS:
+                self._shadow[REGISTER] = value
+        return value
+
+    def write_config_register(self, REGISTER, VALUE):
+        # Returns True if the value was actually written to the sensor
+        if REGISTER not in MAX30105_SHADOWED_REGISTERS:
+            self.i2c_set_register(REGISTER, VALUE)
+            return True
+        if self._staged is not None:
+            # Collected by apply_config(), written when it completes
+            self._staged[REGISTER] = VALUE
+            return False
+        if self._shadow.get(REGISTER) == VALUE:
+            return False
+        self.i2c_set_register(REGISTER, VALUE)
+        self._shadow[REGISTER] = VALUE
+        return True
+
+    def invalidate_shadow(self):
+        # Forget the cached values (e.g. after a reset or a power cycle)
+        self._shadow = {}
+
     # Given a register, read it, mask it, and then set the thing
     def set_bitmask(self, REGISTER, MASK, NEW_VALUES):
-        newCONTENTS = (ord(self.i2c_read_register(REGISTER)) & MASK) | NEW_VALUES
-        self.i2c_set_register(REGISTER, newCONTENTS)
+        newCONTENTS = (self.read_config_register(REGISTER) & MASK) | NEW_VALUES
+        self.write_config_register(REGISTER, newCONTENTS)
         return
 
     # Given a register, read it and mask it
     def bitmask(self, reg, slotMask, thing):
-        originalContents = ord(self.i2c_read_register(reg))
+        originalContents = self.read_config_register(reg)
         originalContents = originalContents & slotMask
-        self.i2c_set_register(reg, originalContents | thing)
+        self.write_config_register(reg, originalContents | thing)
 
     def fifo_bytes_to_int(self, fifo_bytes):
-        value = unpack(">i", b'\x00' + fifo_bytes)
-        return (value[0] & 0x3FFFF) >> self._pulse_width
+        value = (fifo_bytes[0] << 16) | (fifo_bytes[1] << 8) | fifo_bytes[2]
+        return (value & 0x3FFFF) >> self._pulse_width
+
+    def decode_fifo(self, number_of_samples):
+        # Decode the first number_of_samples of the burst buffer into the
+        # red/IR/green block arrays. Only small-int math and array stores are
+        # used, so no heap allocation happens per sample.
+        fifo_bytes = self._fifo_buf
+        sample_size = self._multi_led_read_mode
+        active_leds = self._active_leds
+        shift = self._pulse_width
+        red = self._red_block
+        ir = self._ir_block
+        green = self._green_block
+        offset = 0
+        for i in range(number_of_samples):
+            red[i] = (((fifo_bytes[offset] << 16)
+                       | (fifo_bytes[offset + 1] << 8)
+                       | fifo_bytes[offset + 2]) & 0x3FFFF) >> shift
+            if active_leds > 1:
+                ir[i] = (((fifo_bytes[offset + 3] << 16)
+                          | (fifo_bytes[offset + 4] << 8)
+                          | fifo_bytes[offset + 5]) & 0x3FFFF) >> shift
+            if active_leds > 2:
+                green[i] = (((fifo_bytes[offset + 6] << 16)
+                             | (fifo_bytes[offset + 7] << 8)
+                             | fifo_bytes[offset + 8]) & 0x3FFFF) >> shift
+            offset += sample_size
 
     # Returns how many samples are available
     def available(self):
@@ -614,6 +898,18 @@ class MAX30102(object):
             # Sensor failed to find new data
             return 0
 
+    # Samples lost so far on each channel: overwritten in the sensor FIFO
+    # because it was not drained in time, or in storage because they were
+    # not popped in time
+    def get_lost_red(self):
+        return self.sense.red_lost + self.sense.red.overwritten
+
+    def get_lost_ir(self):
+        return self.sense.IR_lost + self.sense.IR.overwritten
+
+    def get_lost_green(self):
+        return self.sense.green_lost + self.sense.green.overwritten
+
     # Note: the following 3 functions are the equivalent of using 'getFIFO'
     # methods of the SparkFun library
     # Pops the next red value in storage (if available)
@@ -637,54 +933,98 @@ class MAX30102(object):
         else:
             return self.sense.green.pop()
 
+    # Pops up to n red and IR values at once into red_dest[0:k] and
+    # ir_dest[0:k] (arrays or lists) and returns k
+    def pop_red_ir_from_storage(self, red_dest, ir_dest, n):
+        self._storage_busy = True
+        n = self.sense.red.pop_into(red_dest, n)
+        self.sense.IR.pop_into(ir_dest, n)
+        self._storage_busy = False
+        # An interrupt arrived while popping: drain now
+        if self._irq_pending:
+            self._scheduled_drain(0)
+        return n
+
+    # Pops up to n samples of every active channel at once into dest,
+    # interleaved in FIFO order (red, IR, green, red, ...): the k samples
+    # fill dest[0:k * active LEDs]. Returns k
+    def pop_interleaved_from_storage(self, dest, n):
+        self._storage_busy = True
+        active_leds = self._active_leds
+        n = self.sense.red.pop_into(dest, n, 0, active_leds)
+        if active_leds > 1:
+            self.sense.IR.pop_into(dest, n, 1, active_leds)
+        if active_leds > 2:
+            self.sense.green.pop_into(dest, n, 2, active_leds)
+        self._storage_busy = False
+        # An interrupt arrived while popping: drain now
+        if self._irq_pending:
+            self._scheduled_drain(0)
+        return n
+
     # (useless - for comparison purposes only)
     def next_sample(self):
         if self.available():
-            # With respect to the SparkFun library, using a deque object
-            # allows us to avoid manually advancing of the tail
+            # With respect to the SparkFun library, the circular buffer
+            # advances its own tail
             return True
 
     # Polls the sensor for new data
     def check(self):
-        # Call continuously to poll the sensor for new data.
-        read_pointer = ord(self.get_read_pointer())
-        write_pointer = ord(self.get_write_pointer())
-
-        # Do we have new data?
-        if read_pointer != write_pointer:
-            # Calculate the number of readings we need to get from sensor
-            number_of_samples = write_pointer - read_pointer
-
-            # Wrap condition (return to the beginning of 32 samples)
-            if number_of_samples < 0:
-                number_of_samples += 32
-
-            for i in range(number_of_samples):
-                # Read a number of bytes equal to activeLEDs*3 (= 1 sample)
-                fifo_bytes = self.i2c_read_register(MAX30105_FIFO_DATA,
-                                                    self._multi_led_read_mode)
-
-                # Convert the readings from bytes to integers, depending
-                # on the number of active LEDs
-                if self._active_leds > 0:
-                    self.sense.red.append(
-                        self.fifo_bytes_to_int(fifo_bytes[0:3])
-                    )
-
-                if self._active_leds > 1:
-                    self.sense.IR.append(
-                        self.fifo_bytes_to_int(fifo_bytes[3:6])
-                    )
-
-                if self._active_leds > 2:
-                    self.sense.green.append(
-                        self.fifo_bytes_to_int(fifo_bytes[6:9])
-                    )
-
-                return True
+        # Call continuously to poll the sensor for new data. Every pending
+        # sample is drained with a single burst read; returns the number of
+        # samples moved into storage (0 when the FIFO is empty).
+        # FIFO_WRITE_PTR, OVF_COUNTER and FIFO_READ_PTR are contiguous, so
+        # both pointers come back in one 3-byte read.
+        ptr = self._ptr_buf
+        self.i2c_read_register_into(MAX30105_FIFO_WRITE_PTR, ptr)
+        write_pointer = ptr[0]
+        overflow = ptr[1]
+        read_pointer = ptr[2]
+
+        if overflow:
+            # The FIFO filled up and 'overflow' samples were overwritten
+            # (the counter saturates at 31 and resets when a sample is read)
+            if self._active_leds > 0:
+                self.sense.red_lost += overflow
+            if self._active_leds > 1:
+                self.sense.IR_lost += overflow
+            if self._active_leds > 2:
+                self.sense.green_lost += overflow
+
+        # Do we have new data? (equal pointers with an overflow: FIFO full)
+        if read_pointer == write_pointer and not overflow:
+            return 0
+        drain_time = ticks_us()
+
+        # Calculate the number of readings we need to get from sensor
+        number_of_samples = write_pointer - read_pointer
+
+        # Wrap condition (return to the beginning of 32 samples)
+        if number_of_samples <= 0:
+            number_of_samples += MAX30105_FIFO_DEPTH
+
+        # Read activeLEDs*3 bytes per sample, all samples at once
+        sample_size = self._multi_led_read_mode
+        if sample_size != self._fifo_views_size:
+            self._fifo_views = [self._fifo_mv[:k * sample_size]
+                                for k in range(MAX30105_FIFO_DEPTH + 1)]
+            self._fifo_views_size = sample_size
+        self.i2c_read_register_into(MAX30105_FIFO_DATA, self._fifo_views[number_of_samples])
+
+        # Convert the readings from bytes to integers, depending
+        # on the number of active LEDs
+        self.decode_fifo(number_of_samples)
+        # Stamp the block: its newest sample was taken just before the drain
+        self.clock.update(drain_time, number_of_samples + overflow)
+        if self._active_leds > 0:
+            self.sense.red.extend_from(self._red_block, number_of_samples)
+        if self._active_leds > 1:
+            self.sense.IR.extend_from(self._ir_block, number_of_samples)
+        if self._active_leds > 2:
+            self.sense.green.extend_from(self._green_block, number_of_samples)
 
-        else:
-            return False
+        return number_of_samples
 
     # Check for new data but give up after a certain amount of time
     def safe_check(self, max_time_to_check):
@@ -1,41 +1,94 @@
-from ucollections import deque
+from array import array
 
 
 class CircularBuffer(object):
-    ''' Very simple implementation of a circular buffer based on deque '''
+    ''' Fixed-capacity ring of integers stored in one flat array('l') '''
     def __init__(self, max_size):
-        self.data = deque((), max_size, True)
+        self.data = array('l', [0] * max_size)
         self.max_size = max_size
+        # Index of the oldest item, index of the next free slot, item count
+        self.head = 0
+        self.tail = 0
+        self.count = 0
+        # Items overwritten before being popped (cumulative)
+        self.overwritten = 0
 
     def __len__(self):
-        return len(self.data)
+        return self.count
 
     def is_empty(self):
-        return not bool(self.data)
+        return self.count == 0
 
     def append(self, item):
-        try:
-            self.data.append(item)
-        except IndexError:
-            # deque full, popping 1st item out
-            self.data.popleft()
-            self.data.append(item)
+        self.data[self.tail] = item
+        self.tail += 1
+        if self.tail == self.max_size:
+            self.tail = 0
+        if self.count == self.max_size:
+            # Ring full, the oldest item has just been overwritten
+            self.head = self.tail
+            self.overwritten += 1
+        else:
+            self.count += 1
 
     def pop(self):
-        return self.data.popleft()
+        if self.count == 0:
+            raise IndexError('pop from an empty buffer')
+        item = self.data[self.head]
+        self.head += 1
+        if self.head == self.max_size:
+            self.head = 0
+        self.count -= 1
+        return item
 
     def clear(self):
-        self.data = deque((), self.max_size, True)
+        self.head = 0
+        self.tail = 0
+        self.count = 0
 
     def pop_head(self):
-        buffer_size = len(self.data)
-        temp = self.data
-        if buffer_size == 1:
-            pass
-        elif buffer_size > 1:
-            self.data.clear()
-            for x in range(buffer_size - 1):
-                self.data = temp.popleft()
-        else:
+        # Returns the newest item and discards all the older ones
+        if self.count == 0:
             return 0
-        return temp.popleft()
\ No newline at end of file
+        item = self.data[self.tail - 1]
+        self.clear()
+        return item
+
+    def extend_from(self, buf, n):
+        # Appends the first n items of buf (the oldest are overwritten when
+        # the ring is full)
+        data = self.data
+        max_size = self.max_size
+        tail = self.tail
+        for i in range(n):
+            data[tail] = buf[i]
+            tail += 1
+            if tail == max_size:
+                tail = 0
+        self.tail = tail
+        count = self.count + n
+        if count >= max_size:
+            self.overwritten += count - max_size
+            self.count = max_size
+            self.head = tail
+        else:
+            self.count = count
+
+    def pop_into(self, dest, n, start=0, step=1):
+        # Pops up to n of the oldest items into dest[start], dest[start +
+        # step], ... (step > 1 interleaves channels) and returns their count
+        if n > self.count:
+            n = self.count
+        data = self.data
+        max_size = self.max_size
+        head = self.head
+        j = start
+        for i in range(n):
+            dest[j] = data[head]
+            j += step
+            head += 1
+            if head == max_size:
+                head = 0
+        self.head = head
+        self.count -= n
+        return n
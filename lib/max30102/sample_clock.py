@@ -0,0 +1,59 @@
+from utime import ticks_add, ticks_diff
+
+
+class SampleClock(object):
+    ''' Tracks the real acquisition frequency from the drained FIFO blocks '''
+    def __init__(self, nominal_hz=None, span_ms=2000, gain=0.25,
+                 tolerance=0.2):
+        # span_ms: time over which each rate measurement is taken
+        # gain: weight of a new measurement once locked (drift tracking)
+        # tolerance: measurements further than this fraction from the
+        #            nominal rate are discarded (e.g. after a long stall)
+        self._span_us = span_ms * 1000
+        self._gain = gain
+        self._tolerance = tolerance
+        self.reset(nominal_hz)
+
+    def reset(self, nominal_hz):
+        # Start over from the configured rate (sample_rate / sample_avg)
+        self.nominal_hz = nominal_hz
+        self.rate = nominal_hz
+        self.locked = False
+        self._anchor_us = None
+        self._count = 0
+        # Drain time and size of the last block
+        self.last_us = None
+        self.last_n = 0
+
+    def update(self, t_us, n):
+        # n samples (drained or lost) were produced since the previous
+        # block, the newest one just before t_us (ticks_us()). O(1).
+        self.last_us = t_us
+        self.last_n = n
+        if self.nominal_hz is None:
+            return
+        if self._anchor_us is None:
+            self._anchor_us = t_us
+            self._count = 0
+            return
+        self._count += n
+        span = ticks_diff(t_us, self._anchor_us)
+        if span < self._span_us:
+            return
+        measured = self._count * 1000000 / span
+        if abs(measured - self.nominal_hz) <= self._tolerance * self.nominal_hz:
+            if self.locked:
+                self.rate += self._gain * (measured - self.rate)
+            else:
+                self.rate = measured
+                self.locked = True
+        self._anchor_us = t_us
+        self._count = 0
+
+    def period_us(self):
+        return 1000000 / self.rate
+
+    def sample_time_us(self, i):
+        # Timestamp of sample i (0 = oldest) of the last block
+        return ticks_add(self.last_us,
+                         -int((self.last_n - 1 - i) * 1000000 / self.rate))
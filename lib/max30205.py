@@ -1,46 +1,110 @@
 from machine import I2C
+from utime import ticks_diff, ticks_ms
 import time
 
 class MAX30205:
     REG_TEMPERATURE = 0x00
     REG_CONFIGURATION = 0x01
 
-    def __init__(self, i2c, address=0x48, calibration_offset=0.0):
+    # Configuration bits
+    CONFIG_SHUTDOWN = 0x01
+    CONFIG_ONE_SHOT = 0x80
+
+    # Worst-case conversion time (datasheet: 50ms max)
+    CONVERSION_MS = 50
+
+    def __init__(self, i2c, address=0x48, calibration_offset=0.0,
+                 refresh_ms=10000, one_shot=False):
+        """
+        refresh_ms : Age after which read_cached() starts a new conversion
+        one_shot   : Keep the sensor in shutdown and wake it up for one
+                     conversion per refresh (lower power, fewer bus transactions)
+        """
         self.i2c = i2c
         self.address = address
         self.offset = calibration_offset
+        self.refresh_ms = refresh_ms
+        self.one_shot = one_shot
+
+        # Cached reading
+        self._last_temp = None
+        self._last_read_ms = None
+        self._conversion_start_ms = None
+        self._data = bytearray(2)
+
         self.setup_sensor()
 
     def setup_sensor(self):
-        """Set sensor to continuous mode (Wake up from Shutdown)"""
+        """Set sensor to continuous mode (Wake up from Shutdown), or to shutdown in one-shot mode"""
+        config = self.CONFIG_SHUTDOWN if self.one_shot else 0x00
         try:
-            self.i2c.writeto_mem(self.address, self.REG_CONFIGURATION, b'\x00')
+            self.i2c.writeto_mem(self.address, self.REG_CONFIGURATION, bytes([config]))
         except OSError:
             pass
 
+    def _convert(self, data):
+        raw = (data[0] << 8) | data[1]
+
+        # 1. Two's complement calculation (Original logic)
+        if raw & 0x8000:
+            raw -= 1 << 16
+
+        # 2. Convert to raw temperature
+        temp = raw / 256.0
+
+        # 3. CUSTOM FIX (Extended Format Correction)
+        # If the value is unreasonably low (e.g., below -10C, currently reading -30C),
+        # add 64.0 to correct the extended format bit interpretation issue.
+        if temp < -10:
+            temp += 64.0
+
+        # 4. Add calibration offset
+        temp = temp + self.offset
+
+        return temp
+
     def read_temperature_c(self):
         try:
             # Read 2 bytes of temperature data
             data = self.i2c.readfrom_mem(self.address, self.REG_TEMPERATURE, 2)
-            raw = (data[0] << 8) | data[1]
-
-            # 1. Two's complement calculation (Original logic)
-            if raw & 0x8000:
-                raw -= 1 << 16
-
-            # 2. Convert to raw temperature
-            temp = raw / 256.0
+            return self._convert(data)
 
-            # 3. CUSTOM FIX (Extended Format Correction)
-            # If the value is unreasonably low (e.g., below -10C, currently reading -30C),
-            # add 64.0 to correct the extended format bit interpretation issue.
-            if temp < -10:
-                temp += 64.0
+        except OSError:
+            return 0.0
 
-            # 4. Add calibration offset
-            temp = temp + self.offset
-            
-            return temp
+    def start_conversion(self):
+        """Start a conversion; collect it with read_cached() once it is complete"""
+        if self.one_shot:
+            # One conversion, then the sensor goes back to shutdown by itself
+            self.i2c.writeto_mem(self.address, self.REG_CONFIGURATION,
+                                 bytes([self.CONFIG_ONE_SHOT | self.CONFIG_SHUTDOWN]))
+        # In continuous mode the register is refreshed on its own: waiting
+        # one conversion time guarantees a fresh value
+        self._conversion_start_ms = ticks_ms()
 
+    def read_cached(self):
+        """
+        Returns the last temperature (None before the first conversion).
+        Call it as often as needed: it only touches the bus to start a
+        conversion every refresh_ms and to collect it CONVERSION_MS later.
+        """
+        now = ticks_ms()
+        try:
+            if self._conversion_start_ms is not None:
+                if ticks_diff(now, self._conversion_start_ms) >= self.CONVERSION_MS:
+                    self.i2c.readfrom_mem_into(self.address, self.REG_TEMPERATURE, self._data)
+                    self._conversion_start_ms = None
+                    self._last_temp = self._convert(self._data)
+                    self._last_read_ms = now
+            elif self._last_read_ms is None or ticks_diff(now, self._last_read_ms) >= self.refresh_ms:
+                self.start_conversion()
         except OSError:
-            return 0.0
\ No newline at end of file
+            # Keep serving the old value, retry on the next call
+            self._conversion_start_ms = None
+        return self._last_temp
+
+    def age_ms(self):
+        """Age of the value served by read_cached() (None if there is none yet)"""
+        if self._last_read_ms is None:
+            return None
+        return ticks_diff(ticks_ms(), self._last_read_ms)
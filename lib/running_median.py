@@ -0,0 +1,135 @@
+from array import array
+
+
+class RunningMedian(object):
+    ''' Median of the last `capacity` values: O(log N) push, O(1) median, no allocation '''
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('Wrong capacity:{0}!'.format(capacity))
+        self.capacity = capacity
+        # Values in arrival order (ring of slots)
+        self.values = array('f', [0.0] * capacity)
+        self.head = 0
+        self.count = 0
+        # Two heaps of slots: 'low' is a max-heap of the smaller half, 'high'
+        # a min-heap of the larger half; len(low) is len(high) or one more
+        self._low = array('l', [0] * capacity)
+        self._high = array('l', [0] * capacity)
+        self._n_low = 0
+        self._n_high = 0
+        # Position of each slot in its heap, and which heap (1: low)
+        self._pos = array('l', [0] * capacity)
+        self._in_low = bytearray(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self._n_low = 0
+        self._n_high = 0
+
+    def push(self, value):
+        # Adds a value; the oldest one goes out when the ring is full
+        if self.count == self.capacity:
+            slot = self.head
+            self._remove(slot)
+            self.head = slot + 1 if slot + 1 < self.capacity else 0
+        else:
+            slot = (self.head + self.count) % self.capacity
+            self.count += 1
+        self.values[slot] = value
+        if self._n_low == 0 or value <= self.values[self._low[0]]:
+            self._insert(slot, True)
+        else:
+            self._insert(slot, False)
+        self._rebalance()
+
+    def median(self):
+        # None when empty
+        if self.count == 0:
+            return None
+        if self._n_low > self._n_high:
+            return self.values[self._low[0]]
+        return 0.5 * (self.values[self._low[0]] + self.values[self._high[0]])
+
+    def _rebalance(self):
+        while self._n_low > self._n_high + 1:
+            slot = self._low[0]
+            self._remove(slot)
+            self._insert(slot, False)
+        while self._n_high > self._n_low:
+            slot = self._high[0]
+            self._remove(slot)
+            self._insert(slot, True)
+
+    def _insert(self, slot, low):
+        if low:
+            i = self._n_low
+            self._n_low += 1
+            self._low[i] = slot
+        else:
+            i = self._n_high
+            self._n_high += 1
+            self._high[i] = slot
+        self._in_low[slot] = 1 if low else 0
+        self._pos[slot] = i
+        self._sift_up(i, low)
+
+    def _remove(self, slot):
+        low = self._in_low[slot]
+        heap = self._low if low else self._high
+        i = self._pos[slot]
+        if low:
+            self._n_low -= 1
+            n = self._n_low
+        else:
+            self._n_high -= 1
+            n = self._n_high
+        if i == n:
+            return
+        last = heap[n]
+        heap[i] = last
+        self._pos[last] = i
+        self._sift_up(i, low)
+        self._sift_down(self._pos[last], low)
+
+    def _above(self, a, b, low):
+        # True if slot a belongs above slot b in its heap
+        if low:
+            return self.values[a] > self.values[b]
+        return self.values[a] < self.values[b]
+
+    def _sift_up(self, i, low):
+        heap = self._low if low else self._high
+        pos = self._pos
+        slot = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not self._above(slot, heap[parent], low):
+                break
+            heap[i] = heap[parent]
+            pos[heap[i]] = i
+            i = parent
+        heap[i] = slot
+        pos[slot] = i
+
+    def _sift_down(self, i, low):
+        heap = self._low if low else self._high
+        n = self._n_low if low else self._n_high
+        pos = self._pos
+        slot = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and self._above(heap[child + 1], heap[child], low):
+                child += 1
+            if not self._above(heap[child], slot, low):
+                break
+            heap[i] = heap[child]
+            pos[heap[i]] = i
+            i = child
+        heap[i] = slot
+        pos[slot] = i
@@ -1,57 +1,49 @@
-import math
+from analysis import analyze_window
 
-def _mean(values):
-    """
-    Calculates the arithmetic mean of a list of values.
-    """
-    n = len(values)
-    if n == 0:
-        return 0.0
-    return sum(values) / n
-
-def _rms(values):
-    """
-    Root-mean-square (RMS) calculation.
-    Used to determine the AC component amplitude.
-    """
-    n = len(values)
-    if n == 0:
-        return 0.0
-    s = 0.0
-    for v in values:
-        s += v * v
-    return (s / n) ** 0.5
-
-def compute_spo2(ir_buffer, red_buffer, raw_ir_buffer, raw_red_buffer, min_samples=40):
+def compute_spo2(ir_buffer, red_buffer, raw_ir_buffer, raw_red_buffer, min_samples=40,
+                 analysis=None, n=None):
     """
     Compute SpO2 using linear approximation which is more robust for DIY sensors.
+    analysis: analyze_window() result for the last n samples of the four
+    buffers if it is already available (e.g. shared with compute_hr).
+    n: the window is buffer[0:n] of each buffer (e.g. preallocated arrays
+    or memoryviews, not copied); by default the last samples of each, as
+    many as the shortest buffer has.
     """
     # 1) Basic Checks
     if raw_ir_buffer is None or raw_red_buffer is None:
         return None
 
-    n = min(len(raw_ir_buffer), len(raw_red_buffer), len(ir_buffer), len(red_buffer))
+    start = 0
+    if n is None:
+        n = min(len(raw_ir_buffer), len(raw_red_buffer), len(ir_buffer), len(red_buffer))
+        start = None
 
     if n < min_samples:
         return None
 
-    # Get the last n samples
-    raw_ir = raw_ir_buffer[-n:]
-    raw_red = raw_red_buffer[-n:]
-    ir = ir_buffer[-n:]
-    red = red_buffer[-n:]
+    # One pass over the n samples of the four buffers (no copies)
+    if analysis is None:
+        analysis = analyze_window(ir_buffer, red_buffer, raw_ir_buffer, raw_red_buffer, n, start)
 
     # 2) DC Component (Mean of raw data)
-    dc_ir = _mean(raw_ir)
-    dc_red = _mean(raw_red)
+    dc_ir = analysis.raw_ir_mean
+    dc_red = analysis.raw_red_mean
+
+    # 3) AC Component (RMS of filtered data)
+    ac_ir = analysis.ir_rms
+    ac_red = analysis.red_rms
+
+    return _spo2_from_components(dc_ir, dc_red, ac_ir, ac_red)
 
+def _spo2_from_components(dc_ir, dc_red, ac_ir, ac_red):
+    """
+    SpO2 from the DC (raw mean) and AC (filtered RMS) components,
+    None if they are not usable.
+    """
     if dc_ir == 0 or dc_red == 0:
         return None
 
-    # 3) AC Component (RMS of filtered data)
-    ac_ir = _rms(ir)
-    ac_red = _rms(red)
-
     # Noise Check: AC signal cannot be larger than DC (indicates no finger or excessive movement)
     # We keep this check loose, but if AC is too large, the filter might be unstable.
     if ac_ir > dc_ir or ac_red > dc_red:
@@ -88,4 +80,76 @@ def compute_spo2(ir_buffer, red_buffer, raw_ir_buffer, raw_red_buffer, min_sampl
     elif spo2 > 100:
         spo2 = 100.0
 
-    return spo2
\ No newline at end of file
+    return spo2
+
+
+class SpO2Accumulator:
+    """
+    compute_spo2() on a sliding window at O(1) per sample: running sums of
+    the raw samples (DC) and of the squared filtered samples (AC) of red
+    and IR, updated as samples enter (add) and leave (remove) the window.
+    value() copies nothing and loops over nothing.
+    The filtered samples are accumulated as integers in 1/SCALE counts, so
+    additions and removals cancel exactly: the sums never drift.
+    """
+
+    SCALE = 16
+
+    def __init__(self, min_samples=40):
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum_raw_red = 0
+        self.sum_raw_ir = 0
+        self.sum_sq_red = 0
+        self.sum_sq_ir = 0
+
+    def add(self, raw_red, raw_ir, red, ir):
+        """One sample enters the window"""
+        scale = self.SCALE
+        self.count += 1
+        self.sum_raw_red += raw_red
+        self.sum_raw_ir += raw_ir
+        q = int(red * scale + (0.5 if red >= 0 else -0.5))
+        self.sum_sq_red += q * q
+        q = int(ir * scale + (0.5 if ir >= 0 else -0.5))
+        self.sum_sq_ir += q * q
+
+    def remove(self, raw_red, raw_ir, red, ir):
+        """One sample (given to add() before) leaves the window"""
+        scale = self.SCALE
+        self.count -= 1
+        self.sum_raw_red -= raw_red
+        self.sum_raw_ir -= raw_ir
+        q = int(red * scale + (0.5 if red >= 0 else -0.5))
+        self.sum_sq_red -= q * q
+        q = int(ir * scale + (0.5 if ir >= 0 else -0.5))
+        self.sum_sq_ir -= q * q
+
+    def add_block(self, raw, filtered, n, n_channels=2):
+        """Adds n interleaved frames (red, IR, ...) of raw and filtered blocks"""
+        if n_channels < 2:
+            # SpO2 needs red and IR: one LED (HR mode) is not enough
+            raise ValueError('Wrong number of channels:{0}!'.format(n_channels))
+        for i in range(0, n * n_channels, n_channels):
+            self.add(raw[i], raw[i + 1], filtered[i], filtered[i + 1])
+
+    def remove_block(self, raw, filtered, n, n_channels=2):
+        """Removes n interleaved frames, see add_block()"""
+        if n_channels < 2:
+            raise ValueError('Wrong number of channels:{0}!'.format(n_channels))
+        for i in range(0, n * n_channels, n_channels):
+            self.remove(raw[i], raw[i + 1], filtered[i], filtered[i + 1])
+
+    def value(self):
+        """SpO2 of the samples in the window, same result as compute_spo2()"""
+        n = self.count
+        if n < self.min_samples:
+            return None
+        scale = self.SCALE
+        return _spo2_from_components(self.sum_raw_ir / n,
+                                     self.sum_raw_red / n,
+                                     (self.sum_sq_ir / n) ** 0.5 / scale,
+                                     (self.sum_sq_red / n) ** 0.5 / scale)
@@ -0,0 +1,94 @@
+from emitter import micropython
+
+
+class SampleBatch(object):
+    ''' "S, id,red,ir" sample lines written into a preallocated buffer: no string is built per sample '''
+    # Longest line: "S, " + 10-digit id + 2 * ("," + sign and 10 digits with
+    # the point) + "\n", for |value| < 1e8
+    LINE_BYTES = 40
+
+    def __init__(self, max_lines):
+        if max_lines < 1:
+            raise ValueError('Wrong number of lines:{0}!'.format(max_lines))
+        self.max_lines = max_lines
+        self.buf = bytearray(max_lines * self.LINE_BYTES)
+        self._mv = memoryview(self.buf)
+        # Bytes and lines in the buffer
+        self.size = 0
+        self.lines = 0
+        self._digits = bytearray(12)
+
+    def __len__(self):
+        return self.lines
+
+    def clear(self):
+        self.size = 0
+        self.lines = 0
+
+    def view(self):
+        # The lines as one memoryview, e.g. for socket.send() (no copy)
+        return self._mv[:self.size]
+
+    @micropython.native
+    def add_block(self, src, n, first_id, n_channels=2):
+        # Appends one line per frame of the interleaved block src[0:n *
+        # n_channels]: sample id (first_id, first_id + 1, ...), then channels
+        # 0 and 1 with one decimal, as "S, {},{:.1f},{:.1f}\n".format() (the
+        # decimal is round(value * 10), which may differ from format() at an
+        # exact x.x5 of the binary value). Returns the number of lines
+        # written: fewer than n when the buffer is full.
+        if n_channels < 2:
+            # A line holds red and IR: one LED (HR mode) has no IR channel
+            raise ValueError('Wrong number of channels:{0}!'.format(n_channels))
+        room = self.max_lines - self.lines
+        if n > room:
+            n = room
+        buf = self.buf
+        pos = self.size
+        i = 0
+        for k in range(n):
+            buf[pos] = 83       # 'S'
+            buf[pos + 1] = 44   # ','
+            buf[pos + 2] = 32   # ' '
+            pos = self._put_int(pos + 3, first_id + k)
+            buf[pos] = 44
+            pos = self._put_tenths(pos + 1, src[i])
+            buf[pos] = 44
+            pos = self._put_tenths(pos + 1, src[i + 1])
+            buf[pos] = 10       # '\n'
+            pos += 1
+            i += n_channels
+        self.size = pos
+        self.lines += n
+        return n
+
+    @micropython.native
+    def _put_int(self, pos, value):
+        # Decimal digits of value >= 0 at buf[pos]; returns the end
+        digits = self._digits
+        k = 0
+        while True:
+            digits[k] = 48 + value % 10
+            value //= 10
+            k += 1
+            if value == 0:
+                break
+        buf = self.buf
+        while k:
+            k -= 1
+            buf[pos] = digits[k]
+            pos += 1
+        return pos
+
+    @micropython.native
+    def _put_tenths(self, pos, x):
+        # x with one decimal at buf[pos]; returns the end
+        tenths = round(x * 10)
+        if tenths < 0 or (tenths == 0 and x < 0):
+            self.buf[pos] = 45  # '-'
+            pos += 1
+            tenths = -tenths
+        pos = self._put_int(pos, tenths // 10)
+        self.buf[pos] = 46      # '.'
+        self.buf[pos + 1] = 48 + tenths % 10
+        return pos + 2
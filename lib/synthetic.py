@@ -0,0 +1,25 @@
+import math
+
+# Deterministic test signals, the same on the board and on a PC (no random
+# module): for the tests, the benchmark and the host sensor model
+
+
+def lcg(seed):
+    # Next state of the linear congruential generator (31 bits)
+    return (seed * 1103515245 + 12345) & 0x7FFFFFFF
+
+
+def synthetic_ppg(n, fs, hr_bpm=72.0, depth=-400, seed=12345):
+    # n raw-sensor-like samples at fs: large DC, pulse wave, baseline wander
+    # and noise. The pulse lowers the reading (more blood, more absorption)
+    # by `depth` counts, hence the inversion in main.py; a positive depth
+    # raises it.
+    samples = []
+    for i in range(n):
+        t = i / fs
+        phase = (t * hr_bpm / 60.0) % 1.0
+        pulse = math.exp(-((phase - 0.2) ** 2) / 0.01) + 0.4 * math.exp(-((phase - 0.55) ** 2) / 0.02)
+        seed = lcg(seed)
+        noise = (seed >> 16) % 21 - 10
+        samples.append(int(50000 + depth * pulse + 150 * math.sin(2 * math.pi * 0.2 * t) + noise))
+    return samples
@@ -0,0 +1,166 @@
+import math
+import sys
+from array import array
+
+try:
+    import utime
+    i2c = None
+except ImportError:
+    # On a PC: the host stand-ins, and tracemalloc for the measure
+    import tracemalloc
+    tracemalloc.start()
+    import host
+    host.install()
+    from machine import I2C
+    # The driver shuts the sensor down from __del__ on a PC
+    i2c = I2C(1)
+
+from filter import FilterBank
+from heap import IdleCollector
+from hrcalculator import StreamingPeakDetector
+from instrument import Instrumentation
+from max30102 import MAX30102, MAX30105_FIFO_DEPTH
+from spo2calculator import SpO2Accumulator
+from stream import SampleBatch
+from window import SlidingWindow
+
+# The steady-state acquire -> filter -> buffer path of main.py must stay
+# within its allocation budget (bytes per sample, per stage), measured by
+# the allocation profiler (Instrumentation(alloc=True)).
+# On a PC ints above 256 are objects too and only the peak is seen
+# (tracemalloc). On the board floats are heap objects: the float stages
+# allocate one per operation, the integer acquire stage nothing; the float
+# stages are only reported there until budgets are measured on a board.
+# Also: the collector's backstop when the loop never gets idle time.
+# Runs on the board or on a PC: PYTHONPATH=.:lib python lib/test/alloc_budget_test.py
+
+if sys.implementation.name == 'micropython':
+    BUDGETS = {"acquire": 0}
+else:
+    BUDGETS = {"acquire": 32, "filter": 128, "detect": 64, "window": 96, "stream": 96}
+STAGES = ("acquire", "filter", "detect", "window", "stream")
+FS = 50
+# Samples per drain (polling: a few at a time)
+DRAIN = 4
+N_CHANNELS = 2
+
+sensor = MAX30102(i2c=i2c)
+# Configuration normally set by set_led_mode() / set_pulse_width()
+sensor._active_leds = N_CHANNELS
+sensor._multi_led_read_mode = 3 * N_CHANNELS
+sensor._pulse_width = 0
+
+block = array('l', [0] * (MAX30105_FIFO_DEPTH * N_CHANNELS))
+filtered_block = array('f', [0.0] * (MAX30105_FIFO_DEPTH * N_CHANNELS))
+evicted_block = array('l', [0] * (MAX30105_FIFO_DEPTH * N_CHANNELS))
+evicted_filtered_block = array('f', [0.0] * (MAX30105_FIFO_DEPTH * N_CHANNELS))
+window_size = 8 * FS
+raw_window = SlidingWindow(window_size, FS, N_CHANNELS, 'l')
+filtered_window = SlidingWindow(window_size, FS, N_CHANNELS, 'f')
+accumulator = SpO2Accumulator(min_samples=40)
+bank = FilterBank(N_CHANNELS, fs=FS, fc_hp=0.5, fc_lp=8.0, order=2)
+detector = StreamingPeakDetector(FS)
+batch = SampleBatch(15 + MAX30105_FIFO_DEPTH)
+
+# One second of FIFO bursts (red, IR: 3 bytes each), replayed
+period = array('l', [0] * (FS * N_CHANNELS))
+for i in range(FS):
+    pulse = math.exp(-((i / FS - 0.2) ** 2) / 0.01)
+    period[2 * i] = int(40000 * (1.0 - 0.05 * pulse))
+    period[2 * i + 1] = int(52000 * (1.0 - 0.02 * pulse))
+
+
+def load_fifo(start, n):
+    # The sensor side: the next n samples in the burst buffer
+    fifo = sensor._fifo_buf
+    for k in range(n):
+        for ch in range(N_CHANNELS):
+            value = period[(2 * (start + k) + ch) % len(period)]
+            offset = 3 * (N_CHANNELS * k + ch)
+            fifo[offset] = (value >> 16) & 0x03
+            fifo[offset + 1] = (value >> 8) & 0xFF
+            fifo[offset + 2] = value & 0xFF
+
+
+def run(stats, seconds, first, collector=None):
+    # main.py's path for `seconds` of signal, DRAIN samples at a time; the
+    # collector runs between two drains, like in main.py's idle time
+    sample_id = first
+    for _ in range(seconds * FS // DRAIN):
+        load_fifo(sample_id, DRAIN)
+        t = stats.start()
+        # What check() does after the I2C burst read
+        sensor.decode_fifo(DRAIN)
+        sensor.sense.red.extend_from(sensor._red_block, DRAIN)
+        sensor.sense.IR.extend_from(sensor._ir_block, DRAIN)
+        n = sensor.pop_interleaved_from_storage(block, MAX30105_FIFO_DEPTH)
+        t = stats.lap(0, t)
+        bank.process(block, filtered_block, n, gain=-1)
+        t = stats.lap(1, t)
+        detector.process(filtered_block, n, 1, N_CHANNELS)
+        while detector.available():
+            detector.pop_beat()
+        t = stats.lap(2, t)
+        n_evicted = len(raw_window) + n - window_size
+        if n_evicted > 0:
+            raw_window.oldest_into(evicted_block, n_evicted)
+            filtered_window.oldest_into(evicted_filtered_block, n_evicted)
+            accumulator.remove_block(evicted_block, evicted_filtered_block, n_evicted, N_CHANNELS)
+        accumulator.add_block(block, filtered_block, n, N_CHANNELS)
+        raw_window.extend(block, n)
+        filtered_window.extend(filtered_block, n)
+        raw_window.hop_ready()
+        t = stats.lap(3, t)
+        batch.add_block(filtered_block, n, sample_id + 1, N_CHANNELS)
+        if len(batch) >= 15:
+            batch.clear()
+        stats.lap(4, t)
+        sample_id += n
+        if collector is not None:
+            collector.idle()
+    return sample_id
+
+
+stats = Instrumentation(STAGES, alloc=True)
+stats.calibrate()
+
+print("Profiler...")
+t = stats.start()
+buffers = [bytearray(1024) for _ in range(4)]
+stats.lap(0, t)
+allocated = stats.report(4)["stages"]["acquire"]["alloc_per_sample"]
+assert 1024 <= allocated < 1200, allocated
+buffers = None
+stats.reset()
+
+print("Warming up...")
+bank.warm_start(period, 1, gain=-1)
+sample_id = run(stats, 10, 0)
+
+print("Measuring...")
+# No collection inside the measured stages (gc.mem_alloc() deltas)
+collector = IdleCollector(16384)
+stats.reset()
+samples = run(stats, 20, sample_id, collector) - sample_id
+collector.stop()
+report = stats.report(samples)
+for name in STAGES:
+    per_sample = report["stages"][name]["alloc_per_sample"]
+    budget = BUDGETS.get(name)
+    print("{:8} {:7.1f} bytes per sample (budget {})".format(name, per_sample, budget))
+    if budget is not None:
+        assert per_sample <= budget, (name, per_sample)
+
+print("Backstop...")
+# Never idle: overdue() collects once the backstop is spent
+collector = IdleCollector(4096, 8192)
+kept = []
+while not collector.overdue():
+    kept.append(bytearray(512))
+    assert len(kept) <= 32, "no backstop collection"
+assert collector.forced == 1 and collector.collections == 1
+assert not collector.overdue()
+collector.stop()
+kept = None
+
+print("Allocation budget test OK.")
@@ -0,0 +1,120 @@
+import math
+from array import array
+from analysis import analyze_window
+from hrcalculator import compute_hr, hr_from_rr
+from spo2calculator import _spo2_from_components, compute_spo2
+from synthetic import lcg
+
+# compute_hr() and compute_spo2() on top of the single-pass analysis must
+# give the results of the previous multi-pass versions (below).
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/analysis_test.py
+
+
+def reference_compute_hr(ir_buffer, acq_freq):
+    # Previous compute_hr(): centered copy, max/min/abs-max passes, scan
+    n = len(ir_buffer)
+    mean_val = sum(ir_buffer) / n
+    centered = [x - mean_val for x in ir_buffer]
+    max_abs = max(abs(x) for x in centered)
+    if (max(centered) - min(centered)) < 1.0 or max_abs == 0.0:
+        return None
+    threshold = 0.3 * min(max_abs, 2000.0)
+    min_distance = max(1, int(acq_freq * 0.35))
+    win = max(1, int(0.05 * acq_freq))
+    peaks = []
+    last_peak = -min_distance
+    for i in range(1, n - 1):
+        sample = centered[i]
+        if sample < threshold:
+            continue
+        if not (sample >= centered[i - 1] and sample >= centered[i + 1]):
+            continue
+        if max(centered[max(0, i - win):min(n - 1, i + win) + 1]) > sample:
+            continue
+        if i - last_peak < min_distance:
+            if peaks and sample > centered[peaks[-1]]:
+                peaks[-1] = i
+                last_peak = i
+            continue
+        peaks.append(i)
+        last_peak = i
+    if len(peaks) < 2:
+        return None
+    refined = []
+    for i in peaks:
+        a, b, c = centered[i - 1], centered[i], centered[i + 1]
+        d = a - 2 * b + c
+        refined.append(i + (0.5 * (a - c) / d if d != 0 else 0.0))
+    hr = hr_from_rr([(refined[k] - refined[k - 1]) / acq_freq for k in range(1, len(refined))])
+    return None if hr is None else (hr, peaks)
+
+
+def reference_compute_spo2(ir_buffer, red_buffer, raw_ir_buffer, raw_red_buffer, min_samples=40):
+    # Previous compute_spo2(): four slices, then one loop per statistic
+    n = min(len(raw_ir_buffer), len(raw_red_buffer), len(ir_buffer), len(red_buffer))
+    if n < min_samples:
+        return None
+
+    def rms(values):
+        s = 0.0
+        for v in values:
+            s += v * v
+        return (s / n) ** 0.5
+
+    return _spo2_from_components(sum(raw_ir_buffer[-n:]) / n, sum(raw_red_buffer[-n:]) / n,
+                                 rms(ir_buffer[-n:]), rms(red_buffer[-n:]))
+
+
+def window(n, fs, hr_bpm, dc, ac, seed):
+    # Filtered-like pulse wave with noise, and the raw samples around dc
+    filtered = []
+    raw = []
+    for i in range(n):
+        seed = lcg(seed)
+        phase = (i / fs * hr_bpm / 60.0) % 1.0
+        wave = ac * (math.exp(-((phase - 0.2) ** 2) / 0.01) - 0.3) + (seed >> 16) % 21 - 10
+        filtered.append(wave)
+        raw.append(int(dc - wave))
+    return filtered, raw
+
+
+checked = 0
+for fs, hr_bpm in ((25, 90.0), (50, 72.0), (100, 55.0), (100, 140.0), (400, 120.0)):
+    for seed in range(1, 6):
+        ir, raw_ir = window(4 * fs, fs, hr_bpm, 52000, 400 + 50 * seed, seed)
+        red, raw_red = window(4 * fs, fs, hr_bpm, 40000, 250 + 30 * seed, seed + 100)
+
+        analysis = analyze_window(ir, red, raw_ir, raw_red)
+        expected = reference_compute_hr(ir, fs)
+        for result in (compute_hr(ir, fs), compute_hr(ir, fs, analysis)):
+            if expected is None:
+                assert result is None
+                continue
+            assert result[1] == expected[1], (fs, seed, result[1], expected[1])
+            assert abs(result[0] - expected[0]) < 1e-9
+            checked += 1
+
+        expected = reference_compute_spo2(ir, red, raw_ir, raw_red)
+        assert compute_spo2(ir, red, raw_ir, raw_red) == expected
+        assert compute_spo2(ir, red, raw_ir, raw_red, analysis=analysis) == expected
+
+        # Buffers of different lengths: the last n samples of each
+        expected = reference_compute_spo2(ir, red[5:], raw_ir[7:], raw_red)
+        assert compute_spo2(ir, red[5:], raw_ir[7:], raw_red) == expected
+
+        # Preallocated arrays holding n samples (then anything), as is or
+        # through memoryviews: the same results, nothing copied
+        n = len(ir)
+        buffers = []
+        for values, typecode in ((ir, 'f'), (red, 'f'), (raw_ir, 'l'), (raw_red, 'l')):
+            buf = array(typecode, values)
+            buf.extend(array(typecode, [values[0] * 3] * 17))
+            buffers.append(buf)
+        expected_hr = compute_hr(array('f', ir), fs)
+        expected = compute_spo2(array('f', ir), array('f', red), raw_ir, raw_red)
+        for a, b, c, d in (buffers, [memoryview(buf) for buf in buffers]):
+            assert compute_hr(a, fs, n=n) == expected_hr, (fs, seed)
+            assert compute_spo2(a, b, c, d, n=n) == expected
+assert checked > 0
+
+print("Analysis test OK.")
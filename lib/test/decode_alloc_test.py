@@ -0,0 +1,63 @@
+import gc
+import sys
+
+try:
+    import utime
+    i2c = None
+except ImportError:
+    # On a PC: the host stand-ins, and tracemalloc for the measure
+    import tracemalloc
+    tracemalloc.start()
+    import host
+    host.install()
+    from machine import I2C
+    # The driver shuts the sensor down from __del__ on a PC
+    i2c = I2C(1)
+
+from heap import alloc_mark, alloc_since
+from max30102 import MAX30102, MAX30105_FIFO_DEPTH
+
+# Decoding a full FIFO burst must not allocate on the heap.
+# On the board gc.mem_alloc() must not move at all. On a PC ints above 256
+# are objects and only the peak is seen (tracemalloc): the peak of a whole
+# burst must stay within a few objects of the peak of a single sample,
+# nothing is kept per sample.
+# Runs on the board or on a PC: PYTHONPATH=.:lib python lib/test/decode_alloc_test.py
+
+sensor = MAX30102(i2c=i2c)
+# Configuration normally set by set_led_mode() / set_pulse_width()
+sensor._active_leds = 3
+sensor._multi_led_read_mode = 9
+sensor._pulse_width = 3
+
+for i in range(len(sensor._fifo_buf)):
+    sensor._fifo_buf[i] = (i * 37 + 11) & 0xFF
+
+print("Checking decoded values...")
+sensor.decode_fifo(MAX30105_FIFO_DEPTH)
+for i in range(MAX30105_FIFO_DEPTH):
+    offset = i * 9
+    assert sensor._red_block[i] == sensor.fifo_bytes_to_int(sensor._fifo_buf[offset:offset + 3])
+    assert sensor._ir_block[i] == sensor.fifo_bytes_to_int(sensor._fifo_buf[offset + 3:offset + 6])
+    assert sensor._green_block[i] == sensor.fifo_bytes_to_int(sensor._fifo_buf[offset + 6:offset + 9])
+
+
+def decode_allocations(n):
+    # Locals only: module-level assignments could grow the globals dict
+    sensor.decode_fifo(n)
+    gc.collect()
+    mark = alloc_mark()
+    sensor.decode_fifo(n)
+    return alloc_since(mark)
+
+
+print("Counting allocations...")
+allocated = decode_allocations(MAX30105_FIFO_DEPTH)
+print("Bytes allocated by decode_fifo():", allocated)
+if sys.implementation.name == 'micropython':
+    assert allocated == 0
+else:
+    single = decode_allocations(1)
+    assert allocated - single <= 64, (allocated, single)
+
+print("Decode allocation test OK.")
@@ -0,0 +1,40 @@
+from array import array
+
+from emitter import import_native
+from synthetic import synthetic_ppg
+
+# A module with @micropython.native code compiled as bytecode (what a port
+# without the native emitter gets) must work like the native one.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/emitter_test.py
+
+FS = 50
+N = 200
+
+print("Native import...")
+native = import_native('filter')
+raw = synthetic_ppg(N, FS)
+expected = array('f', [0.0] * N)
+native.BandpassFilter(FS, 0.5, 8.0).process(raw, expected, N, gain=-1)
+
+print("Bytecode from the source...")
+bytecode = import_native('filter', native=False)
+assert bytecode is not native
+out = array('f', [0.0] * N)
+bytecode.BandpassFilter(FS, 0.5, 8.0).process(raw, out, N, gain=-1)
+assert out == expected
+bank = bytecode.FilterBank(1, FS, 0.5, 8.0)
+bank.process(raw, out, N, gain=-1)
+reference = native.FilterBank(1, FS, 0.5, 8.0)
+reference.process(raw, expected, N, gain=-1)
+assert out == expected
+# Later imports get the bytecode module
+from filter import SOSBandpassFilter
+assert SOSBandpassFilter is bytecode.SOSBandpassFilter
+
+try:
+    import_native('no_such_module', native=False)
+    assert False, "a missing module"
+except ImportError:
+    pass
+
+print("Emitter test OK.")
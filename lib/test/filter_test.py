@@ -0,0 +1,177 @@
+import math
+from array import array
+from filter import (BandpassFilter, FilterBank, FixedBandpassFilter, FixedFilterBank, SOSBandpassFilter,
+                    butter_bandpass_sos)
+from synthetic import synthetic_ppg
+
+# Block filtering must give exactly the same output as step(), and the
+# integer filter must stay within its error bound of the float one.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/filter_test.py
+
+FS = 50
+N = 500
+
+
+raw = synthetic_ppg(N, FS, depth=400)
+
+print("Reference: step() per sample...")
+reference = BandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0)
+expected = [reference.step(x * -1) for x in raw]
+
+print("process() into a list...")
+bp = BandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0)
+out = []
+# Uneven blocks, like FIFO drains
+sizes = (7, 32, 1, 25, 32, 3)
+start = 0
+k = 0
+while start < N:
+    n = min(sizes[k % len(sizes)], N - start)
+    dst = [0.0] * n
+    bp.process(raw[start:start + n], dst, n, gain=-1)
+    out.extend(dst)
+    start += n
+    k += 1
+assert out == expected
+assert (bp.x_prev, bp.y_hp_prev, bp.y_lp_prev) == (reference.x_prev, reference.y_hp_prev, reference.y_lp_prev)
+
+print("process() in place on array('f')...")
+bp = BandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0)
+reference.reset()
+buf = array('f', raw)
+expected = array('f', [reference.step(x) for x in buf])
+bp.process(buf, buf, N)
+assert buf == expected
+
+print("FixedBandpassFilter process() vs step()...")
+fixed = FixedBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0)
+expected = [fixed.step(x * -1) for x in raw]
+fixed.reset()
+out = array('l', [0] * N)
+fixed.process(array('l', raw), out, N, gain=-1)
+assert list(out) == expected
+
+print("FixedBandpassFilter error bound...")
+for fs in (50, 100, 400):
+    raw_fs = synthetic_ppg(fs * 20, fs, depth=400)
+    float_bp = BandpassFilter(fs=fs, fc_hp=0.5, fc_lp=8.0)
+    fixed = FixedBandpassFilter(fs=fs, fc_hp=0.5, fc_lp=8.0)
+    # High-pass settling time: 5 time constants
+    settle = int(5 / (2 * math.pi * 0.5) * fs)
+    for i in range(len(raw_fs)):
+        error = abs(fixed.step(raw_fs[i] * -1) - float_bp.step(raw_fs[i] * -1))
+        assert error <= (1.0 if i >= settle else 1.5), (fs, i, error)
+
+print("Butterworth SOS design...")
+for fs in (25, 50, 100, 400):
+    for order in (1, 2, 4):
+        sos = butter_bandpass_sos(fs, 0.5, 8.0, order)
+        assert butter_bandpass_sos(fs, 0.5, 8.0, order) is sos  # cached
+        # Pre-warping puts the edges exactly at -3 dB; unity gain is at the
+        # centre of the warped band, close to the geometric centre
+        for f, expected, tolerance in ((0.5, math.sqrt(0.5), 1e-6),
+                                       (8.0, math.sqrt(0.5), 1e-6),
+                                       (2.0, 1.0, 0.01)):
+            # |H(f)| of the cascade, z^-1 = e^(-jw)
+            w = 2 * math.pi * f / fs
+            z1 = complex(math.cos(w), -math.sin(w))
+            h = 1.0
+            for c in range(0, 5 * order, 5):
+                b0, b1, b2, a1, a2 = sos[c:c + 5]
+                h *= abs((b0 + b1 * z1 + b2 * z1 * z1) / (1 + a1 * z1 + a2 * z1 * z1))
+            assert abs(h - expected) < tolerance, (fs, order, f, h)
+
+print("SOSBandpassFilter process() vs step()...")
+reference = SOSBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0, order=2)
+expected = [reference.step(x * -1) for x in raw]
+sos_bp = SOSBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0, order=2)
+out = array('f', [0.0] * N)
+start = 0
+while start < N:
+    n = min(32, N - start)
+    block = array('f', [0.0] * n)
+    sos_bp.process(raw[start:start + n], block, n, gain=-1)
+    out[start:start + n] = block
+    start += n
+# The state is single precision: step() rounds it every sample
+for i in range(N):
+    assert abs(out[i] - expected[i]) < 0.5, (i, out[i], expected[i])
+
+print("FilterBank on interleaved blocks vs one filter per channel...")
+channels = (raw, synthetic_ppg(N, FS, hr_bpm=90.0, depth=400), synthetic_ppg(N, FS, hr_bpm=55.0, depth=400))
+expected = []
+for samples in channels:
+    single = SOSBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0, order=3)
+    dst = []
+    # Same block boundaries: the state is rounded to single precision
+    for start in range(0, N, 32):
+        n = min(32, N - start)
+        block = [0.0] * n
+        single.process(samples[start:start + n], block, n, gain=-1)
+        dst.extend(block)
+    expected.append(dst)
+bank = FilterBank(3, fs=FS, fc_hp=0.5, fc_lp=8.0, order=3)
+start = 0
+while start < N:
+    n = min(32, N - start)
+    block = []
+    for i in range(start, start + n):
+        block.extend((channels[0][i], channels[1][i], channels[2][i]))
+    bank.process(block, block, n, gain=-1)
+    for i in range(n):
+        for ch in range(3):
+            assert block[3 * i + ch] == expected[ch][start + i], (ch, start + i)
+    start += n
+
+print("FixedFilterBank vs one FixedBandpassFilter per channel...")
+singles = [FixedBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0) for _ in channels]
+for ch in range(3):
+    singles[ch].warm_start(channels[ch], 32, gain=-1)
+bank = FixedFilterBank(3, fs=FS, fc_hp=0.5, fc_lp=8.0)
+start = 0
+while start < N:
+    n = min(32, N - start)
+    if start == 256:
+        # Retuned on the way, like main.py on the measured rate
+        bank.retune(FS + 0.5)
+        for single in singles:
+            single.retune(FS + 0.5)
+    block = array('l')
+    for i in range(start, start + n):
+        block.extend((channels[0][i], channels[1][i], channels[2][i]))
+    if start == 0:
+        bank.warm_start(block, 32, gain=-1)
+    bank.process(block, block, n, gain=-1)
+    for ch in range(3):
+        expected = array('l', [0] * n)
+        singles[ch].process(channels[ch][start:start + n], expected, n, gain=-1)
+        for i in range(n):
+            assert block[3 * i + ch] == expected[i], (ch, start + i)
+    start += n
+
+print("warm_start(): first window already settled...")
+for make in (lambda: BandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0),
+             lambda: FixedBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0),
+             lambda: SOSBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0, order=2)):
+    cold = make()
+    for x in raw[:N]:
+        cold.step(x * -1)
+    # Settled output level (2nd pass over the data)
+    steady = max(abs(cold.step(x * -1)) for x in raw[:N])
+    warm = make()
+    warm.warm_start(raw, 32, gain=-1)
+    first_window = max(abs(warm.step(x * -1)) for x in raw[:100])
+    assert first_window < 1.5 * steady, (first_window, steady)
+
+print("retune(): no jump when the rate changes...")
+for bp in (BandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0),
+           FixedBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0),
+           SOSBandpassFilter(fs=FS, fc_hp=0.5, fc_lp=8.0, order=2)):
+    bp.warm_start(raw, 32, gain=-1)
+    out = [bp.step(x * -1) for x in raw[:250]]
+    bp.retune(FS * 1.05)
+    out.extend(bp.step(x * -1) for x in raw[250:N])
+    largest_step = max(abs(out[i] - out[i - 1]) for i in range(200, 300))
+    assert abs(out[250] - out[249]) <= largest_step, (out[249], out[250])
+
+print("Filter test OK.")
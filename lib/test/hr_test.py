@@ -0,0 +1,94 @@
+from filter import SOSBandpassFilter
+from hrcalculator import StreamingPeakDetector, compute_hr, hr_from_rr
+from synthetic import synthetic_ppg
+
+# The streaming detector must find the beats compute_hr() finds, at the
+# same sample indices, across window boundaries.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/hr_test.py
+
+for fs, hr_bpm in ((25, 90.0), (50, 72.0), (100, 55.0), (400, 120.0)):
+    print("fs = {} Hz, {} BPM...".format(fs, hr_bpm))
+    raw = synthetic_ppg(fs * 30, fs, hr_bpm)
+    bp = SOSBandpassFilter(fs=fs, fc_hp=0.5, fc_lp=8.0)
+    bp.warm_start(raw, 32, gain=-1)
+    filtered = [bp.step(x * -1) for x in raw]
+
+    # Streaming, FIFO-sized blocks
+    detector = StreamingPeakDetector(fs)
+    beats = []
+    rr_intervals = []
+    for start in range(0, len(filtered), 32):
+        n = min(32, len(filtered) - start)
+        detector.process(filtered[start:start + n], n)
+        while detector.available():
+            index, rr = detector.pop_beat()
+            beats.append(index)
+            if rr is not None:
+                rr_intervals.append(rr)
+
+    # Batch, 2 s windows
+    window = 2 * fs
+    for start in range(0, len(filtered) - window + 1, window):
+        result = compute_hr(filtered[start:start + window], fs)
+        if result is None:
+            # Fewer than 2 beats in the window (slow HR)
+            continue
+        for i in result[1]:
+            if start + i >= len(filtered) - fs:
+                break  # Not confirmed yet by the end of the stream
+            assert min(abs(start + i - b) for b in beats) <= 1, (start + i)
+
+    # Every beat, none twice
+    assert abs(len(beats) - 30 * hr_bpm / 60.0) <= 1, len(beats)
+    assert abs(hr_from_rr(rr_intervals) - hr_bpm) < 1.0
+
+print("skip(): no RR across a gap...")
+# filtered: last signal above (400 Hz, 120 BPM), 2.5 s on each side
+detector = StreamingPeakDetector(400)
+detector.process(filtered, 1000)
+detector.skip(7)
+detector.process(filtered, 1000)
+gaps = 0
+while detector.available():
+    index, rr = detector.pop_beat()
+    if rr is None:
+        gaps += 1
+assert gaps == 2
+
+print("retune(): jitter across a window boundary...")
+# 100 Hz, 60 BPM: int(fs * 0.05) is 4 below 100 Hz, 5 from 100 Hz
+fs = 100
+raw = synthetic_ppg(fs * 30, fs, 60.0)
+bp = SOSBandpassFilter(fs=fs, fc_hp=0.5, fc_lp=8.0)
+bp.warm_start(raw, 32, gain=-1)
+filtered = [bp.step(x * -1) for x in raw]
+steady = StreamingPeakDetector(fs)
+steady.process(filtered, len(filtered))
+jittered = StreamingPeakDetector(fs)
+for k, start in enumerate(range(0, len(filtered), 32)):
+    jittered.retune(99.5 if k % 2 else 100.0)
+    n = min(32, len(filtered) - start)
+    jittered.process(filtered[start:start + n], n)
+assert jittered.win == 4 and jittered._hist_size == 12
+# No beat lost or restarted at a retune
+assert jittered.available() == steady.available()
+while steady.available():
+    index, rr = steady.pop_beat()
+    jittered_index, jittered_rr = jittered.pop_beat()
+    assert abs(jittered_index - index) <= 1
+    assert (rr is None) == (jittered_rr is None)
+    if rr is not None:
+        assert abs(jittered_rr - rr) < 0.02
+
+print("retune(): RR at the rate of detection...")
+detector = StreamingPeakDetector(fs)
+detector.process(filtered, 1000)
+beats = detector.available()
+assert beats >= 8
+# The filters follow a new rate before the beats are read (main.py)
+detector.retune(2 * fs)
+for k in range(beats):
+    index, rr = detector.pop_beat()
+    assert rr is None or abs(rr - 1.0) < 0.02, rr
+
+print("HR test OK.")
@@ -0,0 +1,59 @@
+import math
+from hrv import HRVEngine
+from synthetic import lcg
+
+# Streaming metrics must match the textbook formulas over the RR intervals
+# of the same horizon.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/hrv_test.py
+
+
+def reference(rr_list, diffs):
+    # rr_list: RR intervals (s), diffs: their successive differences
+    n = len(rr_list)
+    mean_rr = sum(rr_list) / n
+    sdnn = math.sqrt(sum((rr - mean_rr) ** 2 for rr in rr_list) / (n - 1))
+    rmssd = math.sqrt(sum(d * d for d in diffs) / len(diffs))
+    pnn50 = 100.0 * len([d for d in diffs if abs(d) > 0.05]) / len(diffs)
+    return 60.0 / mean_rr, 1000.0 * sdnn, 1000.0 * rmssd, pnn50
+
+
+print("1 min and 5 min horizons over 10 minutes of beats...")
+engine = HRVEngine(horizons=(60, 300), bucket_seconds=10)
+beats = []  # (time, rr, difference with the previous RR or None)
+t = 0.0
+seed = 7
+chained = False
+for i in range(800):
+    seed = lcg(seed)
+    # Respiratory sinus arrhythmia plus jitter
+    rr = 0.8 + 0.06 * math.sin(2 * math.pi * t / 4.0) + ((seed >> 16) % 41 - 20) * 0.002
+    t += rr
+    if i % 97 == 50:
+        # A rejected beat: the next difference is not taken
+        engine.add(None, t)
+        chained = False
+        continue
+    engine.add(rr, t)
+    beats.append((t, rr, rr - beats[-1][1] if chained else None))
+    chained = True
+
+    if i > 100 and i % 25 == 0:
+        for horizon in (60, 300):
+            # Beats of the buckets the horizon covers (a difference counts
+            # with the second beat)
+            k = horizon // engine.bucket_seconds
+            start = engine._bucket_end - k * engine.bucket_seconds
+            selected = [b for b in beats if b[0] >= start - 1e-9]
+            expected = reference([b[1] for b in selected],
+                                 [b[2] for b in selected if b[2] is not None])
+            metrics = engine.metrics(horizon)
+            assert metrics["n"] == len(selected)
+            got = (metrics["mean_hr"], metrics["sdnn_ms"], metrics["rmssd_ms"], metrics["pnn50"])
+            for value, reference_value, tolerance in zip(got, expected, (0.01, 0.5, 0.05, 1e-6)):
+                assert abs(value - reference_value) < tolerance, (horizon, got, expected)
+
+print("Silence longer than the horizons...")
+engine.advance(t + 1000)
+assert engine.metrics(60) is None and engine.metrics(300) is None
+
+print("HRV test OK.")
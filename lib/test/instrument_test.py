@@ -0,0 +1,86 @@
+import gc
+
+try:
+    import utime
+except ImportError:
+    # On a PC: the host stand-ins of the MicroPython modules
+    import host
+    host.install()
+
+from instrument import Instrumentation
+
+# Stage times and values must land in the right buckets, the report must
+# add up, and recording must not allocate (on the board: gc.mem_alloc()).
+# Runs on the board or on a PC: PYTHONPATH=.:lib python lib/test/instrument_test.py
+
+stats = Instrumentation(("a", "b"), ("depth",), ("stalls",), n_buckets=6, first_us=32,
+                        n_value_buckets=9, value_width=4)
+
+print("Stage buckets...")
+# [0, 32), [32, 64), [64, 128), [128, 256), [256, 512), 512 and above
+for dt, bucket in ((0, 0), (31, 0), (32, 1), (63, 1), (64, 2), (255, 3), (256, 4),
+                   (511, 4), (512, 5), (100000, 5), (-5, 0)):
+    stats.reset()
+    stats.record(1, dt)
+    hist = stats.report()["stages"]["b"]["hist"]
+    assert hist[bucket] == 1 and sum(hist) == 1, (dt, hist)
+
+print("Values and counters...")
+stats.reset()
+for value in (0, 1, 3, 4, 31, 32, 63):
+    stats.record_value(0, value)
+stats.count(0)
+stats.count(0, 2)
+stats.record(0, 40)
+stats.record(0, 80)
+report = stats.report()
+depth = report["values"]["depth"]
+assert depth["hist"] == [3, 1, 0, 0, 0, 0, 0, 1, 2], depth
+assert depth["n"] == 7 and depth["max"] == 63 and depth["mean"] == 134 / 7
+assert report["counters"]["stalls"] == 3
+a = report["stages"]["a"]
+assert a["n"] == 2 and a["mean_us"] == 60 and a["max_us"] == 80
+# Stages never run are left out
+assert "b" not in report["stages"]
+assert stats.records() == 9
+
+print("Reset...")
+stats.reset()
+report = stats.report()
+assert report["stages"] == {} and report["counters"]["stalls"] == 0
+assert report["values"]["depth"]["n"] == 0 and report["values"]["depth"]["mean"] is None
+
+print("Calibration...")
+cost = stats.calibrate(100)
+assert cost >= 0 and stats.records() == 0
+print("Cost of one record:", cost, "us")
+
+try:
+    Instrumentation(("a",), n_buckets=1)
+    assert False, "a single bucket"
+except ValueError:
+    pass
+
+
+def record_allocations():
+    # Locals only: module-level assignments could grow the globals dict
+    t = stats.lap(0, 0)
+    stats.record_value(0, 17)
+    stats.count(0)
+    gc.collect()
+    before = gc.mem_alloc()
+    for i in range(100):
+        t = stats.lap(1, t)
+        stats.record(0, i * 97)
+        stats.record_value(0, i)
+        stats.count(0)
+    return gc.mem_alloc() - before
+
+
+if hasattr(gc, "mem_alloc"):
+    print("Counting allocations...")
+    allocated = record_allocations()
+    print("Bytes allocated by 100 records:", allocated)
+    assert allocated == 0
+
+print("Instrument test OK.")
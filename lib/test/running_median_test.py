@@ -0,0 +1,36 @@
+from running_median import RunningMedian
+from synthetic import lcg
+
+# The running median must equal the sorted median of the last values,
+# through fills, evictions, duplicates and clears.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/running_median_test.py
+
+
+def sorted_median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[mid]
+    return 0.5 * (values[mid - 1] + values[mid])
+
+
+print("Against sorted() over a sliding window...")
+for capacity in (1, 2, 3, 8, 15, 16):
+    running = RunningMedian(capacity)
+    assert running.median() is None
+    history = []
+    seed = capacity
+    for i in range(600):
+        seed = lcg(seed)
+        # Few distinct values: plenty of duplicates
+        value = ((seed >> 16) % 40) * 0.025 + 0.4
+        running.push(value)
+        history.append(running.values[(running.head + running.count - 1) % capacity])
+        window = history[-capacity:]
+        assert len(running) == len(window)
+        assert running.median() == sorted_median(window), (capacity, i)
+        if i == 300:
+            running.clear()
+            history = []
+
+print("Running median test OK.")
@@ -0,0 +1,76 @@
+import math
+from array import array
+from spo2calculator import SpO2Accumulator, compute_spo2
+from synthetic import lcg
+from window import SlidingWindow
+
+# The accumulator must give the value compute_spo2() gives on the same
+# window, while samples slide in and out block by block.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/spo2_test.py
+
+FS = 50
+WINDOW = 8 * FS
+N = 30 * FS
+
+
+def channel(n, dc, ac, seed):
+    # Raw samples and a zero-mean "filtered" version of them
+    raw = []
+    filtered = []
+    for i in range(n):
+        seed = lcg(seed)
+        wave = ac * math.sin(2 * math.pi * 1.2 * i / FS) + (seed >> 16) % 11 - 5
+        raw.append(int(dc + wave))
+        filtered.append(-wave)
+    return raw, filtered
+
+
+raw_red, red = channel(N, 40000, 300, 1)
+raw_ir, ir = channel(N, 52000, 450, 2)
+
+print("Sliding accumulator vs compute_spo2()...")
+raw_window = SlidingWindow(WINDOW, FS, 2, 'l')
+filtered_window = SlidingWindow(WINDOW, FS, 2, 'f')
+accumulator = SpO2Accumulator(min_samples=40)
+raw_block = array('l', [0] * 64)
+filtered_block = array('f', [0.0] * 64)
+evicted_raw = array('l', [0] * 64)
+evicted_filtered = array('f', [0.0] * 64)
+start = 0
+checked = 0
+while start < N:
+    n = min(32, N - start)
+    for i in range(n):
+        raw_block[2 * i] = raw_red[start + i]
+        raw_block[2 * i + 1] = raw_ir[start + i]
+        filtered_block[2 * i] = red[start + i]
+        filtered_block[2 * i + 1] = ir[start + i]
+    n_out = len(raw_window) + n - WINDOW
+    if n_out > 0:
+        raw_window.oldest_into(evicted_raw, n_out)
+        filtered_window.oldest_into(evicted_filtered, n_out)
+        accumulator.remove_block(evicted_raw, evicted_filtered, n_out)
+    accumulator.add_block(raw_block, filtered_block, n)
+    raw_window.extend(raw_block, n)
+    filtered_window.extend(filtered_block, n)
+    start += n
+
+    first = max(0, start - WINDOW)
+    expected = compute_spo2(array('f', ir[first:start]), array('f', red[first:start]),
+                            raw_ir[first:start], raw_red[first:start], min_samples=40)
+    value = accumulator.value()
+    if expected is None:
+        assert value is None
+    else:
+        # Filtered samples are accumulated in 1/16 counts
+        assert abs(value - expected) < 0.01, (start, value, expected)
+        checked += 1
+assert checked > 0
+# One LED (HR mode): no IR channel, no SpO2
+try:
+    accumulator.add_block(raw_block, filtered_block, 1, 1)
+    assert False, "a single channel"
+except ValueError:
+    pass
+
+print("SpO2 test OK.")
@@ -0,0 +1,70 @@
+from array import array
+
+from stream import SampleBatch
+from synthetic import lcg
+
+# The sample lines must read like "S, {},{:.1f},{:.1f}\n".format(), and a
+# full batch must refuse the lines it has no room for.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/stream_test.py
+
+
+def reference(sample_id, red, ir):
+    return "S, {},{:.1f},{:.1f}\n".format(sample_id, red, ir)
+
+
+def is_tie(value):
+    # x.x5 of the binary value: format() and round() may disagree
+    scaled = abs(value) * 10
+    return abs(scaled - int(scaled) - 0.5) < 1e-3
+
+
+print("Against format()...")
+values = array('f', [0.0, 0.04, -0.04, 0.06, -0.06, 1.0, -1.0, 9.96, -9.96, 123.4,
+                     -2048.7, 131071.0, -131071.9, 0.5, 1e6 + 0.3])
+seed = 7
+for i in range(400):
+    seed = lcg(seed)
+    values.append(((seed >> 8) % 2000000 - 1000000) / 97.0)
+if len(values) % 2:
+    values.append(0.0)
+n = len(values) // 2
+batch = SampleBatch(n)
+assert batch.add_block(values, n, 99995) == n
+assert len(batch) == n
+lines = bytes(batch.view()).decode().split("\n")[:-1]
+assert len(lines) == n
+for k in range(n):
+    red = values[2 * k]
+    ir = values[2 * k + 1]
+    expected = reference(99995 + k, red, ir)[:-1]
+    if lines[k] != expected:
+        assert is_tie(red) or is_tie(ir), (lines[k], expected)
+# -0.0 like format(): a negative value rounded to zero keeps its sign
+assert lines[1].split(",")[2:] == ["-0.0", "0.1"], lines[1]
+
+print("Full batch...")
+batch = SampleBatch(3)
+block = array('f', [1.25, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0])
+assert batch.add_block(block, 2, 1) == 2
+assert batch.add_block(block, 4, 3) == 1
+assert batch.add_block(block, 1, 4) == 0
+assert bytes(batch.view()) == b"S, 1,1.2,2.0\nS, 2,3.0,4.0\nS, 3,1.2,2.0\n"
+batch.clear()
+assert len(batch) == 0 and bytes(batch.view()) == b""
+# Three channels interleaved: the third one is not streamed
+assert batch.add_block(block, 2, 10, 3) == 2
+assert bytes(batch.view()) == b"S, 10,1.2,2.0\nS, 11,4.0,5.0\n"
+
+try:
+    SampleBatch(0)
+    assert False, "an empty batch"
+except ValueError:
+    pass
+# One LED (HR mode): no IR channel to stream
+try:
+    batch.add_block(block, 2, 12, 1)
+    assert False, "a single channel"
+except ValueError:
+    pass
+
+print("Stream test OK.")
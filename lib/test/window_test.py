@@ -0,0 +1,44 @@
+from array import array
+from window import SlidingWindow
+
+# The ring order must match a plain list of the last `size` frames,
+# whatever the block sizes.
+# Runs on the board or on a PC: PYTHONPATH=lib python lib/test/window_test.py
+
+SIZE = 50
+HOP = 10
+
+print("Order and hops over uneven blocks...")
+for typecode in ('l', 'f'):
+    window = SlidingWindow(SIZE, HOP, 2, typecode)
+    frames = []
+    results = 0
+    value = 0
+    for n in (7, 32, 1, 25, 32, 3) * 5:
+        block = array(typecode, [0] * (2 * n))
+        for i in range(n):
+            value += 1
+            block[2 * i] = 50000 + (value * 37) % 101
+            block[2 * i + 1] = -(value * 13) % 57
+            frames.append((block[2 * i], block[2 * i + 1]))
+        window.extend(block, n)
+        while window.hop_ready():
+            results += 1
+        last = frames[-SIZE:]
+        assert len(window) == len(last)
+        dest = array(typecode, [0] * (2 * SIZE))
+        assert window.oldest_into(dest, SIZE) == len(last)
+        assert list(dest[:2 * len(last)]) == [x for frame in last for x in frame]
+    assert results == len(frames) // HOP
+
+print("Lost frames count in the hop...")
+window = SlidingWindow(SIZE, HOP, 1, 'l')
+window.extend(array('l', [1] * 6), 6)
+window.skip(4)
+assert window.hop_ready() and window.lost() == 4
+for i in range(SIZE // HOP):
+    window.extend(array('l', [1] * HOP), HOP)
+    assert window.hop_ready()
+assert window.lost() == 0
+
+print("Window test OK.")
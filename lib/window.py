@@ -0,0 +1,90 @@
+from array import array
+
+
+class SlidingWindow(object):
+    ''' Last `size` frames of interleaved channels in one ring, with a result due every `hop` frames '''
+    def __init__(self, size, hop, n_channels=1, typecode='f'):
+        # size: window length (frames), hop: frames between two results
+        # n_channels: values per frame, interleaved like the FIFO blocks
+        if not 0 < hop <= size:
+            raise ValueError('Wrong hop size:{0}!'.format(hop))
+        self.size = size
+        self.hop = hop
+        self.n_channels = n_channels
+        self.data = array(typecode, [0] * (size * n_channels))
+        # Index of the oldest frame, frame count
+        self.head = 0
+        self.count = 0
+        # Frames added since the last result
+        self._since_hop = 0
+        # Frames lost (skip()) during each of the hops covered by the window
+        self._hop_lost = array('l', [0] * ((size + hop - 1) // hop))
+        self._hop_i = 0
+
+    def __len__(self):
+        return self.count
+
+    def extend(self, src, n):
+        # Adds n interleaved frames src[0:n * n_channels]; the oldest frames
+        # leave the window. O(1) per value.
+        data = self.data
+        n_channels = self.n_channels
+        size = self.size
+        tail = (self.head + self.count) % size
+        j = 0
+        for i in range(n):
+            k = tail * n_channels
+            for ch in range(n_channels):
+                data[k + ch] = src[j + ch]
+            if self.count == size:
+                self.head = tail + 1 if tail + 1 < size else 0
+            else:
+                self.count += 1
+            tail += 1
+            if tail == size:
+                tail = 0
+            j += n_channels
+        self._since_hop += n
+
+    def skip(self, n):
+        # n frames were lost: they count in the hop, not in the window data
+        self._hop_lost[self._hop_i] += n
+        self._since_hop += n
+
+    def lost(self):
+        # Frames lost over (about) the time span of the window
+        return sum(self._hop_lost)
+
+    def hop_ready(self):
+        # True once every hop frames: a new result is due. The window may
+        # not be full yet (first results)
+        if self._since_hop < self.hop:
+            return False
+        self._since_hop -= self.hop
+        self._hop_i = (self._hop_i + 1) % len(self._hop_lost)
+        self._hop_lost[self._hop_i] = 0
+        return True
+
+    def oldest_into(self, dest, n):
+        # Copies the n oldest frames (all channels, interleaved) into dest,
+        # e.g. the ones the next extend() pushes out; returns their count
+        if n > self.count:
+            n = self.count
+        data = self.data
+        n_values = n * self.n_channels
+        k = self.head * self.n_channels
+        end = self.size * self.n_channels
+        for i in range(n_values):
+            dest[i] = data[k]
+            k += 1
+            if k == end:
+                k = 0
+        return n
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self._since_hop = 0
+        for i in range(len(self._hop_lost)):
+            self._hop_lost[i] = 0
+
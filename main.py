@@ -1,7 +1,8 @@
 # system
 from machine import I2C, Pin
-from utime import ticks_diff, ticks_us 
-import gc # For garbage collection
+from array import array
+from micropython import const
+from utime import sleep_ms
 import json
 import network
 import time
@@ -9,12 +10,23 @@ import socket
 
 # external
 from lib.max30205 import MAX30205
-from lib.max30102 import MAX30102, MAX30105_PULSE_AMP_MEDIUM
-from lib.filter import BandpassFilter
+from lib.max30102 import MAX30102, MAX30105_PULSE_AMP_MEDIUM, MAX30105_FIFO_DEPTH
+# Modules with @micropython.native code: bytecode on ports built without
+# the native emitter
+from lib.emitter import import_native
+import_native('lib.filter')
+import_native('lib.stream')
+from lib.filter import FilterBank, FixedFilterBank
+from lib.window import SlidingWindow
 
 # project_modules
-from lib.hrcalculator import compute_hr
-from lib.spo2calculator import compute_spo2
+from lib.hrcalculator import StreamingPeakDetector, HR_MAX_BPM, HR_MIN_BPM
+from lib.running_median import RunningMedian
+from lib.hrv import HRVEngine
+from lib.spo2calculator import SpO2Accumulator
+from lib.instrument import Instrumentation
+from lib.heap import IdleCollector
+from lib.stream import SampleBatch
 
 ################################################################
 # CONFIGURATION
@@ -22,6 +34,28 @@ from lib.spo2calculator import compute_spo2
 DEBUG = False 
 SSID = "" # Fill
 PASSWORD = ""# Fill
+# Band-pass filter: Butterworth, FILTER_ORDER second-order sections (float),
+# or with INTEGER_FILTER 1st order in integer math (no float allocated per
+# sample, FixedFilterBank)
+FILTER_ORDER = 2
+INTEGER_FILTER = False
+# The filters follow the measured rate in steps of RETUNE_STEP_HZ
+RETUNE_STEP_HZ = 0.5
+# Stage timers, latency histograms and counters, sent as a "stats" packet
+# every STATS_WINDOWS windows. With const(0) the compiler drops every
+# `if INSTRUMENT:` block
+INSTRUMENT = const(1)
+STATS_WINDOWS = 10
+# Allocation profiler: the stats also count the bytes allocated by each
+# stage (gc.mem_alloc() deltas, tracemalloc on a PC). Costs a little time.
+PROFILE_ALLOC = const(0)
+# Garbage collection: one collection in idle time (FIFO empty) per
+# GC_BUDGET_BYTES allocated; one anyway past GC_BACKSTOP_BYTES (a loop that
+# never gets idle), well under the free heap
+GC_BUDGET_BYTES = 16384
+GC_BACKSTOP_BYTES = 32768
+# Sample lines sent per packet
+BATCH_LINES = 15
 
 ################################################################
 # SETUP FUNCTIONS
@@ -81,24 +115,36 @@ print("System ready, initializing sensors...")
 my_SDA_pin = 26
 my_SCL_pin = 27
 my_i2c_freq = 1000000 # 1 MHz
+my_INT_pin = None # GPIO wired to the MAX30102 INT line (None: poll the FIFO)
 
 i2c = I2C(1, sda=Pin(my_SDA_pin), scl=Pin(my_SCL_pin), freq=my_i2c_freq)
 
 # MAX30102 Setup
 sensor = MAX30102(i2c=i2c)
 sensor.setup_sensor()
-sensor.set_fifo_average(2) 
-sensor.set_adc_range(16384) 
-sensor.set_sample_rate(100) 
-sensor.set_pulse_width(215) 
-sensor.set_led_mode(2) 
-sensor.set_pulse_amplitude_red(MAX30105_PULSE_AMP_MEDIUM) 
-sensor.set_pulse_amplitude_it(MAX30105_PULSE_AMP_MEDIUM) 
-sensor.set_active_leds_amplitude(MAX30105_PULSE_AMP_MEDIUM)
+# Only registers whose value changes are written
+sensor.apply_config({
+    "sample_avg": 2,
+    "adc_range": 16384,
+    "sample_rate": 100,
+    "pulse_width": 215,
+    "led_mode": 2,
+    "red_amplitude": MAX30105_PULSE_AMP_MEDIUM,
+    "ir_amplitude": MAX30105_PULSE_AMP_MEDIUM,
+    "led_power": MAX30105_PULSE_AMP_MEDIUM,
+})
+if my_INT_pin is not None:
+    # Drain the FIFO from the 'almost full' interrupt instead of polling
+    sensor.enable_interrupt(Pin(my_INT_pin, Pin.IN, Pin.PULL_UP))
+# Die temperature: one non-blocking conversion per window
+sensor.start_temperature(use_interrupt=my_INT_pin is not None)
 
 # MAX30205 Setup
 try:
-    temp_sensor = MAX30205(i2c=i2c, calibration_offset = 4.45)
+    # Body temperature changes over minutes: one one-shot conversion every
+    # 10 s, the sensor stays in shutdown in between
+    temp_sensor = MAX30205(i2c=i2c, calibration_offset = 4.45,
+                           refresh_ms=10000, one_shot=True)
 except Exception as e:
     temp_sensor = None
 
@@ -106,178 +152,344 @@ except Exception as e:
 # GLOBAL VARIABLES & BUFFERS
 ################################################################
 
-BUFFER_SIZE = 100 
-red_buffer = []
-ir_buffer = []
-raw_red_buffer = []
-raw_ir_buffer = []
+# Results: over the last WINDOW_SECONDS of signal, every HOP_SECONDS
+WINDOW_SECONDS = 8
+HOP_SECONDS = 1
+# HR: median of the last RR_HISTORY RR intervals; no plausible beat for
+# HR_TIMEOUT_SECONDS (e.g. finger removed) and the history starts over
+RR_HISTORY = 16
+HR_TIMEOUT_SECONDS = 3
+# HRV metrics over these rolling horizons (seconds)
+HRV_HORIZONS = (60, 300)
+# Samples moved out of the sensor storage per call, all channels
+# interleaved in FIFO order (red, IR)
+BLOCK_SIZE = MAX30105_FIFO_DEPTH
+N_CHANNELS = sensor.get_active_leds()
+block = array('l', [0] * (BLOCK_SIZE * N_CHANNELS))
+filtered_block = array('f', [0.0] * (BLOCK_SIZE * N_CHANNELS))
 
 # Timing & Frequency
-compute_frequency = True
-f_HZ = 0 
-t_start = ticks_us() 
-samples_n = 0 
-
-# Filters
-bp_filter_ir = None 
-bp_filter_red = None
-filters_ready = False 
+# Starts from the configured rate (sample_rate / sample_avg), then follows
+# the rate measured on the sensor clock
+f_HZ = sensor.get_acquisition_frequency()
+
+# Analysis windows: raw and filtered blocks go into rings shared by all
+# the overlapping windows (nothing recomputed per window)
+WINDOW_SIZE = int(WINDOW_SECONDS * f_HZ)
+HOP_SIZE = int(HOP_SECONDS * f_HZ)
+raw_window = SlidingWindow(WINDOW_SIZE, HOP_SIZE, N_CHANNELS, 'l')
+filtered_window = SlidingWindow(WINDOW_SIZE, HOP_SIZE, N_CHANNELS, 'f')
+# SpO2 sums of the windows: samples are added as they come in and removed
+# as the windows push them out
+spo2_accumulator = SpO2Accumulator(min_samples=40)
+evicted_block = array('l', [0] * (BLOCK_SIZE * N_CHANNELS))
+evicted_filtered_block = array('f', [0.0] * (BLOCK_SIZE * N_CHANNELS))
+
+# Filters: one bank for all channels, warm-started on the first block
+if INTEGER_FILTER:
+    bp_filters = FixedFilterBank(N_CHANNELS, fs=f_HZ, fc_hp=0.5, fc_lp=8.0)
+else:
+    bp_filters = FilterBank(N_CHANNELS, fs=f_HZ, fc_hp=0.5, fc_lp=8.0, order=FILTER_ORDER)
+filters_warm = False
+
+# Beats detected on the filtered IR stream as the samples arrive
+# (indices: sample_id - 1), kept while they are in the window
+peak_detector = StreamingPeakDetector(f_HZ)
+recent_beats = []
+rr_median = RunningMedian(RR_HISTORY)
+last_rr_sample_id = 0
+hrv = HRVEngine(horizons=HRV_HORIZONS)
 
 # State Variables
 last_temp = 0.0
-last_hr = None
-hr_count = 0 
+last_die_temp = None
 last_spo2 = None
 window_id = 0 
 sample_id = 0 
 
-# Data Batching Variable
-batch_buffer = ""
+# Sample Loss Accounting (FIFO overflow / storage overrun)
+lost_samples = 0
+window_lost_samples = 0
+
+# Data Batching: lines written into a preallocated buffer, room for one
+# more block past BATCH_LINES (send timeouts)
+batch = SampleBatch(BATCH_LINES + BLOCK_SIZE)
+
+# Instrumentation: indices of the stages, values and counters
+STAGE_CHECK = const(0)       # sensor.check() / service()
+STAGE_POP = const(1)         # block out of the sensor storage
+STAGE_FILTER = const(2)
+STAGE_DETECT = const(3)      # streaming peak detector
+STAGE_WINDOW = const(4)      # windows and SpO2 sums
+STAGE_STREAM = const(5)      # sample lines into the batch
+STAGE_SEND = const(6)        # sample batch send
+STAGE_HR = const(7)
+STAGE_HRV = const(8)
+STAGE_SPO2 = const(9)
+STAGE_TEMP = const(10)       # body and die temperature
+STAGE_JSON = const(11)       # json.dumps() of the result
+STAGE_SEND_RESULT = const(12)
+STAGE_GC = const(13)
+STAGE_STATS = const(14)      # the stats packet itself
+VALUE_FIFO_DEPTH = const(0)  # samples in the FIFO when drained (lost ones included)
+VALUE_BLOCK = const(1)       # samples per block popped from the storage
+COUNTER_EMPTY_CHECKS = const(0)
+COUNTER_SEND_STALLS = const(1)
+COUNTER_RECONNECTS = const(2)
+COUNTER_STREAM_DROPPED = const(3)  # sample lines that found the batch full
+COUNTER_GC_FORCED = const(4)       # collections by the backstop, not idle
+if INSTRUMENT:
+    stats = Instrumentation(
+        ("check", "pop", "filter", "detect", "window", "stream", "send", "hr", "hrv",
+         "spo2", "temp", "json", "send_result", "gc", "stats"),
+        ("fifo_depth", "block"),
+        ("empty_checks", "send_stalls", "reconnects", "stream_dropped", "gc_forced"),
+        alloc=PROFILE_ALLOC)
+    # Cost of one record on this CPU, reported with the statistics
+    stats.calibrate()
+    last_drain_us = sensor.clock.last_us
+    stats_sample_id = 0
+
+# Last: the setup garbage is collected here
+gc_collector = IdleCollector(GC_BUDGET_BYTES, GC_BACKSTOP_BYTES)
 
 ################################################################
 # MAIN LOOP
 ################################################################
 
 while True:
-    sensor.check() 
+    if my_INT_pin is None:
+        if INSTRUMENT:
+            t = stats.start()
+        idle = not sensor.check()
+        if INSTRUMENT:
+            # Polling spins on empty checks: those are only counted
+            if idle:
+                stats.count(COUNTER_EMPTY_CHECKS)
+            else:
+                stats.lap(STAGE_CHECK, t)
+    else:
+        idle = not sensor.available()
+        if idle:
+            if INSTRUMENT:
+                t = stats.start()
+            sensor.service()
+            if INSTRUMENT:
+                stats.lap(STAGE_CHECK, t)
+    if idle:
+        # Nothing to process before the next sample: time for the GC
+        if gc_collector.due():
+            if INSTRUMENT:
+                t = stats.start()
+            gc_collector.collect()
+            if INSTRUMENT:
+                stats.lap(STAGE_GC, t)
+        if my_INT_pin is not None:
+            # Idle until the INT line schedules the next drain
+            sleep_ms(5)
+    elif gc_collector.overdue():
+        # Overloaded: no idle time for GC_BACKSTOP_BYTES
+        if INSTRUMENT:
+            stats.count(COUNTER_GC_FORCED)
+    if INSTRUMENT:
+        if sensor.clock.last_us != last_drain_us:
+            # A new FIFO burst (polling check() or interrupt drain)
+            last_drain_us = sensor.clock.last_us
+            stats.record_value(VALUE_FIFO_DEPTH, sensor.clock.last_n)
     
     while sensor.available():
-        red_sample = sensor.pop_red_from_storage()
-        ir_sample = sensor.pop_ir_from_storage()
-
-        # Filtering
-        if filters_ready and bp_filter_red and bp_filter_ir:
-            red_sample_filtered = bp_filter_red.step(red_sample * -1)
-            ir_sample_filtered  = bp_filter_ir.step(ir_sample * -1)
-        else:
-            red_sample_filtered = red_sample 
-            ir_sample_filtered  = ir_sample
-        
-        # Buffer Filling
-        raw_red_buffer.append(red_sample)
-        red_buffer.append(red_sample_filtered)
-        raw_ir_buffer.append(ir_sample)
-        ir_buffer.append(ir_sample_filtered)
-
-        sample_id += 1
-        
-        # --- FREQUENCY CALCULATION ---
-        if compute_frequency:
-            if ticks_diff(ticks_us(), t_start) >= 1000000: 
-                temp_f_HZ = samples_n
-                samples_n = 0
-                t_start = ticks_us()
-
-                if DEBUG: print("Freq:", temp_f_HZ)
-
-                if 35 <= temp_f_HZ <= 70:
-                    f_HZ = temp_f_HZ
-                
-                # Initialize filters
-                if not filters_ready and f_HZ > 0:
-                    bp_filter_ir = BandpassFilter(fs=f_HZ, fc_hp=0.5, fc_lp=8.0)
-                    bp_filter_red = BandpassFilter(fs=f_HZ, fc_hp=0.5, fc_lp=8.0)
-                    filters_ready = True
-                    if DEBUG: print("Filters INITIALIZED. Fs:", f_HZ)
-            else:
-                samples_n += 1
+        if INSTRUMENT:
+            t = stats.start()
+        n_block = sensor.pop_interleaved_from_storage(block, BLOCK_SIZE)
+        if INSTRUMENT:
+            stats.record_value(VALUE_BLOCK, n_block)
+            t = stats.lap(STAGE_POP, t)
+
+        # Samples lost before this block still took real time: skip their ids
+        lost = sensor.get_lost_ir()
+        if lost != lost_samples:
+            sample_id += lost - lost_samples
+            window_lost_samples += lost - lost_samples
+            peak_detector.skip(lost - lost_samples)
+            raw_window.skip(lost - lost_samples)
+            if DEBUG: print("Lost samples:", lost - lost_samples)
+            lost_samples = lost
+
+        # Filtering (whole block, all channels, inverted like step(x * -1))
+        if not filters_warm:
+            # Start from the DC level: the first window is already valid
+            bp_filters.warm_start(block, n_block, gain=-1)
+            filters_warm = True
+        bp_filters.process(block, filtered_block, n_block, gain=-1)
+        if INSTRUMENT:
+            t = stats.lap(STAGE_FILTER, t)
+        # IR channel of the interleaved block
+        peak_detector.process(filtered_block, n_block, 1, N_CHANNELS)
+        if INSTRUMENT:
+            t = stats.lap(STAGE_DETECT, t)
+        n_evicted = len(raw_window) + n_block - WINDOW_SIZE
+        if n_evicted > 0:
+            raw_window.oldest_into(evicted_block, n_evicted)
+            filtered_window.oldest_into(evicted_filtered_block, n_evicted)
+            spo2_accumulator.remove_block(evicted_block, evicted_filtered_block, n_evicted, N_CHANNELS)
+        spo2_accumulator.add_block(block, filtered_block, n_block, N_CHANNELS)
+        raw_window.extend(block, n_block)
+        filtered_window.extend(filtered_block, n_block)
+        if INSTRUMENT:
+            t = stats.lap(STAGE_WINDOW, t)
 
         # --- DATA BATCHING ---
-        current_line = "S, {},{:.1f},{:.1f}\n".format(
-            sample_id,
-            red_sample_filtered,
-            ir_sample_filtered,
-        )
-        
-        batch_buffer += current_line
-
-        # Send every 15 samples (Traffic Control)
-        if sample_id % 15 == 0: 
+        # "S, id,red,ir" lines of the block, sent every BATCH_LINES lines
+        n_lines = batch.add_block(filtered_block, n_block, sample_id + 1, N_CHANNELS)
+        sample_id += n_block
+        if INSTRUMENT:
+            if n_lines < n_block:
+                stats.count(COUNTER_STREAM_DROPPED, n_block - n_lines)
+            t = stats.lap(STAGE_STREAM, t)
+
+        # Traffic Control
+        if len(batch) >= BATCH_LINES:
             try:
-                client_socket.send(batch_buffer.encode("utf-8"))
-                batch_buffer = "" 
+                client_socket.send(batch.view())
+                batch.clear()
+                if INSTRUMENT:
+                    t = stats.lap(STAGE_SEND, t)
             except OSError as e:
-                # Timeout error (110)
+                # Timeout error (110): the lines wait for the next send
                 if len(e.args) > 0 and e.args[0] == 110: 
-                    pass 
+                    if INSTRUMENT:
+                        t = stats.lap(STAGE_SEND, t)
+                        stats.count(COUNTER_SEND_STALLS)
                 else:
                     if DEBUG: print("Lost connection stream...")
+                    if INSTRUMENT:
+                        stats.count(COUNTER_RECONNECTS)
                     client_socket.close()
                     client_socket = start_server() # Timeout is now set automatically here
-                    batch_buffer = ""
+                    batch.clear()
 
-        # --- CALCULATION (WINDOW FULL) ---
-        if len(red_buffer) >= BUFFER_SIZE and len(ir_buffer) >= BUFFER_SIZE:
+        # --- CALCULATION (EVERY HOP) ---
+        if raw_window.hop_ready():
             window_id += 1
-
-            # 1. Heart Rate (HR)
-            hr_result = compute_hr(ir_buffer, f_HZ)
-
-            if hr_result is None:
-                hr_count += 1
-                if hr_count >= 3:
-                    hr_rate = None
-                else:
-                    hr_rate = last_hr
-                peaks_index = []
-            else:
-                hr_rate, peaks_index = hr_result
-                
-                if last_hr is not None and hr_rate == last_hr:
-                    hr_count += 1
-                    if hr_count >= 3: 
-                        hr_rate = None
-                        peaks_index = []
-                    else:
-                        last_hr = hr_rate
+            f_HZ = sensor.get_estimated_frequency()
+            if DEBUG: print("Freq:", f_HZ)
+            fs_filter = round(f_HZ / RETUNE_STEP_HZ) * RETUNE_STEP_HZ
+            if fs_filter != bp_filters.fs:
+                # Cached coefficients, the filter state carries over
+                bp_filters.retune(fs_filter)
+                peak_detector.retune(fs_filter)
+
+            # Samples in the window, lost ones included
+            window_start_index = sample_id - len(raw_window) - raw_window.lost()
+
+            # 1. Heart Rate (HR): running median of the RR intervals, across
+            # windows (the beats in the window are reported with it)
+            while peak_detector.available():
+                beat = peak_detector.pop_beat()
+                recent_beats.append(beat)
+                rr = beat[1]
+                if rr is not None and 60.0 / HR_MAX_BPM <= rr <= 60.0 / HR_MIN_BPM:
+                    rr_median.push(rr)
+                    last_rr_sample_id = sample_id
+                    hrv.add(rr, beat[0] / f_HZ)
                 else:
-                    last_hr = hr_rate
-                    hr_count = 0
-
-            # 2. SpO2
-            spo2 = compute_spo2(ir_buffer, red_buffer, raw_ir_buffer, raw_red_buffer, min_samples=40)
+                    # Not a valid successive interval for HRV
+                    hrv.add(None, beat[0] / f_HZ)
+            while recent_beats and recent_beats[0][0] < window_start_index:
+                recent_beats.pop(0)
+            peaks_index = [beat_index - window_start_index for beat_index, rr in recent_beats]
+
+            if len(rr_median) and sample_id - last_rr_sample_id > HR_TIMEOUT_SECONDS * f_HZ:
+                rr_median.clear()
+            median_rr = rr_median.median()
+            hr_rate = None if median_rr is None else 60.0 / median_rr
+            if INSTRUMENT:
+                t = stats.lap(STAGE_HR, t)
+
+            # HRV of the RR stream (rolling horizons)
+            hrv.advance(sample_id / f_HZ)
+            hrv_metrics = {}
+            for horizon in HRV_HORIZONS:
+                hrv_metrics["{}s".format(horizon)] = hrv.metrics(horizon)
+            if INSTRUMENT:
+                t = stats.lap(STAGE_HRV, t)
+
+            # 2. SpO2 (running sums of the window, O(1))
+            spo2 = spo2_accumulator.value()
             if spo2 is None:
                 spo2 = last_spo2
             else:
                 last_spo2 = spo2
+            if INSTRUMENT:
+                t = stats.lap(STAGE_SPO2, t)
 
-            # 3. Temperature
+            # 3. Temperature (cached, the bus is only used when a
+            # conversion is due or complete)
+            temperature_age_ms = None
             if temp_sensor:
-                try:
-                    temperature_c = temp_sensor.read_temperature_c()
-                    last_temp = temperature_c
-                except OSError:
+                temperature_c = temp_sensor.read_cached()
+                if temperature_c is None:
                     temperature_c = last_temp
+                else:
+                    last_temp = temperature_c
+                    temperature_age_ms = temp_sensor.age_ms()
             else:
                 temperature_c = 0.0
 
+            # Die temperature (read when the conversion has completed)
+            die_temp = sensor.poll_temperature()
+            if die_temp is not None:
+                last_die_temp = die_temp
+                sensor.start_temperature(use_interrupt=my_INT_pin is not None)
+            if INSTRUMENT:
+                t = stats.lap(STAGE_TEMP, t)
+
             # 4. Send JSON
             result_packet = {
                 "type": "result",
                 "window_id": window_id,
                 "window_end_sample_id": sample_id,
-                "window_start_sample_id": sample_id - BUFFER_SIZE + 1,
+                "window_start_sample_id": window_start_index + 1,
                 "acq_freq": f_HZ,
+                "lost_samples": window_lost_samples,
+                "lost_samples_total": lost_samples,
                 "hr": {"value": hr_rate, "peaks_index": peaks_index}, 
+                "hrv": hrv_metrics,
                 "spo2": spo2,
-                "body_temp": temperature_c 
+                "body_temp": temperature_c,
+                "body_temp_age_ms": temperature_age_ms,
+                "die_temp": last_die_temp
             }
 
             try:
                 payload_result = json.dumps(result_packet) + "\n"
+                if INSTRUMENT:
+                    t = stats.lap(STAGE_JSON, t)
                 client_socket.send(payload_result.encode("utf-8"))
-                
-                # GC: Cleanup every 10 windows
-                if window_id % 10 == 0:
-                    gc.collect() 
-                
+                if INSTRUMENT:
+                    t = stats.lap(STAGE_SEND_RESULT, t)
+
             except OSError:
                 if DEBUG: print("Lost connection JSON...")
+                if INSTRUMENT:
+                    stats.count(COUNTER_RECONNECTS)
                 client_socket.close()
                 client_socket = start_server()
-                
-            # Clear Buffers
-            red_buffer = []
-            ir_buffer = []
-            raw_ir_buffer = []
-            raw_red_buffer = []
\ No newline at end of file
+
+            # 5. Instrumentation statistics of the last STATS_WINDOWS windows
+            if INSTRUMENT:
+                if window_id % STATS_WINDOWS == 0:
+                    stats_packet = {"type": "stats", "window_id": window_id}
+                    stats_packet.update(stats.report(sample_id - stats_sample_id))
+                    stats.reset()
+                    stats_sample_id = sample_id
+                    try:
+                        client_socket.send((json.dumps(stats_packet) + "\n").encode("utf-8"))
+                    except OSError:
+                        # The next send reconnects if the client is gone
+                        stats.count(COUNTER_SEND_STALLS)
+                    # Counted in the next period
+                    stats.lap(STAGE_STATS, t)
+
+            # The windows themselves slide on
+            window_lost_samples = 0
\ No newline at end of file